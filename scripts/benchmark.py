@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+后端组件基准测试
+
+在本地启动 InfluxDB 替身（fake_influxdb.py），对导入转换、写入、查询结果解析、
+播放节拍和历史数据接口分别计时，不需要真实的 InfluxDB。
+
+结果可以保存为基线，之后的运行与基线比较，中位耗时超过基线的 (1 + tolerance)
+倍时视为性能回退，以非零状态码退出。
+
+使用方法:
+    python scripts/benchmark.py                      # 运行全部基准测试，有基线时与基线比较
+    python scripts/benchmark.py --save-baseline      # 运行并保存为基线
+    python scripts/benchmark.py --only history_cold  # 只运行指定的基准测试
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Tuple
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(SCRIPTS_DIR), "src"))
+sys.path.insert(0, SCRIPTS_DIR)
+
+import numpy as np
+import pandas as pd
+
+from backend.app.config import INFLUXDB_BUCKET, INFLUXDB_ORG, INFLUXDB_TOKEN, TIME_COLUMN
+from backend.app.influx_client import InfluxDBManager
+from fake_influxdb import FakeInfluxDB
+
+DEFAULT_BASELINE = os.path.join(SCRIPTS_DIR, "benchmark_baseline.json")
+
+# 名称 -> (准备函数, 重复次数)；准备函数返回 (被计时的函数, 每次调用处理的条数)
+BENCHMARKS: Dict[str, Tuple[Callable, int]] = {}
+
+
+def benchmark(name: str, repeat: int = 5):
+    """注册基准测试"""
+    def register(setup):
+        BENCHMARKS[name] = (setup, repeat)
+        return setup
+    return register
+
+
+def synthetic_frame(rows: int, stations: int = 10) -> pd.DataFrame:
+    """生成与导入的 CSV 结构相同的测试数据"""
+    rng = np.random.default_rng(0)
+    start = datetime(2014, 5, 1, tzinfo=timezone.utc)
+    per_station = -(-rows // stations)
+    times = [start + timedelta(hours=i) for i in range(per_station)]
+    frame = pd.DataFrame({
+        "time": [t.strftime("%Y-%m-%d %H:%M:%S") for t in times] * stations,
+        "station_id": np.repeat([str(1001 + i) for i in range(stations)], per_station),
+        "city": "guangzhou",
+    }).iloc[:rows]
+    for field in ("pm25", "pm10", "co", "so2", "no2", "o3"):
+        values = rng.uniform(0, 300, len(frame))
+        values[rng.random(len(frame)) < 0.05] = np.nan
+        frame[field] = values
+    return frame
+
+
+def expect_written(fake: FakeInfluxDB, points: int, write: Callable) -> Callable:
+    """
+    包装写入函数：每次调用后检查替身确实收到了 points 个数据点
+
+    写入代码跳过了全部记录（例如缺少时间戳）时，被计时的只是日志输出，
+    此时直接失败，而不是记录一个没有意义的耗时。
+    """
+    def run():
+        before = fake.written_points
+        write()
+        received = fake.written_points - before
+        if received != points:
+            raise RuntimeError(f"InfluxDB 替身收到 {received} 个数据点，预期 {points} 个")
+    return run
+
+
+@benchmark("import_convert", repeat=5)
+def bench_import_convert(context):
+    from backend.app.data_importer import DataImporter
+
+    importer = DataImporter(connect=False)
+    frame = synthetic_frame(context["rows"])
+    mapping = importer.detect_columns(frame)
+    return lambda: importer.convert_to_line_protocol(frame, mapping), len(frame)
+
+
+@benchmark("write_data", repeat=3)
+def bench_write_data(context):
+    rows = min(context["rows"], 20000)
+    frame = synthetic_frame(rows)
+    frame[TIME_COLUMN] = pd.to_datetime(frame.pop("time"), utc=True)
+    records = frame.to_dict("records")
+    manager = context["manager"]
+    return expect_written(context["fake"], len(records), lambda: manager.write_data(records)), len(records)
+
+
+@benchmark("write_lines", repeat=5)
+def bench_write_lines(context):
+    from backend.app.data_importer import DataImporter
+
+    importer = DataImporter(connect=False)
+    frame = synthetic_frame(context["rows"])
+    lines = importer.convert_to_line_protocol(frame, importer.detect_columns(frame))
+    manager = context["manager"]
+    return expect_written(context["fake"], len(lines), lambda: manager.write_lines(lines)), len(lines)
+
+
+@benchmark("query_frame", repeat=5)
+def bench_query_frame(context):
+    from backend.app.playback_cache import ColumnarCache
+
+    manager = context["manager"]
+    query = manager.build_pivot_query(start_time="2014-05-01T00:00:00Z", end_time="2016-01-01T00:00:00Z", station_id="1013")
+    return lambda: ColumnarCache.from_frame(manager.query_frame(query)), context["rows"]
+
+
+@benchmark("playback_tick", repeat=5)
+def bench_playback_tick(context):
+    """
+    一个播放节拍的服务端开销：按时间截取数据段并为所有订阅者编码、入队
+
+    对应原先的 get_next_batch；每次调用播放 ticks 个节拍，订阅者分为几组不同的
+    (站点, 字段, 编码) 组合，以体现每种组合只编码一次。
+    """
+    from backend.app.frames import available_encodings
+    from backend.app.playback_cache import ColumnarCache
+    from backend.app.station_cache import StationCacheRegistry
+    from backend.app.stream_hub import StreamHub
+
+    manager = context["manager"]
+    query = manager.build_pivot_query(start_time="2014-05-01T00:00:00Z", end_time="2016-01-01T00:00:00Z", station_id="1013")
+    segment = ColumnarCache.from_frame(manager.query_frame(query))
+    stations = [str(1013 + i) for i in range(4)]
+    segments = {station_id: segment for station_id in stations}
+    start = int(segment.timestamps[0])
+    registry = StationCacheRegistry(manager, start, start + len(segment) * 3600, len(segment) * 3600)
+
+    hub = StreamHub(queue_size=1)
+    encodings = available_encodings()
+    subscribers = []
+    for i in range(context["clients"]):
+        fields = None if i % 2 else ("pm25", "aqi")
+        subscribers.append(hub.subscribe(None, encodings[i % len(encodings)], stations[:1 + i % len(stations)], fields))
+
+    ticks = min(500, len(segment))
+
+    def run():
+        for tick in range(ticks):
+            at = start + tick * 3600
+            hub.publish(registry.windows(segments, at, at + 3600))
+            for subscriber in subscribers:
+                subscriber.queue.get_nowait()
+
+    return run, ticks
+
+
+def _history_client(context):
+    import backend.app.main as main
+    from fastapi.testclient import TestClient
+
+    # 只替换接口使用的 InfluxDB 管理器；不进入 TestClient 上下文，不触发启动事件和播放任务
+    main.influx_manager = context["manager"]
+    return TestClient(main.app), main
+
+
+HISTORY_PARAMS = {"start": "2014-05-01T00:00:00Z", "end": "2016-01-01T00:00:00Z", "station_id": "1013"}
+
+
+@benchmark("history_cold", repeat=5)
+def bench_history_cold(context):
+    client, main = _history_client(context)
+
+    def run():
+        main.influx_manager.query_cache.clear()
+        response = client.get("/api/history", params=HISTORY_PARAMS)
+        response.raise_for_status()
+
+    return run, context["rows"]
+
+
+@benchmark("history_cached", repeat=20)
+def bench_history_cached(context):
+    client, _ = _history_client(context)
+    client.get("/api/history", params=HISTORY_PARAMS).raise_for_status()
+    return lambda: client.get("/api/history", params=HISTORY_PARAMS).raise_for_status(), context["rows"]
+
+
+@benchmark("history_points", repeat=5)
+def bench_history_points(context):
+    client, main = _history_client(context)
+    params = dict(HISTORY_PARAMS, points=500)
+
+    def run():
+        main.influx_manager.query_cache.clear()
+        client.get("/api/history", params=params).raise_for_status()
+
+    return run, context["rows"]
+
+
+@benchmark("history_ndjson", repeat=5)
+def bench_history_ndjson(context):
+    client, _ = _history_client(context)
+    params = dict(HISTORY_PARAMS, format="ndjson")
+    return lambda: client.get("/api/history", params=params).raise_for_status(), context["rows"]
+
+
+@benchmark("compute_aqi", repeat=10)
+def bench_compute_aqi(context):
+    from backend.app.aqi import compute_aqi
+
+    frame = synthetic_frame(context["rows"])
+    columns = {field: frame[field].to_numpy() for field in ("pm25", "pm10", "co", "so2", "no2", "o3")}
+    return lambda: compute_aqi(columns), len(frame)
+
+
+def measure(setup: Callable, repeat: int, context: dict) -> dict:
+    """运行一个基准测试：先预热一次，再计时 repeat 次"""
+    run, items = setup(context)
+    run()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    median = statistics.median(timings)
+    return {
+        "median_ms": round(median * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+        "max_ms": round(max(timings) * 1000, 3),
+        "items": items,
+        "items_per_sec": round(items / median, 1) if median > 0 else None,
+        "repeat": repeat,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """返回中位耗时超过基线 (1 + tolerance) 倍的基准测试"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        ratio = result["median_ms"] / previous["median_ms"] if previous["median_ms"] else 1.0
+        result["baseline_ms"] = previous["median_ms"]
+        result["change"] = round(ratio - 1, 3)
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def print_results(results: dict, regressions: list):
+    print(f"\n{'基准测试':<22}{'中位(ms)':>12}{'最小(ms)':>12}{'条/秒':>14}{'基线(ms)':>12}{'变化':>10}")
+    for name, result in results.items():
+        baseline = f"{result['baseline_ms']:.3f}" if "baseline_ms" in result else "-"
+        change = f"{result['change']:+.1%}" if "change" in result else "-"
+        flag = "  <-- 回退" if name in regressions else ""
+        print(f"{name:<22}{result['median_ms']:>12.3f}{result['min_ms']:>12.3f}{result['items_per_sec'] or 0:>14,.0f}{baseline:>12}{change:>10}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后端组件基准测试")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="只运行指定的基准测试")
+    parser.add_argument("--rows", type=int, default=8760, help="每个查询结果和导入测试的行数")
+    parser.add_argument("--clients", type=int, default=20, help="播放节拍测试的订阅者数")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件路径")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的中位耗时增幅，超过视为回退")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出结果")
+    args = parser.parse_args()
+
+    # 被测代码的日志（如每次写入的 info 日志）会干扰计时
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    names = args.only or list(BENCHMARKS)
+    results = {}
+    with FakeInfluxDB(rows=args.rows) as fake:
+        manager = InfluxDBManager(fake.url, INFLUXDB_TOKEN, INFLUXDB_ORG, INFLUXDB_BUCKET)
+        context = {"manager": manager, "fake": fake, "rows": args.rows, "clients": args.clients}
+        try:
+            for name in names:
+                setup, repeat = BENCHMARKS[name]
+                print(f"运行 {name}...", file=sys.stderr)
+                results[name] = measure(setup, repeat, context)
+        finally:
+            manager.close()
+
+    regressions = []
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": datetime.now(timezone.utc).isoformat(),
+                "rows": args.rows,
+                "clients": args.clients,
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 {args.baseline}", file=sys.stderr)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("rows") != args.rows or baseline.get("clients") != args.clients:
+            print(f"警告: 基线使用 rows={baseline.get('rows')} clients={baseline.get('clients')}，与本次参数不同", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+
+    if args.json:
+        print(json.dumps({"results": results, "regressions": regressions}, ensure_ascii=False, indent=2))
+    else:
+        print_results(results, regressions)
+        if regressions:
+            print(f"\n性能回退（超过基线 {args.tolerance:.0%}）: {', '.join(regressions)}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+本地 InfluxDB 替身，用于基准测试
+
+只实现基准测试用到的接口：
+    POST /api/v2/write  接收并丢弃行协议数据，返回 204
+    POST /api/v2/query  返回预先生成的 CSV 查询结果
+    GET  /ping, /health 健康检查
+
+查询语句中含 pivot 时返回透视后的结果（每个时间点一行），否则返回每个字段一张表的
+长格式结果。请求的 dialect 不带注释时（query_frame）只返回表头和数据行。
+
+使用方法:
+    python scripts/fake_influxdb.py --port 18086 --rows 8760
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from backend.app.config import FIELDS, MEASUREMENT_NAME
+
+_START = datetime(2014, 5, 1, tzinfo=timezone.utc)
+_STOP = datetime(2016, 1, 1, tzinfo=timezone.utc)
+
+
+def _format_time(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _value(field_index: int, row: int) -> float:
+    """生成确定性的测试数据"""
+    return float((row * 7 + field_index * 13) % 300) + 0.5
+
+
+def build_pivot_csv(rows: int, annotations: bool, station_id: str = "1013", city: str = "guangzhou") -> bytes:
+    """生成透视后的查询结果，每个时间点一行，字段为列"""
+    columns = ["result", "table", "_start", "_stop", "_time", "_measurement", "city", "station_id"] + FIELDS
+    lines = []
+    if annotations:
+        lines += [
+            "#datatype,string,long,dateTime:RFC3339,dateTime:RFC3339,dateTime:RFC3339,string,string,string," + ",".join(["double"] * len(FIELDS)),
+            "#group,false,false,true,true,false,true,true,true," + ",".join(["false"] * len(FIELDS)),
+            "#default,_result" + "," * (len(columns) - 1),
+        ]
+    lines.append("," + ",".join(columns))
+    start, stop = _format_time(_START), _format_time(_STOP)
+    for row in range(rows):
+        timestamp = _format_time(_START + timedelta(hours=row))
+        values = ",".join(str(_value(i, row)) for i in range(len(FIELDS)))
+        lines.append(f",,0,{start},{stop},{timestamp},{MEASUREMENT_NAME},{city},{station_id},{values}")
+    return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+
+def build_long_csv(rows: int, annotations: bool, station_id: str = "1013", city: str = "guangzhou") -> bytes:
+    """生成未透视的查询结果，每个字段一张表，rows 为每张表的行数"""
+    columns = ["result", "table", "_start", "_stop", "_time", "_value", "_field", "_measurement", "city", "station_id"]
+    lines = []
+    if annotations:
+        lines += [
+            "#datatype,string,long,dateTime:RFC3339,dateTime:RFC3339,dateTime:RFC3339,double,string,string,string,string",
+            "#group,false,false,true,true,false,false,true,true,true,true",
+            "#default,_result,,,,,,,,,",
+        ]
+    lines.append("," + ",".join(columns))
+    start, stop = _format_time(_START), _format_time(_STOP)
+    for table, field in enumerate(FIELDS):
+        for row in range(rows):
+            timestamp = _format_time(_START + timedelta(hours=row))
+            lines.append(f",,{table},{start},{stop},{timestamp},{_value(table, row)},{field},{MEASUREMENT_NAME},{city},{station_id}")
+    return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+
+class FakeInfluxDB:
+    """
+    在后台线程中运行的 InfluxDB 替身
+
+    查询结果按 (是否透视, 是否带注释) 预先生成并缓存，基准测试测到的是客户端
+    的解析开销，而不是替身生成数据的开销。
+    """
+
+    def __init__(self, port: int = 0, rows: int = 8760):
+        """
+        Args:
+            port: 监听端口，0 表示随机端口
+            rows: 每个查询结果的行数（长格式时为每个字段的行数）
+        """
+        self.rows = rows
+        self.writes = 0
+        self.written_bytes = 0
+        self.written_points = 0
+        self.queries = 0
+        self._responses = {}
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def response_for(self, query: str, annotations: bool) -> bytes:
+        pivot = "pivot(" in query
+        key = (pivot, annotations)
+        if key not in self._responses:
+            build = build_pivot_csv if pivot else build_long_csv
+            self._responses[key] = build(self.rows, annotations)
+        return self._responses[key]
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, body: bytes = b"", content_type: str = "text/plain"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def _read_body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def do_GET(self):
+                if self.path.startswith("/health"):
+                    self._reply(200, json.dumps({"status": "pass"}).encode(), "application/json")
+                else:
+                    self._reply(204)
+
+            def do_POST(self):
+                body = self._read_body()
+                if self.path.startswith("/api/v2/write"):
+                    fake.writes += 1
+                    fake.written_bytes += len(body)
+                    fake.written_points += sum(1 for line in body.splitlines() if line.strip())
+                    self._reply(204)
+                elif self.path.startswith("/api/v2/query"):
+                    fake.queries += 1
+                    request = json.loads(body or b"{}")
+                    annotations = bool((request.get("dialect") or {}).get("annotations", ["datatype", "group", "default"]))
+                    self._reply(200, fake.response_for(request.get("query", ""), annotations), "text/csv; charset=utf-8")
+                else:
+                    self._reply(404)
+
+        return Handler
+
+    def start(self) -> "FakeInfluxDB":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-influxdb", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeInfluxDB":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 InfluxDB 替身")
+    parser.add_argument("--port", type=int, default=18086)
+    parser.add_argument("--rows", type=int, default=8760, help="每个查询结果的行数")
+    args = parser.parse_args()
+
+    fake = FakeInfluxDB(args.port, args.rows)
+    print(f"Fake InfluxDB 运行在 {fake.url}")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
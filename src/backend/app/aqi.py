@@ -0,0 +1,99 @@
+from typing import Dict, Mapping
+
+import numpy as np
+
+# 空气质量分指数（IAQI）分段，HJ 633-2012 表 1
+IAQI_LEVELS = np.array([0, 50, 100, 150, 200, 300, 400, 500], dtype=np.float64)
+
+# 各污染物与 IAQI_LEVELS 对应的浓度限值，CO 为 mg/m³，其余为 µg/m³。
+# 数据为小时值：SO2、NO2、CO、O3 使用 1 小时平均限值；PM2.5、PM10 只有 24 小时平均限值。
+# SO2 的 1 小时限值只定义到 800（IAQI 200），更高的浓度沿用 24 小时平均限值。
+BREAKPOINTS: Dict[str, np.ndarray] = {
+    "so2": np.array([0, 150, 500, 650, 800, 1600, 2100, 2620], dtype=np.float64),
+    "no2": np.array([0, 100, 200, 700, 1200, 2340, 3090, 3840], dtype=np.float64),
+    "pm10": np.array([0, 50, 150, 250, 350, 420, 500, 600], dtype=np.float64),
+    "co": np.array([0, 5, 10, 35, 60, 90, 120, 150], dtype=np.float64),
+    "o3": np.array([0, 160, 200, 300, 400, 800, 1000, 1200], dtype=np.float64),
+    "pm25": np.array([0, 35, 75, 115, 150, 250, 350, 500], dtype=np.float64),
+}
+POLLUTANTS = tuple(BREAKPOINTS)
+
+# 每个分段上 IAQI = slope * C + intercept，预先算好以减少逐元素运算
+_SEGMENTS = {
+    pollutant: (
+        np.diff(IAQI_LEVELS) / np.diff(breakpoints),
+        IAQI_LEVELS[:-1] - np.diff(IAQI_LEVELS) / np.diff(breakpoints) * breakpoints[:-1],
+    )
+    for pollutant, breakpoints in BREAKPOINTS.items()
+}
+
+
+def iaqi(pollutant: str, concentrations: np.ndarray) -> np.ndarray:
+    """
+    按分段线性插值计算一种污染物的空气质量分指数
+
+    结果向上取整；超过最高浓度限值的记为 500，缺失或负值为 NaN。
+
+    Args:
+        pollutant: 污染物字段名，见 POLLUTANTS
+        concentrations: 浓度数组
+
+    Returns:
+        与 concentrations 等长的 float64 数组
+    """
+    breakpoints = BREAKPOINTS[pollutant]
+    slope, intercept = _SEGMENTS[pollutant]
+    values = np.asarray(concentrations, dtype=np.float64)
+
+    # 每个值所在分段的下标 i，满足 breakpoints[i] <= value <= breakpoints[i + 1]
+    segment = np.searchsorted(breakpoints, values, side="left")
+    np.clip(segment - 1, 0, len(breakpoints) - 2, out=segment)
+    result = slope[segment] * values
+    result += intercept[segment]
+    # 先消除浮点误差再向上取整，避免 110.00000000000001 被取整为 111
+    np.round(result, 6, out=result)
+    np.ceil(result, out=result)
+    np.minimum(result, IAQI_LEVELS[-1], out=result)
+    with np.errstate(invalid="ignore"):
+        result[~(values >= 0)] = np.nan  # 缺失值和负值，NaN 比较结果为 False
+    return result
+
+
+def compute_aqi(columns: Mapping[str, np.ndarray]) -> np.ndarray:
+    """
+    计算空气质量指数：各污染物分指数的最大值
+
+    Args:
+        columns: 字段名到浓度数组的映射，缺少的污染物不参与计算
+
+    Returns:
+        AQI 数组，所有污染物都缺失的行为 NaN
+    """
+    available = [pollutant for pollutant in POLLUTANTS if pollutant in columns]
+    if not available:
+        length = len(next(iter(columns.values()))) if columns else 0
+        return np.full(length, np.nan)
+
+    # fmax 在一方为 NaN 时返回另一方，只有全部缺失时结果才是 NaN
+    result = iaqi(available[0], columns[available[0]])
+    for pollutant in available[1:]:
+        np.fmax(result, iaqi(pollutant, columns[pollutant]), out=result)
+    return result
+
+
+def fill_aqi(columns: Mapping[str, np.ndarray], aqi: np.ndarray = None) -> np.ndarray:
+    """
+    计算 AQI，已有的有效 AQI 值优先保留
+
+    Args:
+        columns: 字段名到浓度数组的映射
+        aqi: 已有的 AQI 数组，可以为 None
+
+    Returns:
+        AQI 数组
+    """
+    computed = compute_aqi(columns)
+    if aqi is None:
+        return computed
+    aqi = np.asarray(aqi, dtype=np.float64)
+    return np.where(np.isnan(aqi), computed, aqi)
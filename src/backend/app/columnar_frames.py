@@ -0,0 +1,183 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from backend.app.config import COLUMNAR_KEY_FRAME_INTERVAL
+from backend.app.playback_cache import ColumnarCache
+
+# JSON 中可以精确表示的最大整数
+_MAX_EXACT_INT = 2 ** 53
+
+
+def _number(value: float) -> Any:
+    """整数值输出为 int，省去 JSON 中的 ".0" """
+    if value.is_integer() and abs(value) < _MAX_EXACT_INT:
+        return int(value)
+    return value
+
+
+def _constant_or_list(values: np.ndarray) -> Any:
+    """所有元素相同时只输出一个值，否则输出列表"""
+    if len(values) and (values == values[0]).all():
+        return int(values[0])
+    return values.tolist()
+
+
+def _encode_column(column: np.ndarray) -> Any:
+    """字段数组：全部相同（含全部缺失）时只输出一个值，缺失为 null"""
+    present = ~np.isnan(column)
+    if not present.any():
+        return None
+    if present.all() and (column == column[0]).all():
+        return _number(float(column[0]))
+    return [_number(value) if value == value else None for value in column.tolist()]
+
+
+class ColumnarRows(NamedTuple):
+    """一个节拍内订阅站点的全部记录，按时间排序后按列存放"""
+    timestamps: np.ndarray
+    station_index: np.ndarray
+    columns: Dict[str, np.ndarray]
+
+
+def gather_rows(
+    windows: Dict[str, ColumnarCache],
+    stations: Sequence[str],
+    fields: Optional[Sequence[str]] = None,
+) -> Optional[ColumnarRows]:
+    """
+    合并订阅站点在本节拍内的数据，记录按时间排序，与 records 格式的记录顺序一致
+
+    Args:
+        windows: 站点ID到本节拍数据视图的映射
+        stations: 订阅的站点（有序），station_index 为站点在其中的下标
+        fields: 只取这些字段，None 表示全部字段
+
+    Returns:
+        合并后的记录，订阅的站点在本节拍都没有数据时返回 None
+    """
+    parts = [(index, windows[station_id]) for index, station_id in enumerate(stations)
+             if station_id in windows and len(windows[station_id])]
+    if not parts:
+        return None
+
+    timestamps = np.concatenate([window.timestamps for _, window in parts])
+    station_index = np.concatenate([np.full(len(window), index, dtype=np.int32) for index, window in parts])
+    order = np.argsort(timestamps, kind="stable") if len(parts) > 1 else None
+    if order is not None:
+        timestamps, station_index = timestamps[order], station_index[order]
+
+    columns = {}
+    for field in (fields if fields is not None else parts[0][1].fields):
+        if field not in parts[0][1].columns:
+            continue
+        column = np.concatenate([window.columns[field] for _, window in parts])
+        columns[field] = column[order] if order is not None else column
+    return ColumnarRows(timestamps, station_index, columns)
+
+
+def build_columnar_batch(rows: ColumnarRows, fields: Optional[List[str]] = None, key: bool = True) -> Dict[str, Any]:
+    """
+    把合并后的记录组织为列式批次
+
+    站点ID和城市不随每条记录重复，只在订阅确认消息中发送一次，帧中以站点在
+    订阅列表中的下标表示；时间戳为起始时间加相邻记录的差值；每个字段一个数组，
+    批次内取值不变的字段只输出一个值。格式为:
+
+        {
+            "type": "columns",
+            "k": 1,  # 只在关键帧中出现
+            "n": 记录数，为 1 时省略,
+            "t0": 第一条记录的 Unix 秒,
+            "dt": 相邻记录的秒数差（n - 1 个），全部相同时为一个整数，n 为 1 时省略,
+            "s": 每条记录的站点下标，全部相同时为一个整数，全部为 0 时省略,
+            "f": {字段: 长度为 n 的数组（缺失为 null）或单个值}
+        }
+
+    关键帧包含全部有值的字段，整个批次都缺失的字段不输出。差分帧只包含 fields
+    中的字段，未出现的字段表示各站点的取值与上一帧相同，由客户端沿用。
+
+    Args:
+        rows: gather_rows 的结果
+        fields: 差分帧中输出的字段，None 表示全部字段
+        key: 是否为关键帧
+    """
+    timestamps = rows.timestamps
+    batch: Dict[str, Any] = {"type": "columns"}
+    if key:
+        batch["k"] = 1
+    if len(timestamps) > 1:
+        batch["n"] = len(timestamps)
+    batch["t0"] = int(timestamps[0])
+    if len(timestamps) > 1:
+        batch["dt"] = _constant_or_list(np.diff(timestamps))
+    stations = _constant_or_list(rows.station_index)
+    if stations != 0:
+        batch["s"] = stations
+
+    values: Dict[str, Any] = {}
+    for field, column in rows.columns.items():
+        if fields is not None and field not in fields:
+            continue
+        encoded = _encode_column(column)
+        if encoded is None and key:
+            continue
+        values[field] = encoded
+    batch["f"] = values
+    return batch
+
+
+class ColumnarFrames(NamedTuple):
+    """同一个节拍的关键帧和差分帧（差分帧到达关键帧周期时就是关键帧）"""
+    key: Dict[str, Any]
+    delta: Dict[str, Any]
+
+
+class ColumnarEncoder:
+    """
+    一个订阅分组（播放会话、站点、字段）的跨帧差分状态
+
+    保存每个站点每个字段在上一帧结束时的值。差分帧只发送与上一帧相比有变化的
+    字段，客户端沿用其余字段；新加入、修改订阅或丢过帧的客户端改为接收同一节拍
+    的关键帧，每隔 key_frame_interval 帧所有客户端都收到关键帧，以便重新同步。
+    """
+
+    def __init__(self, key_frame_interval: int = COLUMNAR_KEY_FRAME_INTERVAL):
+        self.key_frame_interval = key_frame_interval
+        self.frames = 0
+        # 站点下标 -> 字段 -> 上一帧结束时的值（NaN 表示缺失）
+        self._last: Dict[int, Dict[str, float]] = {}
+
+    def encode(self, rows: ColumnarRows) -> ColumnarFrames:
+        """生成本节拍的关键帧和差分帧，并更新差分状态"""
+        key = build_columnar_batch(rows)
+        if self.frames % self.key_frame_interval == 0:
+            delta = key
+        else:
+            delta = build_columnar_batch(rows, self._changed_fields(rows), key=False)
+        self.frames += 1
+        self._remember(rows)
+        return ColumnarFrames(key, delta)
+
+    def _changed_fields(self, rows: ColumnarRows) -> List[str]:
+        """与上一帧相比有任意一条记录取值变化的字段"""
+        changed = []
+        stations = np.unique(rows.station_index).tolist()
+        masks = {index: rows.station_index == index for index in stations}
+        for field, column in rows.columns.items():
+            for index in stations:
+                previous = self._last.get(index, {}).get(field)
+                values = column[masks[index]]
+                if previous is None:
+                    changed.append(field)
+                    break
+                sequence = np.concatenate(([previous], values))
+                if not np.array_equal(sequence[1:], sequence[:-1], equal_nan=True):
+                    changed.append(field)
+                    break
+        return changed
+
+    def _remember(self, rows: ColumnarRows):
+        for index in np.unique(rows.station_index).tolist():
+            last_row = int(np.flatnonzero(rows.station_index == index)[-1])
+            self._last[index] = {field: float(column[last_row]) for field, column in rows.columns.items()}
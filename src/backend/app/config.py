@@ -12,21 +12,73 @@ INFLUXDB_URL = "http://localhost:8086"
 INFLUXDB_TOKEN = "super-secret-token-for-air-quality-platform"
 INFLUXDB_ORG = "air-quality-org"
 INFLUXDB_BUCKET = "air_quality_hourly"
+QUERY_WORKERS = 4  # 异步查询线程池大小（同时也是HTTP连接池大小）
+QUERY_TIMEOUT = 30  # 单次查询超时时间（秒）
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 查询结果缓存的内存预算（字节）
+QUERY_CACHE_TTL = 30  # 结束于 now() 或相对时间的查询结果缓存秒数
+QUERY_CACHE_MAX_AGE = 600  # 历史范围查询结果的最长缓存秒数；写入时的失效只覆盖本进程的写入，init_data.py 等其他进程的导入要靠过期或 POST /admin/cache/clear
+
+# 历史数据降采样配置
+DATA_INTERVAL_SECONDS = 3600  # 原始数据的采样间隔（秒）
+LTTB_OVERSAMPLE = 4  # 按点数降采样时，先在InfluxDB中聚合到目标点数的倍数再做LTTB
+USE_ROLLUPS = False  # 聚合查询是否自动改为读取日/月汇总表；汇总表为空时查询结果也为空，应先运行 init_data.py --rollups-only 再开启
+ROLLUP_WINDOWS = ["1mo", "1d"]  # 导入时维护的汇总窗口，从粗到细排列
+ROLLUP_STATS = ["mean", "min", "max", "count"]  # 每个汇总窗口保存的统计量，存为 stat 标签
+ROLLUP_TAGS = ["station_id", "city"]  # 汇总表保留的标签
+STREAM_CHUNK_BYTES = 64 * 1024  # 流式导出历史数据时每次写出的字节数
 
 # FastAPI 配置
 HOST = "0.0.0.0"
 PORT = 8000
 DEBUG = True
 
+# 前端静态文件配置（启动时加载到内存并预先压缩）
+STATIC_GZIP_LEVEL = 9  # gzip 压缩级别，只在启动时压缩一次
+STATIC_BROTLI_QUALITY = 11  # brotli 压缩级别（需安装 brotli）
+STATIC_MIN_COMPRESS_BYTES = 1024  # 小于该字节数的文件不压缩
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # 带内容摘要的静态文件地址的浏览器缓存秒数
+
 # WebSocket 推流配置
 ACCELERATION_FACTOR = 0.5  # 播放加速因子，数值越小越快
 BATCH_SIZE = 1  # 每次推送的数据条数
+CLIENT_QUEUE_SIZE = 32  # 每个客户端发送队列可积压的批次数
+SLOW_CLIENT_POLICY = "drop_oldest"  # 慢客户端策略: "drop_oldest" 丢弃积压的数据帧（保留控制消息）, "disconnect" 断开连接
+MAX_FPS = 30  # 每个播放会话每秒最多推送的帧数，播放速度超过时多个批次合并为一帧
+PLAYBACK_MAX_LAG = 1.0  # 播放落后计划超过该秒数时重新对齐时钟，而不是集中补发
+COLUMNAR_KEY_FRAME_INTERVAL = 300  # columnar 帧格式每隔多少帧向所有客户端发送一次完整的关键帧
+
+# 播放范围配置
+PLAYBACK_START = "2014-05-01T00:00:00Z"  # 播放开始时间
+PLAYBACK_END = "2016-01-01T00:00:00Z"  # 播放结束时间，到达后从头循环
+PLAYBACK_WINDOW_SECONDS = 7 * 24 * 3600  # 每个数据段覆盖的时间窗口（秒），按窗口分段加载
+PLAYBACK_PREFETCH_WINDOWS = 1  # 播放当前窗口时在后台预取的后续窗口数
+PLAYBACK_ROW_LIMIT = 2000  # 每个站点每个窗口最多加载的行数
+DEFAULT_STATION_ID = "1013"  # 未发送订阅消息的客户端默认订阅的站点
+MAX_STATIONS_PER_CLIENT = 50  # 单个客户端最多可订阅的站点数
+STATION_ID_PATTERN = r"^[A-Za-z0-9_.-]{1,32}$"  # 客户端传入的站点ID必须匹配的格式
+MAX_SESSIONS = 200  # 同时存在的播放会话数上限（含默认会话）
 
 # 数据字段配置
 MEASUREMENT_NAME = "air_quality"
 TAGS = ["station_id", "city", "station_name"]
-FIELDS = ["pm25", "pm10", "co", "so2", "no2", "o3", "weather", "temperature", "humidity", "pressure", "wind_speed", "wind_direction"]
+FIELDS = ["pm25", "pm10", "co", "so2", "no2", "o3", "aqi", "weather", "temperature", "humidity", "pressure", "wind_speed", "wind_direction"]
 TIME_COLUMN = "timestamp"
 
+# 数据导入配置
+WRITE_BATCH_SIZE = 5000  # 每次写入请求包含的行数
+IMPORT_CHUNK_SIZE = 50000  # 流式读取CSV时每块的行数
+IMPORT_WORKERS = 1  # 目录导入时的并行解析进程数，1 表示串行
+IMPORT_PENDING_CHUNKS_PER_WORKER = 2  # 并行导入时每个工作进程可积压的待写入数据块数
+
+# 监控指标配置
+METRICS_LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]  # 耗时直方图的分桶上界（秒）
+INFLUXDB_PING_TIMEOUT = 2  # /api/status 和 /metrics 检查InfluxDB连接的超时时间（秒），也是该HTTP请求本身的超时
+INFLUXDB_PING_CACHE_SECONDS = 5  # 连接检查结果的复用秒数，期间的 /api/status 和 /metrics 不再重复检查
+LOOP_MONITOR_INTERVAL = 0.1  # 事件循环心跳间隔（秒），用于测量调度延迟
+LOOP_BLOCK_THRESHOLD = 0.25  # 事件循环被阻塞超过该秒数时记录阻塞处的调用栈
+PROFILE_MAX_SECONDS = 60  # /admin/profile 单次采样的最长秒数
+PROFILE_MAX_DEPTH = 64  # 采样时每个调用栈最多保留的层数
+ADMIN_TOKEN = None  # /admin/* 要求请求头 X-Admin-Token 与之一致；未设置时管理接口禁用（反向代理后所有请求都来自本机，不能按来源地址放行）
+
 # 日志配置
 LOG_LEVEL = "INFO"
\ No newline at end of file
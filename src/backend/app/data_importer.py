@@ -1,24 +1,91 @@
 import pandas as pd
+import numpy as np
 import os
+import queue
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import logging
-from typing import Dict, Any, List
+from typing import Dict, List
+from backend.app.aqi import POLLUTANTS, fill_aqi
 from backend.app.influx_client import InfluxDBManager
-from backend.app.config import INFLUXDB_URL, INFLUXDB_TOKEN, INFLUXDB_ORG, INFLUXDB_BUCKET, MEASUREMENT_NAME, TAGS, FIELDS, PROJECT_DIR
+from backend.app.metrics import IMPORT_ROWS, IMPORT_ROWS_PER_SECOND
+from backend.app.config import INFLUXDB_URL, INFLUXDB_TOKEN, INFLUXDB_ORG, INFLUXDB_BUCKET, MEASUREMENT_NAME, TAGS, FIELDS, PROJECT_DIR, IMPORT_CHUNK_SIZE, IMPORT_WORKERS, IMPORT_PENDING_CHUNKS_PER_WORKER
+
+# 标签缺失时使用的默认值
+TAG_DEFAULTS = {
+    'station_id': 'default_station',
+    'city': 'default_city'
+}
+
+# 行协议转义规则，与 influxdb_client.Point 保持一致
+_ESCAPE_MEASUREMENT = str.maketrans({',': r'\,', ' ': r'\ ', '\n': r'\n', '\t': r'\t', '\r': r'\r'})
+_ESCAPE_KEY = str.maketrans({',': r'\,', '=': r'\=', ' ': r'\ ', '\n': r'\n', '\t': r'\t', '\r': r'\r'})
+
+
+def _format_field(field: str, values: np.ndarray, present: np.ndarray) -> np.ndarray:
+    """
+    将一列浮点数格式化为 ",field=value" 片段，缺失值为空字符串
+
+    整数值不带 ".0" 后缀，与 influxdb_client.Point 的输出一致。
+    """
+    out = np.full(len(values), '', dtype=object)
+    integral = present & (np.floor(values) == values) & (np.abs(values) < 2 ** 53)
+    fractional = present & ~integral
+    key = f',{field}='
+    out[integral] = key + values[integral].astype(np.int64).astype(str).astype(object)
+    out[fractional] = key + values[fractional].astype(str).astype(object)
+    return out
+
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _convert_file_worker(file_path: str, measurement_name: str, chunksize: int, out_queue) -> int:
+    """
+    并行导入的工作进程：解析、清洗并转换单个文件，把行协议数据块放入有界队列
+
+    队列满时 put 会阻塞，从而在写入跟不上时限制已解析但未写入的数据量。
+    无论成功与否，最后都会放入 (file_path, None) 作为该文件的结束标记。
+
+    Returns:
+        转换得到的记录数
+    """
+    importer = DataImporter(connect=False)
+    total = 0
+    try:
+        column_mapping = importer.read_column_mapping(file_path)
+        if not column_mapping.get('time'):
+            logger.warning(f"未检测到有效的时间列，跳过文件: {file_path}")
+            return 0
+        for lines in importer.iter_line_protocol_chunks(file_path, column_mapping, measurement_name, chunksize):
+            if lines:
+                out_queue.put((file_path, lines))
+                total += len(lines)
+        return total
+    finally:
+        out_queue.put((file_path, None))
+
+
 class DataImporter:
-    def __init__(self):
-        self.influx_manager = InfluxDBManager(
-            influx_url=INFLUXDB_URL,
-            influx_token=INFLUXDB_TOKEN,
-            influx_org=INFLUXDB_ORG,
-            influx_bucket=INFLUXDB_BUCKET
-        )
+    def __init__(self, connect: bool = True):
+        """
+        Args:
+            connect: 是否创建InfluxDB连接；并行导入的工作进程只做转换，不需要连接
+        """
+        self.influx_manager = None
+        if connect:
+            self.influx_manager = InfluxDBManager(
+                influx_url=INFLUXDB_URL,
+                influx_token=INFLUXDB_TOKEN,
+                influx_org=INFLUXDB_ORG,
+                influx_bucket=INFLUXDB_BUCKET
+            )
+        # 本次导入写入数据的时间范围，导入结束后据此更新汇总表
+        self._written_range = None
 
     def clean_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -107,126 +174,304 @@ class DataImporter:
 
         return column_mapping
 
-    def convert_to_standard_format(self, df: pd.DataFrame, column_mapping: Dict[str, str]) -> List[Dict[str, Any]]:
+    def convert_to_line_protocol(self, df: pd.DataFrame, column_mapping: Dict[str, str], measurement_name: str = None) -> List[str]:
         """
-        将DataFrame转换为标准格式
+        将DataFrame按列向量化转换为InfluxDB行协议
+
+        标签缺失时使用默认值，NaN 字段不写入，没有任何字段的行被跳过。aqi 字段
+        由各污染物浓度批量计算，源数据中已有的有效 AQI 值优先保留。
 
         Args:
             df: DataFrame
             column_mapping: 列名映射
+            measurement_name: 测量名称
 
         Returns:
-            标准格式的数据列表
+            行协议字符串列表
         """
-        records = []
-
-        for _, row in df.iterrows():
-            record = {}
-
-            # 处理时间戳
-            time_col = column_mapping.get('time')
-            if time_col and pd.notna(row[time_col]):
-                record['timestamp'] = row[time_col]
+        time_col = column_mapping.get('time')
+        if not time_col or df.empty:
+            return []
+
+        # 处理时间戳，统一转换为UTC纳秒
+        times = df[time_col]
+        if not pd.api.types.is_datetime64_any_dtype(times):
+            times = pd.to_datetime(times, errors='coerce')
+        if times.dt.tz is not None:
+            times = times.dt.tz_convert('UTC').dt.tz_localize(None)
+        valid = times.notna()
+
+        # 处理标签（按键名排序，与 Point 的输出一致）
+        measurement = (measurement_name or MEASUREMENT_NAME).translate(_ESCAPE_MEASUREMENT)
+        prefix = pd.Series(measurement, index=df.index, dtype=object)
+        for tag, default in sorted(TAG_DEFAULTS.items()):
+            col = column_mapping.get(tag)
+            if col:
+                values = df[col].astype(str).where(df[col].notna(), default)
             else:
+                values = pd.Series(default, index=df.index, dtype=object)
+            # 标签取值很少，只对去重后的值做转义
+            codes, uniques = pd.factorize(values)
+            escaped = np.array([f',{tag}={value.translate(_ESCAPE_KEY)}' for value in uniques], dtype=object)
+            prefix = prefix + escaped[codes]
+
+        # 处理字段，NaN 和无穷值不写入
+        columns = {
+            field: pd.to_numeric(df[column_mapping[field]], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+            for field in FIELDS
+            if column_mapping.get(field)
+        }
+        if 'aqi' in FIELDS and any(pollutant in columns for pollutant in POLLUTANTS):
+            columns['aqi'] = fill_aqi(columns, columns.get('aqi'))
+
+        field_set = pd.Series('', index=df.index, dtype=object)
+        for field in sorted(columns):
+            values = columns[field]
+            present = np.isfinite(values)
+            if not present.any():
                 continue
+            field_set = field_set + _format_field(field, values, present)
+        valid &= field_set != ''
+
+        if not valid.any():
+            return []
 
-            # 处理标签
-            for tag in ['station_id', 'city']:
-                col = column_mapping.get(tag)
-                if col and pd.notna(row[col]):
-                    record[tag] = str(row[col])
-                else:
-                    # 设置默认值
-                    if tag == 'station_id':
-                        record[tag] = 'default_station'
-                    elif tag == 'city':
-                        record[tag] = 'default_city'
-
-            # 处理字段
-            for field in FIELDS:
-                col = column_mapping.get(field)
-                if col and pd.notna(row[col]):
-                    record[field] = float(row[col])
-                else:
-                    record[field] = None
-
-            records.append(record)
-
-        return records
-
-    def import_csv(self, file_path: str, measurement_name: str = None):
+        nanoseconds = times[valid].astype('datetime64[ns]').astype('int64').astype(str)
+        lines = prefix[valid] + ' ' + field_set[valid].str[1:] + ' ' + nanoseconds
+        return lines.tolist()
+
+    def read_column_mapping(self, file_path: str) -> Dict[str, str]:
         """
-        导入CSV文件到InfluxDB
+        只读取CSV表头并检测列映射
+
+        Args:
+            file_path: CSV文件路径
+
+        Returns:
+            列名映射字典
+        """
+        header = pd.read_csv(file_path, nrows=0)
+        logger.info(f"列名: {list(header.columns)}")
+        return self.detect_columns(header)
+
+    def iter_line_protocol_chunks(self, file_path: str, column_mapping: Dict[str, str], measurement_name: str = None, chunksize: int = IMPORT_CHUNK_SIZE):
+        """
+        按固定行数分块读取CSV，逐块清洗并转换为行协议
+
+        只读取映射到的列；标签列按字符串读取，保证各块之间的标签值一致。
 
         Args:
             file_path: CSV文件路径
+            column_mapping: 列名映射，由 read_column_mapping 得到
             measurement_name: 测量名称
+            chunksize: 每块的行数
+
+        Yields:
+            每块对应的行协议字符串列表
         """
+        tag_columns = [column_mapping[tag] for tag in TAG_DEFAULTS if tag in column_mapping]
+        reader = pd.read_csv(
+            file_path,
+            usecols=sorted(set(column_mapping.values())),
+            dtype={col: str for col in tag_columns},
+            chunksize=chunksize
+        )
+        with reader:
+            for chunk in reader:
+                chunk = self.clean_dataframe(chunk)
+                yield self.convert_to_line_protocol(chunk, column_mapping, measurement_name)
+
+    def _write_lines(self, lines: List[str], measurement_name: str = None):
+        """写入行协议数据并记录写入的时间范围"""
+        time_range = self.influx_manager.write_lines(lines)
+        IMPORT_ROWS.labels(measurement_name or MEASUREMENT_NAME).inc(len(lines))
+        if time_range is None:
+            return
+        if self._written_range is None:
+            self._written_range = time_range
+        else:
+            self._written_range = (min(self._written_range[0], time_range[0]), max(self._written_range[1], time_range[1]))
+
+    def update_rollups(self, measurement_name: str = None):
+        """根据本次导入写入的时间范围重新计算日、月汇总表"""
+        if self._written_range is None:
+            return
+        start, stop = self._written_range
+        self._written_range = None
         try:
-            logger.info(f"开始导入文件: {file_path}")
+            started = time.perf_counter()
+            self.influx_manager.build_rollups(start, stop, measurement_name)
+            logger.info(f"汇总表更新完成，耗时 {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"更新汇总表失败: {e}")
+
+    def import_csv(self, file_path: str, measurement_name: str = None, chunksize: int = IMPORT_CHUNK_SIZE, update_rollups: bool = True):
+        """
+        以流式方式导入CSV文件到InfluxDB
 
-            # 读取CSV
-            df = pd.read_csv(file_path)
-            logger.info(f"读取到 {len(df)} 行数据")
-            logger.info(f"列名: {list(df.columns)}")
+        列检测只在表头上执行一次，之后每读取一块就清洗、转换并写入，
+        写完再读下一块，内存占用只与 chunksize 有关，与文件大小无关。
 
-            # 清洗数据
-            df = self.clean_dataframe(df)
-            logger.info(f"清洗后剩余 {len(df)} 行数据")
+        Args:
+            file_path: CSV文件路径
+            measurement_name: 测量名称
+            chunksize: 每块的行数
+            update_rollups: 导入完成后是否更新汇总表
+
+        Returns:
+            写入的记录数
+        """
+        try:
+            logger.info(f"开始导入文件: {file_path}")
+            started = time.perf_counter()
 
             # 检测列
-            column_mapping = self.detect_columns(df)
+            column_mapping = self.read_column_mapping(file_path)
             logger.info(f"检测到的列映射: {column_mapping}")
 
             # 检查是否有有效的时间列
             time_col = column_mapping.get('time')
             if not time_col:
                 logger.warning(f"未检测到有效的时间列，跳过文件: {file_path}")
-                return
+                return 0
 
-            # 转换格式
-            records = self.convert_to_standard_format(df, column_mapping)
-            logger.info(f"转换为标准格式: {len(records)} 条记录")
+            # 逐块转换并写入InfluxDB
+            total = 0
+            for lines in self.iter_line_protocol_chunks(file_path, column_mapping, measurement_name, chunksize):
+                if lines:
+                    self._write_lines(lines, measurement_name)
+                    total += len(lines)
+                    logger.debug(f"已写入 {total} 条记录")
 
             # 检查是否有有效记录
-            if not records:
+            if not total:
                 logger.warning(f"没有有效记录，跳过文件: {file_path}")
-                return
-
-            # 写入InfluxDB
-            self.influx_manager.write_data(records, measurement_name)
-
-            logger.info(f"成功导入 {len(records)} 条记录到 {measurement_name}")
+                return 0
+
+            elapsed = time.perf_counter() - started
+            rate = total / max(elapsed, 1e-9)
+            IMPORT_ROWS_PER_SECOND.labels(measurement_name or MEASUREMENT_NAME).set(rate)
+            logger.info(
+                f"成功导入 {total} 条记录到 {measurement_name}，"
+                f"耗时 {elapsed:.2f}s，{rate:.0f} 行/秒"
+            )
+            if update_rollups:
+                self.update_rollups(measurement_name)
+            return total
 
         except Exception as e:
             logger.error(f"导入失败: {e}")
             raise
 
-    def import_directory(self, directory_path: str, measurement_name: str = None):
+    def import_directory(self, directory_path: str, measurement_name: str = None, workers: int = IMPORT_WORKERS, chunksize: int = IMPORT_CHUNK_SIZE):
         """
         导入目录中的所有CSV文件
 
+        workers 大于 1 时使用进程池并行解析、清洗和转换文件，
+        由当前进程作为唯一的写入方把结果写入InfluxDB。所有文件导入后
+        统一更新一次汇总表。
+
         Args:
             directory_path: 目录路径
             measurement_name: 测量名称
+            workers: 并行解析的工作进程数
+            chunksize: 每块的行数
+
+        Returns:
+            写入的记录总数
         """
         csv_files = []
-        for file in os.listdir(directory_path):
+        for file in sorted(os.listdir(directory_path)):
             if file.endswith('.csv'):
                 csv_files.append(os.path.join(directory_path, file))
 
         logger.info(f"找到 {len(csv_files)} 个CSV文件")
+        started = time.perf_counter()
 
-        for csv_file in csv_files:
-            try:
-                self.import_csv(csv_file, measurement_name)
-            except Exception as e:
-                logger.error(f"导入文件 {csv_file} 失败: {e}")
-                continue
+        if workers > 1 and len(csv_files) > 1:
+            total = self._import_files_parallel(csv_files, measurement_name, workers, chunksize)
+        else:
+            total = 0
+            for index, csv_file in enumerate(csv_files, 1):
+                try:
+                    total += self.import_csv(csv_file, measurement_name, chunksize, update_rollups=False)
+                except Exception as e:
+                    logger.error(f"导入文件 {csv_file} 失败: {e}")
+                    continue
+                logger.info(f"进度: {index}/{len(csv_files)} 个文件")
+
+        elapsed = time.perf_counter() - started
+        rate = total / max(elapsed, 1e-9)
+        IMPORT_ROWS_PER_SECOND.labels(measurement_name or MEASUREMENT_NAME).set(rate)
+        logger.info(
+            f"目录导入完成: {len(csv_files)} 个文件，共 {total} 条记录，"
+            f"耗时 {elapsed:.2f}s，{rate:.0f} 行/秒"
+        )
+        self.update_rollups(measurement_name)
+        return total
+
+    def _import_files_parallel(self, csv_files: List[str], measurement_name: str, workers: int, chunksize: int) -> int:
+        """
+        用进程池并行转换多个文件，并在当前进程中串行写入
+
+        工作进程与写入方之间通过有界队列传递数据块，写入变慢时工作进程会阻塞，
+        内存中最多只有 workers * IMPORT_PENDING_CHUNKS_PER_WORKER 个待写入的数据块。
+
+        Returns:
+            写入的记录总数
+        """
+        logger.info(f"使用 {workers} 个工作进程并行导入")
+        total = 0
+        file_rows = {path: 0 for path in csv_files}
+        file_started = {}
+        finished = 0
+
+        with multiprocessing.Manager() as manager:
+            chunk_queue = manager.Queue(maxsize=workers * IMPORT_PENDING_CHUNKS_PER_WORKER)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(_convert_file_worker, path, measurement_name, chunksize, chunk_queue): path
+                    for path in csv_files
+                }
+
+                while finished < len(csv_files):
+                    try:
+                        file_path, lines = chunk_queue.get(timeout=1)
+                    except queue.Empty:
+                        # 工作进程异常退出时不会再有结束标记
+                        if all(future.done() for future in futures):
+                            break
+                        continue
+
+                    file_started.setdefault(file_path, time.perf_counter())
+                    if lines is None:
+                        finished += 1
+                        rows = file_rows[file_path]
+                        elapsed = time.perf_counter() - file_started[file_path]
+                        logger.info(
+                            f"进度: {finished}/{len(csv_files)} 个文件，{file_path} 写入 {rows} 条记录，"
+                            f"耗时 {elapsed:.2f}s，{rows / max(elapsed, 1e-9):.0f} 行/秒"
+                        )
+                        continue
+
+                    try:
+                        self._write_lines(lines, measurement_name)
+                    except Exception as e:
+                        logger.error(f"写入文件 {file_path} 的数据块失败: {e}")
+                        continue
+                    file_rows[file_path] += len(lines)
+                    total += len(lines)
+
+                for future, path in futures.items():
+                    if future.exception() is not None:
+                        logger.error(f"导入文件 {path} 失败: {future.exception()}")
+
+        return total
 
     def close(self):
         """关闭连接"""
-        self.influx_manager.close()
+        if self.influx_manager:
+            self.influx_manager.close()
 
 
 def main():
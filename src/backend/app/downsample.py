@@ -0,0 +1,116 @@
+import copy
+import math
+from datetime import timedelta
+from typing import Optional
+
+import numpy as np
+
+from backend.app.config import DATA_INTERVAL_SECONDS, LTTB_OVERSAMPLE
+
+# aggregateWindow 支持的聚合函数
+AGGREGATE_FUNCTIONS = ("mean", "min", "max")
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留点的下标
+
+    保留首尾两点，中间每个桶选出与前一个已选点、下一个桶均值构成的三角形
+    面积最大的点，能较好地保留曲线的峰谷形状。
+
+    Args:
+        x: 按升序排列的横坐标
+        y: 纵坐标，不能包含 NaN
+        threshold: 目标点数
+
+    Returns:
+        保留点的下标数组
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+
+    for i in range(threshold - 2):
+        # 下一个桶的平均点
+        next_start = int(math.floor((i + 1) * every)) + 1
+        next_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # 当前桶中三角形面积最大的点
+        start = int(math.floor(i * every)) + 1
+        end = int(math.floor((i + 1) * every)) + 1
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+
+    selected[-1] = n - 1
+    return selected
+
+
+def window_for_points(span: Optional[timedelta], points: int) -> Optional[str]:
+    """
+    根据查询范围和点数预算计算下推给 InfluxDB 的聚合窗口
+
+    预先聚合到点数预算的 LTTB_OVERSAMPLE 倍，再由 LTTB 精选，
+    窗口不小于原始数据的采样间隔时返回 None，表示无需聚合。
+    一天以上的窗口取整到整天，使查询可以改读日汇总表。
+
+    Returns:
+        Flux 时长字符串，如 "21600s"、"3d"
+    """
+    if span is None or points <= 0:
+        return None
+    seconds = int(span.total_seconds() // (points * LTTB_OVERSAMPLE))
+    if seconds <= DATA_INTERVAL_SECONDS:
+        return None
+    if seconds >= 86400:
+        return f"{seconds // 86400}d"
+    return f"{seconds}s"
+
+
+def decimate_tables(result, field: str, points: int):
+    """
+    对透视后的查询结果按字段做 LTTB 降采样，每张表（每个序列）分别处理
+
+    不修改传入的结果（它可能来自查询缓存），返回浅拷贝的表。
+    缺少该字段的行不参与选择。
+
+    Args:
+        result: 透视后的 FluxTable 列表
+        field: 用于选择保留点的字段
+        points: 每个序列的目标点数
+
+    Returns:
+        降采样后的 FluxTable 列表
+    """
+    decimated = []
+    for table in result:
+        records = table.records
+        if len(records) <= points:
+            decimated.append(table)
+            continue
+
+        times = np.fromiter((record.get_time().timestamp() for record in records), dtype=np.float64, count=len(records))
+        values = np.fromiter(
+            (np.nan if record.values.get(field) is None else record.values.get(field) for record in records),
+            dtype=np.float64,
+            count=len(records),
+        )
+        present = np.flatnonzero(~np.isnan(values))
+        keep = present[lttb_indices(times[present], values[present], points)]
+
+        table_copy = copy.copy(table)
+        table_copy.records = [records[i] for i in keep]
+        decimated.append(table_copy)
+    return decimated
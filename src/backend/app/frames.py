@@ -0,0 +1,56 @@
+import json
+from typing import Any, NamedTuple, Union
+
+try:
+    import msgpack
+except ImportError:  # msgpack 为可选依赖，仅二进制编码需要
+    msgpack = None
+
+# 数据流帧编码
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+SUPPORTED_ENCODINGS = (ENCODING_JSON, ENCODING_MSGPACK)
+
+# 数据流帧格式: records 为每条记录一个对象的数组；columnar 为按列组织、时间差分的紧凑格式
+FORMAT_RECORDS = "records"
+FORMAT_COLUMNAR = "columnar"
+SUPPORTED_FORMATS = (FORMAT_RECORDS, FORMAT_COLUMNAR)
+
+
+class Frame(NamedTuple):
+    """
+    编码完成的不可变数据帧，同一帧被所有相同编码的订阅者复用
+
+    control 为 True 表示控制消息（订阅确认、会话状态等），客户端积压时不会被丢弃。
+    """
+    payload: Union[str, bytes]
+    binary: bool
+    control: bool = False
+
+
+def available_encodings() -> tuple:
+    """返回当前环境可用的编码方式"""
+    if msgpack is None:
+        return (ENCODING_JSON,)
+    return SUPPORTED_ENCODINGS
+
+
+def encode_frame(batch: Any, encoding: str = ENCODING_JSON, compact: bool = False) -> Frame:
+    """
+    将一个批次编码为数据帧
+
+    Args:
+        batch: 批次数据
+        encoding: 编码方式，json 或 msgpack
+        compact: JSON 编码时省略分隔符后的空格
+
+    Returns:
+        编码后的数据帧
+    """
+    if encoding == ENCODING_JSON:
+        return Frame(json.dumps(batch, separators=(",", ":") if compact else None), False)
+    if encoding == ENCODING_MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack 编码不可用，请先安装 msgpack")
+        return Frame(msgpack.packb(batch, use_bin_type=True), True)
+    raise ValueError(f"未知的编码方式: {encoding}，可选值: {SUPPORTED_ENCODINGS}")
@@ -1,5 +1,10 @@
-from influxdb_client import InfluxDBClient, Point, WriteOptions
+from influxdb_client import Dialect, InfluxDBClient, Point, WriteOptions, WritePrecision
 from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client.service.ping_service import PingService
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import io
+import pandas as pd
 import sys
 import os
 
@@ -14,21 +19,63 @@ from backend.app.config import (
     MEASUREMENT_NAME,
     TAGS,
     FIELDS,
-    TIME_COLUMN
+    TIME_COLUMN,
+    WRITE_BATCH_SIZE,
+    QUERY_WORKERS,
+    QUERY_TIMEOUT,
+    ROLLUP_WINDOWS,
+    USE_ROLLUPS,
+    INFLUXDB_PING_TIMEOUT,
+    INFLUXDB_PING_CACHE_SECONDS
 )
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Hashable, Optional, Tuple
+from datetime import datetime, timezone
 import logging
+import time
+
+from backend.app.metrics import INFLUX_QUERY_DURATION, INFLUX_QUERY_ERRORS, INFLUX_WRITE_DURATION, INFLUX_WRITTEN_POINTS
+from backend.app.query_cache import QueryCache, estimate_result_size
+from backend.app.rollups import align_to_months, build_rollup_aggregation, build_rollup_query, rollup_measurement, select_rollup
+from backend.app.time_range import is_relative_time, normalize_flux_time, parse_flux_time
 
 logger = logging.getLogger(__name__)
 
 
+def flux_string(value: Any) -> str:
+    """转义嵌入Flux字符串字面量的值（反斜杠和双引号）"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+# 不带注释行的CSV方言，结果可直接交给 pandas 整体解析
+_PLAIN_CSV_DIALECT = Dialect(header=True, delimiter=",", annotations=[], comment_prefix="#", date_time_format="RFC3339")
+
+
 class InfluxDBManager:
-    def __init__(self, influx_url, influx_token, influx_org, influx_bucket):
-        self.client = InfluxDBClient(url=influx_url, token=influx_token, org=influx_org)
+    def __init__(self, influx_url, influx_token, influx_org, influx_bucket, query_workers: int = QUERY_WORKERS, query_timeout: float = QUERY_TIMEOUT):
+        """
+        Args:
+            query_workers: 异步查询使用的线程数，同时也是HTTP连接池大小
+            query_timeout: 单次查询的超时时间（秒）
+        """
+        self.client = InfluxDBClient(
+            url=influx_url,
+            token=influx_token,
+            org=influx_org,
+            timeout=int(query_timeout * 1000),
+            connection_pool_maxsize=query_workers
+        )
         self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
         self.query_api = self.client.query_api()
         self.bucket = influx_bucket
         self.org = influx_org
+        self.query_timeout = query_timeout
+        # 同步客户端的查询在有界线程池中执行，避免阻塞事件循环
+        self._query_executor = ThreadPoolExecutor(max_workers=query_workers, thread_name_prefix="influx-query")
+        self.query_cache = QueryCache()
+        # 正在执行的可缓存查询，相同的并发查询共用一个任务
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        # 最近一次连接检查的 (完成时间, 结果) 和正在进行的检查
+        self._last_ping: Optional[Tuple[float, bool]] = None
+        self._ping_future: Optional[asyncio.Future] = None
 
     def write_data(self, data: List[Dict[str, Any]], measurement_name: str = None):
         """
@@ -80,8 +127,15 @@ class InfluxDBManager:
 
             if points:
                 # print(f"Writing: {[point.to_line_protocol() for point in points]}")
+                started = time.perf_counter()
                 self.write_api.write(bucket=self.bucket, org=self.org, record=points)
+                INFLUX_WRITE_DURATION.observe(time.perf_counter() - started)
+                INFLUX_WRITTEN_POINTS.inc(len(points))
                 logger.info(f"成功写入 {success_count} 条有效记录到 {measurement}")
+                if len(self.query_cache):
+                    times = [parse_flux_time(record[TIME_COLUMN]) for record in data if TIME_COLUMN in record]
+                    times = [t for t in times if t is not None]
+                    self.query_cache.invalidate(measurement, min(times, default=None), max(times, default=None))
             else:
                 logger.warning("没有有效的记录需要写入")
 
@@ -92,6 +146,150 @@ class InfluxDBManager:
             logger.error(f"写入数据失败: {e}")
             raise
 
+    def write_lines(self, lines: List[str], batch_size: int = WRITE_BATCH_SIZE) -> Optional[Tuple[datetime, datetime]]:
+        """
+        直接写入行协议数据，跳过逐条构建 Point 的开销
+
+        Args:
+            lines: 行协议字符串列表，时间戳精度为纳秒
+            batch_size: 每次请求写入的行数
+
+        Returns:
+            写入数据的 (最早时间, 最晚时间)，无法解析时间戳时返回 None
+        """
+        if not lines:
+            logger.warning("没有数据需要写入")
+            return None
+
+        try:
+            for start in range(0, len(lines), batch_size):
+                batch = lines[start:start + batch_size]
+                started = time.perf_counter()
+                self.write_api.write(bucket=self.bucket, org=self.org, record="\n".join(batch), write_precision=WritePrecision.NS)
+                INFLUX_WRITE_DURATION.observe(time.perf_counter() - started)
+                INFLUX_WRITTEN_POINTS.inc(len(batch))
+            logger.info(f"成功写入 {len(lines)} 条行协议记录")
+        except Exception as e:
+            logger.error(f"写入数据失败: {e}")
+            raise
+
+        time_range = self._lines_time_range(lines)
+        if len(self.query_cache):
+            measurement = lines[0].split(",", 1)[0].replace("\\ ", " ")
+            # 无法解析时间戳时使该测量的全部缓存失效
+            self.query_cache.invalidate(measurement, *(time_range or (None, None)))
+        return time_range
+
+    @staticmethod
+    def _lines_time_range(lines: List[str]) -> Optional[Tuple[datetime, datetime]]:
+        """返回行协议数据的 (最早时间, 最晚时间)，无法解析时间戳时返回 None"""
+        try:
+            stamps = [int(line.rsplit(" ", 1)[1]) for line in lines]
+        except (IndexError, ValueError):
+            return None
+        return (
+            datetime.fromtimestamp(min(stamps) / 1e9, tz=timezone.utc),
+            datetime.fromtimestamp(max(stamps) / 1e9, tz=timezone.utc),
+        )
+
+    def data_time_range(self, measurement_name: str = None) -> Optional[Tuple[datetime, datetime]]:
+        """
+        查询测量中全部数据的 (最早时间, 最晚时间)
+
+        会扫描整个测量，只用于重新计算汇总表等管理操作。
+
+        Args:
+            measurement_name: 测量名称
+
+        Returns:
+            时间范围，没有数据时返回 None
+        """
+        measurement = measurement_name or MEASUREMENT_NAME
+        query = "\n".join([
+            f'data = from(bucket: "{self.bucket}")',
+            '    |> range(start: 0)',
+            f'    |> filter(fn: (r) => r._measurement == "{measurement}")',
+            '    |> keep(columns: ["_time"])',
+            '    |> group()',
+            'union(tables: [data |> min(column: "_time"), data |> max(column: "_time")])',
+        ])
+        times = [record.get_time() for table in self.query_data(query) for record in table.records]
+        times = [t for t in times if t is not None]
+        if not times:
+            return None
+        return min(times), max(times)
+
+    def build_rollups(self, start: datetime, stop: datetime, measurement_name: str = None):
+        """
+        重新计算时间范围内的日、月汇总表
+
+        范围先扩展到整月边界，由InfluxDB在服务端完成聚合和写入，数据不经过本进程。
+
+        Args:
+            start: 写入数据的最早时间
+            stop: 写入数据的最晚时间
+            measurement_name: 原始数据的测量名称
+        """
+        measurement = measurement_name or MEASUREMENT_NAME
+        start, stop = align_to_months(start, stop)
+        for every in ROLLUP_WINDOWS:
+            query = build_rollup_query(self.bucket, self.org, measurement, every, start, stop)
+            self._timed_query("rollup", self.query_api.query, query)
+            logger.info(f"已更新汇总表 {rollup_measurement(measurement, every)}: {start.isoformat()} ~ {stop.isoformat()}")
+        # 汇总表在原始数据之后写入，期间缓存的汇总查询结果可能已过期
+        self.query_cache.invalidate(measurement, start, stop)
+
+    def build_query(
+        self,
+        measurement_name: str = None,
+        start_time: str = "2014-04-30T00:00:00Z",
+        end_time: str = "now()",
+        station_id: str = None,
+        limit: int = None,
+        sort_desc: bool = False,
+        pivot_data: bool = False,
+        every: str = None,
+        agg_fn: str = "mean",
+    ):
+        """
+        构建通用数据查询的Flux语句，参数含义见 get_data。
+
+        Returns:
+            Flux查询语句。
+        """
+        measurement = measurement_name or MEASUREMENT_NAME
+
+        # 聚合查询优先读取能满足分辨率的最粗汇总表，只扫描每个汇总窗口的一个点
+        rollup = select_rollup(every, agg_fn, start_time, end_time) if USE_ROLLUPS and measurement == MEASUREMENT_NAME else None
+        if rollup:
+            measurement = rollup_measurement(measurement, rollup)
+
+        # 使用 f-string 直接嵌入变量值
+        query_parts = [
+            f'from(bucket: "{self.bucket}")',
+            f'|> range(start: {start_time}, stop: {end_time})',
+            f'|> filter(fn: (r) => r._measurement == "{measurement}")'
+        ]
+
+        if station_id:
+            query_parts.append(f'|> filter(fn: (r) => r.station_id == "{flux_string(station_id)}")')
+
+        if rollup:
+            query_parts += build_rollup_aggregation(every, agg_fn)
+        elif every:
+            query_parts.append(f'|> aggregateWindow(every: {every}, fn: {agg_fn}, createEmpty: false)')
+
+        if sort_desc:
+            query_parts.append('|> sort(columns: ["_time"], desc: true)')
+
+        if limit:
+            query_parts.append(f'|> limit(n: {limit})')
+
+        if pivot_data:
+            query_parts.append('|> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")')
+
+        return "\n".join(query_parts)
+
     def get_data(
         self,
         measurement_name: str = None,
@@ -101,6 +299,9 @@ class InfluxDBManager:
         limit: int = None,
         sort_desc: bool = False,
         pivot_data: bool = False,
+        every: str = None,
+        agg_fn: str = "mean",
+        use_cache: bool = True,
     ):
         """
         通用数据查询方法，可以根据时间范围、站点、排序和限制条件获取数据。
@@ -113,34 +314,193 @@ class InfluxDBManager:
             limit: 限制返回的记录数。
             sort_desc: 是否按时间降序排序。
             pivot_data: 是否将数据透视（字段转为列）。
+            every: 聚合窗口，如 "1h"、"1d"，为None时返回原始数据。
+                每个窗口由整日或整月组成时自动改为读取对应的汇总表。
+            agg_fn: 聚合函数，mean、min 或 max。
+            use_cache: 是否使用查询结果缓存。
 
         Returns:
             查询结果。
         """
+        params = (measurement_name or MEASUREMENT_NAME, start_time, end_time, station_id, limit, sort_desc, pivot_data, every, agg_fn)
+        key = self._cache_key(*params)
+        if use_cache:
+            cached = self.query_cache.get(key)
+            if cached is not None:
+                return cached
+
+        result = self.query_data(self.build_query(*params))
+        if use_cache:
+            self._cache_result(key, result, *params[:3])
+        return result
+
+    async def get_data_async(
+        self,
+        measurement_name: str = None,
+        start_time: str = "2014-04-30T00:00:00Z",
+        end_time: str = "now()",
+        station_id: str = None,
+        limit: int = None,
+        sort_desc: bool = False,
+        pivot_data: bool = False,
+        every: str = None,
+        agg_fn: str = "mean",
+        use_cache: bool = True,
+        timeout: float = None,
+        encode: Callable[[Any], Any] = None,
+        encode_key: Hashable = None,
+    ):
+        """
+        get_data 的异步版本，查询在线程池中执行，不阻塞事件循环
+
+        使用缓存时，缓存未命中的相同查询同时到达只执行一次，其余调用等待同一个结果。
+        传入 encode 时返回并缓存 encode(查询结果)，例如序列化好的响应体，缓存命中时
+        不再重复处理；encode 同样在线程池中执行。
+
+        Args:
+            timeout: 超时时间（秒），默认使用 query_timeout
+            encode: 对查询结果的处理
+            encode_key: 区分不同 encode 的缓存键，相同的 encode_key 必须对应相同的处理
+            其余参数与 get_data 相同
+        """
+        params = (measurement_name or MEASUREMENT_NAME, start_time, end_time, station_id, limit, sort_desc, pivot_data, every, agg_fn)
+        if not use_cache:
+            return await self._query_and_encode(params, timeout, encode)
+
+        key = self._cache_key(*params)
+        if encode is not None:
+            key += (encode_key,)
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._query_and_cache(key, params, timeout, encode))
+            task.add_done_callback(lambda done: self._query_done(key, done))
+        # 某个调用方被取消时不影响共用同一查询的其他调用方
+        return await asyncio.shield(task)
+
+    async def _query_and_encode(self, params: tuple, timeout: Optional[float], encode: Optional[Callable[[Any], Any]]):
+        result = await self.query_data_async(self.build_query(*params), timeout=timeout)
+        if encode is not None:
+            result = await asyncio.get_running_loop().run_in_executor(self._query_executor, encode, result)
+        return result
+
+    async def _query_and_cache(self, key: tuple, params: tuple, timeout: Optional[float], encode: Optional[Callable[[Any], Any]]):
+        result = await self._query_and_encode(params, timeout, encode)
+        self._cache_result(key, result, *params[:3])
+        return result
+
+    def _query_done(self, key: tuple, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # 所有调用方都已取消时，避免出现 "exception was never retrieved"
+            task.exception()
+
+    @staticmethod
+    def _cache_key(measurement, start_time, end_time, station_id, limit, sort_desc, pivot_data, every, agg_fn) -> tuple:
+        """规范化查询参数作为缓存键"""
+        return (
+            measurement,
+            normalize_flux_time(start_time),
+            normalize_flux_time(end_time),
+            None if station_id is None else str(station_id),
+            limit,
+            bool(sort_desc),
+            bool(pivot_data),
+            every,
+            agg_fn if every else None,
+        )
+
+    def _cache_result(self, key: tuple, result, measurement: str, start_time, end_time):
+        """写入查询缓存，范围随当前时间变化的结果按TTL过期"""
+        open_ended = is_relative_time(start_time) or is_relative_time(end_time)
+        self.query_cache.put(
+            key,
+            result,
+            estimate_result_size(result),
+            measurement,
+            None if is_relative_time(start_time) else parse_flux_time(start_time),
+            None if is_relative_time(end_time) else parse_flux_time(end_time),
+            open_ended,
+        )
+
+    def build_pivot_query(
+        self,
+        start_time: str,
+        end_time: str = "now()",
+        station_id: str = None,
+        limit: int = None,
+        measurement_name: str = None,
+        fields: List[str] = None,
+    ) -> str:
+        """
+        构建在服务端完成透视、合并和排序的查询
+
+        每个时间点一行，字段为列，所有序列合并为一张按时间升序的表，
+        limit 作用于透视后的行数。
+
+        Args:
+            start_time: 开始时间
+            end_time: 结束时间
+            station_id: 站点ID，为None时查询所有站点
+            limit: 最多返回的行数
+            measurement_name: 测量名称
+            fields: 需要返回的字段，默认 FIELDS
+
+        Returns:
+            Flux查询语句
+        """
         measurement = measurement_name or MEASUREMENT_NAME
+        columns = ["_time", "station_id", "city"] + list(fields or FIELDS)
+        column_list = ", ".join(f'"{column}"' for column in columns)
 
-        # 使用 f-string 直接嵌入变量值
         query_parts = [
             f'from(bucket: "{self.bucket}")',
             f'|> range(start: {start_time}, stop: {end_time})',
             f'|> filter(fn: (r) => r._measurement == "{measurement}")'
         ]
-
         if station_id:
-            query_parts.append(f'|> filter(fn: (r) => r.station_id == "{station_id}")')
-
-        if sort_desc:
-            query_parts.append('|> sort(columns: ["_time"], desc: true)')
-
+            query_parts.append(f'|> filter(fn: (r) => r.station_id == "{flux_string(station_id)}")')
+        query_parts += [
+            '|> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")',
+            f'|> keep(columns: [{column_list}])',
+            '|> group()',
+            '|> sort(columns: ["_time"])',
+        ]
         if limit:
             query_parts.append(f'|> limit(n: {limit})')
+        return "\n".join(query_parts)
 
-        if pivot_data:
-            query_parts.append('|> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")')
+    def query_frame(self, query: str) -> pd.DataFrame:
+        """
+        执行查询并把无注释的CSV结果整体解析为 DataFrame
+
+        避免逐条构建 FluxRecord，适合透视后的大结果集。
+
+        Args:
+            query: Flux查询语句
+
+        Returns:
+            查询结果，无数据时返回空 DataFrame
+        """
+        try:
+            raw = self._timed_query("frame", lambda: self.query_api.query_raw(query=query, org=self.org, dialect=_PLAIN_CSV_DIALECT).data)
+        except Exception as e:
+            logger.error(f"查询失败: {e}")
+            raise
 
-        query = "\n".join(query_parts)
+        if not raw.strip():
+            return pd.DataFrame()
+        return pd.read_csv(io.BytesIO(raw), dtype={"station_id": str, "city": str})
 
-        return self.query_data(query)  
+    async def query_frame_async(self, query: str, timeout: float = None) -> pd.DataFrame:
+        """query_frame 的异步版本，在查询线程池中执行"""
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._query_executor, self.query_frame, query)
+        return await asyncio.wait_for(future, timeout or self.query_timeout)
 
     def query_data(self, query: str):
         """
@@ -154,13 +514,102 @@ class InfluxDBManager:
         """
         try:
             # OSS 2.x 中 Flux 查询不需要 params 参数
-            result = self.query_api.query(org=self.org, query=query)
+            result = self._timed_query("table", self.query_api.query, org=self.org, query=query)
             return result
         except Exception as e:
             logger.error(f"查询失败: {e}")
             raise
 
+    async def query_data_async(self, query: str, timeout: float = None):
+        """
+        在查询线程池中执行Flux查询
+
+        Args:
+            query: Flux查询语句
+            timeout: 超时时间（秒），默认使用 query_timeout
+
+        Returns:
+            查询结果
+
+        Raises:
+            asyncio.TimeoutError: 查询超时
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._query_executor, self.query_data, query)
+        return await asyncio.wait_for(future, timeout or self.query_timeout)
+
+    async def query_stream_async(self, query: str, timeout: float = None):
+        """
+        发起流式Flux查询
+
+        HTTP请求在查询线程池中发出，返回的生成器按需从响应中逐条解析 FluxRecord，
+        不会把完整结果保存在内存中。生成器是同步的，应在线程中消费。
+
+        Args:
+            query: Flux查询语句
+            timeout: 等待响应开始的超时时间（秒），默认使用 query_timeout
+
+        Returns:
+            FluxRecord 生成器
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._query_executor, lambda: self._timed_query("stream", self.query_api.query_stream, org=self.org, query=query))
+        return await asyncio.wait_for(future, timeout or self.query_timeout)
+
+    @staticmethod
+    def _timed_query(kind: str, run, *args, **kwargs):
+        """执行查询并按类型记录耗时和失败次数"""
+        started = time.perf_counter()
+        try:
+            return run(*args, **kwargs)
+        except Exception:
+            INFLUX_QUERY_ERRORS.labels(kind).inc()
+            raise
+        finally:
+            INFLUX_QUERY_DURATION.labels(kind).observe(time.perf_counter() - started)
+
+    def ping(self, timeout: float = INFLUXDB_PING_TIMEOUT) -> bool:
+        """
+        检查InfluxDB是否可用（阻塞）
+
+        HTTP请求本身以 timeout 为超时，InfluxDB 无响应时线程最多阻塞 timeout 秒，
+        而不是查询使用的 QUERY_TIMEOUT。
+
+        Returns:
+            InfluxDB 在 timeout 秒内响应 /ping 时返回 True
+        """
+        try:
+            PingService(self.client.api_client).get_ping(_request_timeout=int(timeout * 1000))
+            return True
+        except Exception as e:
+            logger.debug(f"InfluxDB ping 失败: {e}")
+            return False
+
+    async def ping_async(self, timeout: float = INFLUXDB_PING_TIMEOUT) -> bool:
+        """
+        检查InfluxDB是否可用
+
+        在默认线程池中执行，不占用查询线程池，查询繁忙时也能得到结果。同一时间
+        最多有一个检查在进行，并发调用等待同一个结果；INFLUXDB_PING_CACHE_SECONDS
+        秒内的调用直接返回上一次的结果，频繁抓取 /metrics 不会堆积线程。
+
+        Returns:
+            InfluxDB 在 timeout 秒内响应 /ping 时返回 True
+        """
+        if self._last_ping is not None and time.monotonic() - self._last_ping[0] < INFLUXDB_PING_CACHE_SECONDS:
+            return self._last_ping[1]
+        if self._ping_future is None:
+            self._ping_future = asyncio.get_running_loop().run_in_executor(None, self.ping, timeout)
+            self._ping_future.add_done_callback(self._ping_done)
+        return await asyncio.shield(self._ping_future)
+
+    def _ping_done(self, future: asyncio.Future):
+        self._ping_future = None
+        if not future.cancelled():
+            self._last_ping = (time.monotonic(), future.result())
+
     def close(self):
         """关闭连接"""
+        self._query_executor.shutdown(wait=False, cancel_futures=True)
         if self.client:
             self.client.close()
\ No newline at end of file
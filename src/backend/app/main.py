@@ -1,14 +1,30 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from backend.app.influx_client import InfluxDBManager
+from backend.app.downsample import AGGREGATE_FUNCTIONS, decimate_tables, window_for_points
+from backend.app.frames import ENCODING_JSON, FORMAT_COLUMNAR, FORMAT_RECORDS, SUPPORTED_FORMATS, available_encodings
+from backend.app.metrics import CONTENT_TYPE, INFLUX_UP, REGISTRY, Family, MetricsMiddleware
+from backend.app.record_stream import STREAM_FORMATS, iter_format
+from backend.app.profiler import LoopMonitor, SamplingProfiler, thread_ids_with_prefix
+from backend.app.playback_session import DEFAULT_SESSION_ID, PlaybackSession, SessionManager
+from backend.app.station_cache import StationCacheRegistry
+from backend.app.static_assets import StaticAssetStore
+from backend.app.stream_hub import StreamHub
+from backend.app.time_range import parse_duration, parse_flux_time
 from backend.app.config import ACCELERATION_FACTOR, BATCH_SIZE, FRONTEND_DIR, INFLUXDB_BUCKET, INFLUXDB_ORG, INFLUXDB_TOKEN, INFLUXDB_URL
+from backend.app.config import DEFAULT_STATION_ID, FIELDS, MAX_STATIONS_PER_CLIENT, PLAYBACK_END, PLAYBACK_ROW_LIMIT, PLAYBACK_START
+from backend.app.config import PLAYBACK_PREFETCH_WINDOWS, PLAYBACK_WINDOW_SECONDS
+from backend.app.config import ADMIN_TOKEN, PROFILE_MAX_SECONDS, STATION_ID_PATTERN
 import asyncio
+import hmac
 import json
+import re
+import threading
+import time
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Any, List
+from datetime import datetime, timezone
 import os
 
 # 配置日志
@@ -29,12 +45,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
-# 挂载静态文件目录
-# frontend_path = FRONTEND_DIR
-if os.path.exists(FRONTEND_DIR):
-    app.mount("/static", StaticFiles(directory=FRONTEND_DIR), name="static")
-    logger.info(f"已挂载静态文件目录: {FRONTEND_DIR}")
+# 前端静态文件在启动时加载到内存并预先压缩，由 /static/* 和页面路由提供
+static_assets = StaticAssetStore(FRONTEND_DIR)
 
 # 全局变量
 influx_manager = InfluxDBManager(
@@ -43,10 +57,22 @@ influx_manager = InfluxDBManager(
     influx_org=INFLUXDB_ORG,
     influx_token=INFLUXDB_TOKEN
 )
-data_cache = []
-current_index = 0
-is_playing = False
-clients = set()
+# 按 (站点, 时间窗口) 分段加载、所有播放会话共享的播放缓存
+station_caches = StationCacheRegistry(
+    influx_manager,
+    int(parse_flux_time(PLAYBACK_START).timestamp()),
+    int(parse_flux_time(PLAYBACK_END).timestamp()),
+    window_seconds=PLAYBACK_WINDOW_SECONDS,
+    prefetch=PLAYBACK_PREFETCH_WINDOWS,
+    limit=PLAYBACK_ROW_LIMIT
+)
+stream_hub = StreamHub()
+# 每个会话有独立的游标、状态和速度；全局控制接口操作默认会话
+sessions = SessionManager(stream_hub, station_caches)
+# 事件循环延迟监控，阻塞事件循环的代码位置会记录在日志中
+loop_monitor = LoopMonitor()
+# 同一时间只运行一个采样分析，避免多个采样线程相互干扰
+profile_lock = asyncio.Lock()
 
 logger.info("全局变量初始化完成")
 logger.info(f"ACCELERATION_FACTOR: {ACCELERATION_FACTOR}")
@@ -62,6 +88,8 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭时的清理"""
+    await sessions.close_all()
+    await loop_monitor.stop()
     influx_manager.close()
     logger.info("关闭服务...")
 
@@ -73,8 +101,8 @@ async def root():
         "message": "Air Quality Real-time Streaming API",
         "version": "1.0.0",
         "endpoints": {
-            "WebSocket": "/ws/stream",
-            "History": "/api/history?start=...&end=...",
+            "WebSocket": "/ws/stream?encoding=json|msgpack&format=records|columnar",
+            "History": "/api/history?start=...&end=...&every=...&fn=mean|min|max&points=...",
             "Latest": "/api/latest?limit=...",
             "Status": "/api/status"
         },
@@ -82,293 +110,589 @@ async def root():
     }
 
 
-@app.get("/index.html")
-async def serve_frontend():
+def serve_static(path: str, request: Request) -> Response:
+    """从内存中返回前端文件，支持 gzip/br 压缩和 ETag 重新验证"""
+    response = static_assets.respond(path, request.headers, request.query_params.get("v"))
+    if response is None:
+        raise HTTPException(status_code=404, detail=f"前端文件未找到: {path}")
+    return response
+
+
+@app.api_route("/index.html", methods=["GET", "HEAD"])
+async def serve_index(request: Request):
     """提供前端页面"""
-    # 获取frontend目录
-    frontend_path = os.path.join(FRONTEND_DIR, "index.html")
+    return serve_static("index.html", request)
 
-    logger.info(f"尝试加载前端文件: {frontend_path}")
 
-    if os.path.exists(frontend_path):
-        with open(frontend_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return HTMLResponse(content=content)
-    else:
-        logger.error(f"前端文件未找到: {frontend_path}")
-        return {"error": "前端文件未找到", "path": frontend_path}
-    
-@app.get("/test.html")
-async def serve_frontend():
+@app.api_route("/test.html", methods=["GET", "HEAD"])
+async def serve_test_page(request: Request):
     """提供测试页面"""
-    # 获取frontend目录
-    frontend_path = os.path.join(FRONTEND_DIR, "test.html")
-
-    logger.info(f"尝试加载前端文件: {frontend_path}")
+    return serve_static("test.html", request)
 
-    if os.path.exists(frontend_path):
-        with open(frontend_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return HTMLResponse(content=content)
-    else:
-        logger.error(f"前端文件未找到: {frontend_path}")
-        return {"error": "前端文件未找到", "path": frontend_path}
 
-@app.get("/debug.html")
-async def serve_frontend():
+@app.api_route("/debug.html", methods=["GET", "HEAD"])
+async def serve_debug_page(request: Request):
     """提供调试页面"""
-    # 获取frontend目录
-    frontend_path = os.path.join(FRONTEND_DIR, "debug.html")
+    return serve_static("debug.html", request)
 
-    logger.info(f"尝试加载前端文件: {frontend_path}")
 
-    if os.path.exists(frontend_path):
-        with open(frontend_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return HTMLResponse(content=content)
-    else:
-        logger.error(f"前端文件未找到: {frontend_path}")
-        return {"error": "前端文件未找到", "path": frontend_path}
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def serve_static_file(path: str, request: Request):
+    """提供前端静态文件"""
+    return serve_static(path, request)
+
 
 @app.get("/api/status")
 async def get_status():
     """获取服务状态"""
+    connected = await influx_manager.ping_async()
+    INFLUX_UP.set(int(connected))
     return {
         "status": "running",
-        "influxdb_connected": True,
-        "clients": len(clients),
-        "is_playing": is_playing,
-        "current_index": current_index,
-        "data_cache_size": len(data_cache)
+        "influxdb_connected": connected,
+        "clients": len(stream_hub.subscribers),
+        "is_playing": sessions.default.is_playing,
+        "current_time": sessions.default.state()["current_time"],
+        "sessions": sessions.stats(),
+        "data_cache": station_caches.stats(),
+        "stream": stream_hub.stats(),
+        "query_cache": influx_manager.query_cache.stats(),
+        "event_loop": loop_monitor.stats()
     }
 
 
+def require_admin(request: Request):
+    """
+    管理接口要求携带与 ADMIN_TOKEN 一致的 X-Admin-Token 请求头，未配置 ADMIN_TOKEN 时一律拒绝
+
+    不按来源地址放行本机请求：服务部署在反向代理之后时，所有请求的来源地址都是本机。
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="未配置 ADMIN_TOKEN，管理接口已禁用")
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="X-Admin-Token 无效")
+
+
+@app.get("/admin/profile")
+async def admin_profile(
+    request: Request,
+    seconds: float = 5,
+    interval: float = 0.005,
+    threads: str = "loop",
+    format: str = "json",
+    limit: int = 50,
+):
+    """
+    对运行中的进程做采样分析，返回聚合后的调用栈
+
+    Args:
+        seconds: 采样时长，不超过 PROFILE_MAX_SECONDS
+        interval: 采样间隔（秒）
+        threads: loop 只采样事件循环线程，query 只采样InfluxDB查询线程池，all 采样所有线程
+        format: json 返回出现最多的调用栈和函数；folded 返回折叠栈文本，可直接交给
+            flamegraph.pl 或 speedscope 生成火焰图
+        limit: json 格式返回的调用栈和函数数量
+    """
+    require_admin(request)
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds 必须在 (0, {PROFILE_MAX_SECONDS}] 之间")
+    if not 0.001 <= interval <= 1:
+        raise HTTPException(status_code=400, detail="interval 必须在 [0.001, 1] 之间")
+    if threads == "loop":
+        thread_ids = [threading.get_ident()]
+    elif threads == "query":
+        thread_ids = thread_ids_with_prefix("influx-query")
+    elif threads == "all":
+        thread_ids = None
+    else:
+        raise HTTPException(status_code=400, detail="threads 必须是 loop、query 或 all")
+    if format not in ("json", "folded"):
+        raise HTTPException(status_code=400, detail="format 必须是 json 或 folded")
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="已有采样分析正在运行")
+
+    async with profile_lock:
+        logger.info(f"开始采样分析: {seconds}s，间隔 {interval}s，线程 {threads}")
+        profiler = SamplingProfiler(thread_ids, interval)
+        # 采样线程独立运行，事件循环在采样期间照常工作，采到的正是实际负载
+        await asyncio.get_running_loop().run_in_executor(None, profiler.run, seconds)
+
+    if format == "folded":
+        return PlainTextResponse(profiler.folded())
+    return {"seconds": seconds, "threads": threads, **profiler.report(limit)}
+
+
+@app.post("/admin/cache/clear")
+async def admin_clear_cache(request: Request):
+    """
+    清空查询结果缓存
+
+    写入时的缓存失效只覆盖本进程的写入，用 init_data.py 导入数据后可调用该接口，
+    不必等待缓存过期（QUERY_CACHE_MAX_AGE）。
+    """
+    require_admin(request)
+    entries = len(influx_manager.query_cache)
+    influx_manager.query_cache.clear()
+    logger.info(f"已清空查询缓存，共 {entries} 项")
+    return {"cleared": entries}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """以 Prometheus 文本格式输出监控指标"""
+    INFLUX_UP.set(int(await influx_manager.ping_async()))
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+def collect_service_metrics():
+    """抓取时读取各组件已有的统计信息，不在热路径上额外计数"""
+    query_cache = influx_manager.query_cache.stats()
+    data_cache = station_caches.stats()
+    stream = stream_hub.stats()
+    session_stats = sessions.stats()
+    return [
+        Family("websocket_clients", "gauge", "当前WebSocket连接数", [({}, stream["subscribers"])]),
+        Family("websocket_client_queue_depth", "gauge", "每个客户端发送队列中积压的帧数", [
+            ({"client": subscriber.client_id, "session": subscriber.session_id}, subscriber.queue.qsize())
+            for subscriber in list(stream_hub.subscribers)
+        ]),
+        Family("websocket_dropped_frames_total", "counter", "因客户端过慢丢弃的帧数", [({}, stream["dropped_batches"])]),
+        Family("websocket_slow_disconnects_total", "counter", "因客户端过慢断开的连接数", [({}, stream["disconnected_slow_clients"])]),
+        Family("playback_sessions", "gauge", "播放会话数", [({}, session_stats["sessions"])]),
+        Family("playback_sessions_playing", "gauge", "正在播放的会话数", [({}, session_stats["playing"])]),
+        Family("playback_cache_requests_total", "counter", "播放缓存的数据段请求数，hit 表示数据段已加载", [
+            ({"result": "hit"}, data_cache["hits"]),
+            ({"result": "miss"}, data_cache["misses"]),
+        ]),
+        Family("playback_cache_segments", "gauge", "已加载的播放数据段数", [({}, data_cache["segments"])]),
+        Family("playback_cache_bytes", "gauge", "播放数据段占用的字节数", [({}, data_cache["bytes"])]),
+        Family("query_cache_requests_total", "counter", "查询缓存的查找次数", [
+            ({"result": "hit"}, query_cache["hits"]),
+            ({"result": "miss"}, query_cache["misses"]),
+        ]),
+        Family("query_cache_evictions_total", "counter", "查询缓存按LRU淘汰的条目数", [({}, query_cache["evictions"])]),
+        Family("query_cache_entries", "gauge", "查询缓存的条目数", [({}, query_cache["entries"])]),
+        Family("query_cache_bytes", "gauge", "查询缓存占用的估算字节数", [({}, query_cache["bytes"])]),
+    ]
+
+
+REGISTRY.register_collector(collect_service_metrics)
+
+
 @app.get("/api/latest")
 async def get_latest_data(limit: int = 100):
     """获取最新的空气质量数据"""
     try:
         # 由于数据是2014-2015年的历史数据，查询较早的时间范围
         # 查询最近的历史数据并限制返回数量，然后使用pivot将字段转为列
-        result = influx_manager.get_data(start_time="2014-01-01T00:00:00Z", limit=limit, sort_desc=True, pivot_data=True)
+        result = await influx_manager.get_data_async(start_time="2014-01-01T00:00:00Z", limit=limit, sort_desc=True, pivot_data=True)
         return {"data": result}
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="查询超时")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/history")
-async def get_history_data(start: str, end: str = "now()", station_id: str = None):
-    """获取历史数据"""
+async def get_history_data(
+    start: str,
+    end: str = "now()",
+    station_id: str = None,
+    every: str = None,
+    fn: str = "mean",
+    points: int = None,
+    field: str = "pm25",
+    format: str = "json",
+):
+    """
+    获取历史数据
+
+    Args:
+        format: 返回格式。json 返回完整文档；ndjson 或 csv 边从InfluxDB读取边输出，
+            服务端内存占用与范围大小无关
+        every: 聚合窗口（如 1h、1d），在InfluxDB中用 aggregateWindow 按 fn 聚合
+        fn: 聚合函数，mean、min 或 max
+        points: 每个站点返回的最大点数，超出时先下推聚合再用LTTB降采样
+        field: LTTB 选点依据的字段
+    """
+    if fn not in AGGREGATE_FUNCTIONS:
+        raise HTTPException(status_code=400, detail=f"fn 必须是 {AGGREGATE_FUNCTIONS} 之一")
+    if every is not None:
+        window = parse_duration(every)
+        if window is None or window.total_seconds() <= 0:
+            raise HTTPException(status_code=400, detail=f"无效的聚合窗口: {every}")
+    if points is not None and points < 3:
+        raise HTTPException(status_code=400, detail="points 不能小于 3")
+    if station_id is not None and not re.fullmatch(STATION_ID_PATTERN, station_id):
+        raise HTTPException(status_code=400, detail=f"无效的站点ID: {station_id}")
+    if format != "json" and format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format 必须是 json 或 {tuple(STREAM_FORMATS)} 之一")
+    if format != "json" and points:
+        raise HTTPException(status_code=400, detail="流式格式不支持 points，请改用 every 指定聚合窗口")
+
+    if format != "json":
+        return await stream_history(start, end, station_id, every, fn, format)
+
+    # 只给出点数预算时，根据查询范围推算下推的聚合窗口
+    if points and not every:
+        start_time, end_time = parse_flux_time(start), parse_flux_time(end)
+        span = end_time - start_time if start_time and end_time else None
+        every = window_for_points(span, points)
+
+    def encode(result) -> bytes:
+        # 缓存保存降采样并序列化好的响应体，命中时不再重复编码
+        if points:
+            result = decimate_tables(result, field, points)
+        return JSONResponse(jsonable_encoder({"data": result, "every": every})).body
+
     try:
         # The original get_data_by_time_range did pivot the data
-        result = influx_manager.get_data(start_time=start, end_time=end, station_id=station_id, pivot_data=True)
-        return {"data": result}
+        body = await influx_manager.get_data_async(
+            start_time=start, end_time=end, station_id=station_id, pivot_data=True, every=every, agg_fn=fn,
+            encode=encode, encode_key=("history", points, field if points else None),
+        )
+        return Response(body, media_type="application/json")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="查询超时")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def stream_history(start: str, end: str, station_id: str, every: str, fn: str, fmt: str) -> StreamingResponse:
+    """以 NDJSON 或 CSV 流式返回历史数据"""
+    query = influx_manager.build_query(start_time=start, end_time=end, station_id=station_id, pivot_data=True, every=every, agg_fn=fn)
+    try:
+        records = await influx_manager.query_stream_async(query)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="查询超时")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def body():
+        try:
+            yield from iter_format(records, fmt)
+        except Exception as e:
+            # 响应头已发出，只能记录错误并提前结束
+            logger.error(f"流式输出历史数据失败: {e}", exc_info=True)
+
+    # 同步生成器由 Starlette 在线程池中迭代，不阻塞事件循环
+    return StreamingResponse(body(), media_type=STREAM_FORMATS[fmt])
+
+
+def get_session_or_404(session_id: str) -> PlaybackSession:
+    """按ID查找播放会话，不存在时返回 404"""
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"播放会话不存在: {session_id}")
+    return session
+
+
+async def apply_control(session: PlaybackSession, action: str, factor: float = None, at: str = None) -> dict:
+    """
+    对播放会话执行控制操作
+
+    Args:
+        session: 播放会话
+        action: play、pause、reset、speed 或 seek
+        factor: action 为 speed 时的播放速度
+        at: action 为 seek 时的目标时间（RFC3339）
+
+    Returns:
+        操作后的会话状态；seek 时额外包含 first_record，即订阅站点中第一条不早于目标时间的数据的时间
+
+    Raises:
+        ValueError: 未知的操作、无效的速度或跳转时间
+    """
+    result = {}
+    if action == "play":
+        session.play()
+    elif action == "pause":
+        session.pause()
+    elif action == "reset":
+        session.reset()
+    elif action == "speed":
+        if factor is None:
+            raise ValueError("speed 操作需要 factor")
+        session.set_speed(float(factor))
+    elif action == "seek":
+        target = parse_flux_time(at) if at else None
+        if target is None:
+            raise ValueError("seek 操作需要 RFC3339 格式的 time")
+        first = await session.seek(int(target.timestamp()))
+        result["first_record"] = None if first is None else datetime.fromtimestamp(first, tz=timezone.utc).isoformat()
+    else:
+        raise ValueError(f"未知的控制操作: {action}")
+    result.update(session.state())
+    logger.info(f"会话 {session.session_id} 执行 {action}，状态: {result}")
+    return result
+
+
 @app.post("/api/control/play")
 async def control_play():
-    """开始播放数据流"""
-    global is_playing
-    is_playing = True
-    logger.info("收到播放请求，设置 is_playing = True")
+    """开始播放数据流（默认会话）"""
+    await apply_control(sessions.default, "play")
     return {"message": "开始播放数据流"}
 
 
 @app.post("/api/control/pause")
 async def control_pause():
-    """暂停播放数据流"""
-    global is_playing
-    is_playing = False
-    logger.info("收到暂停请求，设置 is_playing = False")
+    """暂停播放数据流（默认会话）"""
+    await apply_control(sessions.default, "pause")
     return {"message": "暂停播放数据流"}
 
 
 @app.post("/api/control/reset")
 async def control_reset():
-    """重置播放位置"""
-    global current_index, is_playing
-    current_index = 0
-    is_playing = False
-    logger.info("收到重置请求，设置 current_index = 0, is_playing = False")
+    """重置播放位置（默认会话）"""
+    await apply_control(sessions.default, "reset")
     return {"message": "重置播放位置"}
 
 
 @app.post("/api/control/speed/{factor}")
 async def control_speed(factor: float):
-    """设置播放速度"""
-    global ACCELERATION_FACTOR
-    ACCELERATION_FACTOR = factor
+    """设置播放速度（默认会话）"""
+    try:
+        await apply_control(sessions.default, "speed", factor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"message": f"播放速度设置为 {factor}"}
 
 
-@app.websocket("/ws/stream")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket实时数据流端点"""
-    global clients, is_playing, current_index, data_cache
-
-    await websocket.accept()
-    clients.add(websocket)
-    logger.info(f"新客户端连接，当前连接数: {len(clients)}")
+@app.post("/api/control/seek")
+async def control_seek(at: str = Query(..., alias="time")):
+    """
+    跳转到指定时间（默认会话）
 
+    Args:
+        time: 目标时间（RFC3339），须在播放范围内
+    """
     try:
-        # 确保数据已加载
-        if not data_cache:
-            logger.warning("WebSocket连接时数据缓存为空，正在加载...")
-            await load_data_cache()
-
-        # 为新连接重置当前索引
-        current_index = 0
-        logger.info(f"重置当前索引为: {current_index}")
-
-        # 不要在这里自动设置is_playing=True，而是使用全局状态
-        # is_playing的控制应由API端点管理
-        logger.info(f"WebSocket循环开始，当前is_playing状态: {is_playing}, 数据缓存大小: {len(data_cache)}")
-
-        # 初始化上一次的播放状态
-        last_is_playing = is_playing
-        iteration_count = 0  # 添加迭代计数用于调试
-
-        while True:
-            # 添加这一行来验证是否在循环中
-            iteration_count += 1
-            if iteration_count <= 5:  # 只记录前5次迭代的信息
-                logger.debug(f"WebSocket循环第 {iteration_count} 次迭代，is_playing: {is_playing}, data_cache大小: {len(data_cache)}, current_index: {current_index}")
-
-            if is_playing and data_cache:
-                # 检查是否刚从暂停状态变为播放状态
-                if not last_is_playing:
-                    logger.info("播放状态从暂停变为播放")
-                last_is_playing = is_playing
-
-                # 获取下一批数据
-                batch_data = get_next_batch()
-                if batch_data:
-                    # 推送给客户端
-                    await websocket.send_text(json.dumps(batch_data))
-                    logger.info(f"✅ 发送数据批次，大小: {len(batch_data)}")  # 改为info级别以便看到
-                    logger.debug(f"发送的数据样本: {batch_data[0] if batch_data else 'None'}")
-                else:
-                    logger.warning("没有获取到批次数据，可能数据已播完或缓存为空")
-                    logger.debug(f"当前状态 - is_playing: {is_playing}, data_cache大小: {len(data_cache)}, current_index: {current_index}")
-
-                # 控制播放速度
-                await asyncio.sleep(ACCELERATION_FACTOR)
-            else:
-                # 暂停状态，等待1秒后重试
-                if last_is_playing:
-                    logger.info("播放状态从播放变为暂停")
-                last_is_playing = is_playing
-                logger.debug(f"播放暂停，is_playing: {is_playing}, 数据缓存大小: {len(data_cache)}")
-                await asyncio.sleep(1)
-
-    except WebSocketDisconnect:
-        clients.remove(websocket)
-        logger.info(f"客户端断开连接，当前连接数: {len(clients)}")
-    except Exception as e:
-        logger.error(f"WebSocket错误: {e}")
-        logger.error(f"异常详情: {str(e)}", exc_info=True)
-        clients.remove(websocket)
+        return await apply_control(sessions.default, "seek", at=at)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
-def get_next_batch() -> List[Dict[str, Any]]:
-    """获取下一批数据"""
-    global current_index, data_cache
+@app.get("/api/sessions/{session_id}")
+async def get_session(session_id: str):
+    """获取播放会话状态"""
+    return get_session_or_404(session_id).state()
 
-    if not data_cache:
-        logger.warning("数据缓存为空")
-        return []
 
-    batch = []
-    for _ in range(BATCH_SIZE):
-        if current_index >= len(data_cache):
-            # 循环播放
-            current_index = 0
-            logger.info("数据播放完成，重新开始")
+@app.post("/api/sessions/{session_id}/{action}")
+async def control_session(session_id: str, action: str, factor: float = None, at: str = Query(None, alias="time")):
+    """
+    控制指定的播放会话
 
-        record = data_cache[current_index]
-        batch.append(record)
-        logger.debug(f"添加数据记录到批次: {record}")
-        current_index += 1
-        # 只记录第一个记录的调试信息，避免日志过多
-        if len(batch) == 1:
-            logger.debug(f"批次中第一个记录: {record}")
+    Args:
+        action: play、pause、reset、speed（需要 factor 参数）或 seek（需要 time 参数）
+    """
+    session = get_session_or_404(session_id)
+    try:
+        return await apply_control(session, action, factor, at)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    logger.debug(f"返回批次数据，大小: {len(batch)}")
-    return batch
 
+@app.websocket("/ws/stream")
+async def websocket_endpoint(
+    websocket: WebSocket,
+    encoding: str = ENCODING_JSON,
+    session: str = DEFAULT_SESSION_ID,
+    format: str = FORMAT_RECORDS,
+):
+    """
+    WebSocket实时数据流端点
+
+    连接后默认订阅 DEFAULT_STATION_ID 的全部字段，并回复一条会话状态消息
+    {"type": "session", "session_id": ..., ...}。客户端可以随时发送订阅消息
+    修改订阅内容，例如:
+        {"type": "subscribe", "stations": ["1013", "1014"], "fields": ["pm25", "pm10"]}
+    省略 fields 表示全部字段。也可以发送控制消息操作所在的播放会话:
+        {"type": "control", "action": "play" | "pause" | "reset" | "speed" | "seek", "factor": 0.5, "time": "..."}
+    服务端回复 {"type": "subscribed", ...}、{"type": "session", ...} 或 {"type": "error", ...}。
+
+    数据帧默认为记录数组（records）。format=columnar 时为按列组织的紧凑帧
+    {"type": "columns", ...}（格式见 columnar_frames.build_columnar_batch），站点的
+    城市只在 subscribed 消息的 cities 中发送一次，连接后也会先收到一条 subscribed 消息。
+    列式帧只发送与上一帧相比有变化的字段；连接后、修改订阅后、丢帧后以及每隔
+    COLUMNAR_KEY_FRAME_INTERVAL 帧发送带 "k": 1 的关键帧，包含全部字段。
+
+    Args:
+        encoding: 帧编码，默认 json；传入 msgpack 时以二进制帧推送
+        session: 跟随的播放会话ID，默认跟随全局播放；传入 new 创建独立的私有会话
+        format: 数据帧格式，records 或 columnar
+    """
+    if encoding not in available_encodings():
+        logger.warning(f"拒绝不支持的编码: {encoding}")
+        await websocket.close(code=1003)
+        return
+    if format not in SUPPORTED_FORMATS:
+        logger.warning(f"拒绝不支持的帧格式: {format}")
+        await websocket.close(code=1003)
+        return
+
+    playback = sessions.create() if session == "new" else sessions.join(session)
+    if playback is None:
+        logger.warning(f"拒绝连接，播放会话不存在或会话数已达上限: {session}")
+        await websocket.close(code=1008)
+        return
+
+    # 会话创建之后的任何一步失败（握手、加载默认站点）都要经过 finally 释放会话，
+    # 否则私有会话和它的播放任务会一直占用 MAX_SESSIONS 的名额
+    subscriber = None
+    tasks = []
+    try:
+        await websocket.accept()
+
+        failed = await playback.load([DEFAULT_STATION_ID])
+        if failed:
+            logger.error(f"加载默认站点 {DEFAULT_STATION_ID} 失败")
+
+        subscriber = stream_hub.subscribe(
+            websocket, encoding, stations=[DEFAULT_STATION_ID], session_id=playback.session_id, frame_format=format,
+        )
+        stream_hub.send_control(subscriber, {"type": "session", **playback.state()})
+        if format == FORMAT_COLUMNAR:
+            stream_hub.send_control(subscriber, subscription_reply(subscriber, playback))
+        playback.notify()
+        logger.info(f"新客户端连接，会话: {playback.session_id}，当前连接数: {len(stream_hub.subscribers)}")
+
+        # 发送由订阅者自己的队列驱动，接收用于处理客户端消息和感知客户端断开
+        tasks = [
+            asyncio.create_task(stream_hub.pump(subscriber)),
+            asyncio.create_task(receive_client_messages(websocket, subscriber, playback)),
+        ]
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    except Exception as e:
+        logger.error(f"WebSocket错误: {e}", exc_info=True)
+        try:
+            await websocket.close(code=1011)
+        except Exception:
+            pass  # 连接已断开
+    finally:
+        for task in tasks:
+            task.cancel()
+        if subscriber is not None:
+            stream_hub.unsubscribe(subscriber)
+        await sessions.release(playback)
+        logger.info(f"客户端断开连接，当前连接数: {len(stream_hub.subscribers)}")
+
+
+async def receive_client_messages(websocket: WebSocket, subscriber, playback: PlaybackSession):
+    """读取客户端消息并处理订阅和控制请求，直到连接断开"""
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        text = message.get("text")
+        if text is not None:
+            await handle_client_message(subscriber, playback, text)
+
+
+async def handle_client_message(subscriber, playback: PlaybackSession, text: str):
+    """
+    处理客户端发来的消息
+
+    Args:
+        subscriber: 发送消息的订阅者
+        playback: 该订阅者所在的播放会话
+        text: JSON 文本
+    """
+    try:
+        message = json.loads(text)
+    except ValueError:
+        stream_hub.send_control(subscriber, {"type": "error", "message": "消息不是有效的JSON"})
+        return
+    message_type = message.get("type") if isinstance(message, dict) else None
+    if message_type == "subscribe":
+        await handle_subscribe(subscriber, playback, message)
+    elif message_type == "control":
+        try:
+            state = await apply_control(playback, message.get("action"), message.get("factor"), message.get("time"))
+        except (TypeError, ValueError) as e:
+            stream_hub.send_control(subscriber, {"type": "error", "message": str(e)})
+            return
+        stream_hub.send_control(subscriber, {"type": "session", **state})
+    else:
+        stream_hub.send_control(subscriber, {"type": "error", "message": "不支持的消息类型"})
+
+
+async def handle_subscribe(subscriber, playback: PlaybackSession, message: dict):
+    """处理订阅消息"""
+    stations = message.get("stations") or [DEFAULT_STATION_ID]
+    fields = message.get("fields")
+    if not isinstance(stations, list) or len(stations) > MAX_STATIONS_PER_CLIENT:
+        stream_hub.send_control(subscriber, {"type": "error", "message": f"stations 必须是不超过 {MAX_STATIONS_PER_CLIENT} 个站点的列表"})
+        return
+    if fields is not None and (not isinstance(fields, list) or not set(fields) <= set(FIELDS)):
+        stream_hub.send_control(subscriber, {"type": "error", "message": f"fields 只能包含 {FIELDS}"})
+        return
+
+    stations = [str(station_id) for station_id in stations]
+    invalid = [station_id for station_id in stations if not re.fullmatch(STATION_ID_PATTERN, station_id)]
+    if invalid:
+        stream_hub.send_control(subscriber, {"type": "error", "message": f"无效的站点ID: {invalid}"})
+        return
+    failed = await playback.load(stations)
+
+    stream_hub.update_subscription(subscriber, [s for s in stations if s not in failed], fields)
+    playback.notify()
+    reply = subscription_reply(subscriber, playback)
+    if failed:
+        reply["failed"] = failed
+    stream_hub.send_control(subscriber, reply)
+    logger.info(f"客户端订阅站点: {subscriber.stations}, 字段: {subscriber.fields or '全部'}")
+
+
+def subscription_reply(subscriber, playback: PlaybackSession) -> dict:
+    """
+    订阅确认消息
+
+    cities 为各站点的城市，columnar 帧中不再重复发送；站点在当前窗口没有数据时不包含该站点。
+    """
+    cities = {}
+    for station_id in subscriber.stations:
+        segment = playback.registry.get(station_id, playback.current_time)
+        if segment is not None and segment.tags:
+            cities[station_id] = segment.tags[0][1]
+    return {
+        "type": "subscribed",
+        "stations": list(subscriber.stations),
+        "fields": list(subscriber.fields or FIELDS),
+        "cities": cities,
+    }
 
-async def load_data_cache():
-    """加载数据到缓存"""
-    global data_cache, current_index
 
+async def load_data_cache():
+    """为默认会话预加载默认站点当前窗口的数据"""
     try:
         logger.info("正在加载数据到缓存...")
-        # 获取最近的数据，format_query_result 需要未透视的数据
-        # 使用较小的限制以提高性能，我们只需要一段时间的数据
-        result = influx_manager.get_data(start_time="2015-04-28T00:00:00Z", end_time="2015-05-01T00:00:00Z", station_id=1013, limit=2000, sort_desc=False)  # 使用较近的开始时间，限制记录数量
-        data_cache = format_query_result(result)
-        current_index = 0
-        logger.info(f"成功加载 {len(data_cache)} 条数据到缓存")
-        if data_cache:
-            logger.info(f"数据缓存中的第一个记录: {data_cache[0]}")
-            logger.info(f"数据缓存中的最后一个记录: {data_cache[-1] if len(data_cache) > 0 else 'None'}")
+        started = time.perf_counter()
+        await sessions.default.load([DEFAULT_STATION_ID])
+        cache = await station_caches.ensure(DEFAULT_STATION_ID, sessions.default.current_time)
+        logger.info(f"成功加载 {len(cache)} 条数据到缓存，占用 {cache.nbytes} 字节，耗时 {time.perf_counter() - started:.3f}s")
+        if cache:
+            logger.info(f"数据缓存中的第一个记录: {cache.slice(0, 1).to_records()[0]}")
+            logger.info(f"数据缓存中的最后一个记录: {cache.slice(len(cache) - 1, len(cache)).to_records()[0]}")
     except Exception as e:
         logger.error(f"加载数据失败: {e}")
         logger.error(f"异常详情: {str(e)}", exc_info=True)
-        data_cache = []
 
 
 @app.on_event("startup")
 async def startup_event():
     """应用启动时的初始化"""
     logger.info("启动空气质量实时数据流服务...")
+    if os.path.exists(FRONTEND_DIR):
+        # 压缩较大的文件需要一些时间，在线程中执行
+        await asyncio.get_running_loop().run_in_executor(None, static_assets.load)
     # 在启动时就加载数据到缓存，而不是在WebSocket连接时
     await load_data_cache()
-    logger.info(f"缓存加载完成，当前缓存大小: {len(data_cache)}")
-
-    # 在WebSocket连接时不再重复加载，但保留检查以防万一
-
-
-def format_query_result(result) -> List[Dict[str, Any]]:
-    """格式化查询结果"""
-    formatted_data = []
-
-    try:
-        # 按时间戳和station_id分组
-        data_by_timestamp = {}
-
-        for table in result:
-            for record in table.records:
-                timestamp = record.get_time().isoformat()
-                station_id = record.values.get("station_id") or "unknown"
-                city = record.values.get("city") or "unknown"
-
-                key = (timestamp, station_id)
-                if key not in data_by_timestamp:
-                    data_by_timestamp[key] = {
-                        "timestamp": timestamp,
-                        "station_id": station_id,
-                        "city": city
-                    }
-
-                # 添加字段值
-                field_name = record.get_field()
-                field_value = record.get_value()
-                if field_value is not None:
-                    data_by_timestamp[key][field_name] = field_value
-
-        # 转换为列表并按时间排序
-        formatted_data = list(data_by_timestamp.values())
-        formatted_data.sort(key=lambda x: x["timestamp"])
-
-        logger.info(f"格式化了 {len(formatted_data)} 条记录")
-
-    except Exception as e:
-        logger.error(f"格式化查询结果失败: {e}")
-        logger.error(f"异常详情: {str(e)}", exc_info=True)
+    logger.info(f"缓存加载完成: {station_caches.stats()}")
 
-    return formatted_data
+    # 启动默认会话的播放任务
+    sessions.start()
+    loop_monitor.start()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,298 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+from backend.app.config import METRICS_LATENCY_BUCKETS
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Family(NamedTuple):
+    """由采集函数在抓取时生成的一组指标"""
+    name: str
+    type: str
+    help: str
+    samples: List[Tuple[Dict[str, str], float]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # 最后一个计数对应 +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class _Metric:
+    """
+    带标签的指标，每组标签值对应一个子指标
+
+    热路径上只有一次字典查找（子指标可以预先取出保存）和一次加锁的加法，
+    格式化只在抓取时进行。
+    """
+
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._child(())
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _child(self, values: Tuple[str, ...]):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def labels(self, *values):
+        """返回指定标签值的子指标"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，收到 {values}")
+        return self._child(tuple(str(value) for value in values))
+
+    def _labeled(self):
+        with self._lock:
+            items = list(self._children.items())
+        for values, child in items:
+            yield dict(zip(self.labelnames, values)), child
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(child.value)}" for labels, child in self._labeled()]
+
+
+class Gauge(Counter):
+    """可以任意设置的瞬时值"""
+
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def dec(self, amount: float = 1):
+        self._default.dec(amount)
+
+
+class Histogram(_Metric):
+    """按固定分桶统计的分布，用于耗时和大小"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = METRICS_LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(float(bound) for bound in buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, child in self._labeled():
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    进程内指标注册表，按 Prometheus 文本格式输出
+
+    热路径直接更新计数器和直方图；队列深度、缓存命中数等已由各组件自行统计的
+    状态通过采集函数在抓取时读取，不给热路径增加任何开销。
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"指标 {metric.name} 已以不同的类型或标签注册")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = METRICS_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]):
+        """注册在每次抓取时调用的采集函数"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """输出所有指标的 Prometheus 文本格式"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for family in collector():
+                lines.append(f"# HELP {family.name} {family.help}")
+                lines.append(f"# TYPE {family.name} {family.type}")
+                lines.extend(f"{family.name}{_format_labels(labels)} {_format_value(value)}" for labels, value in family.samples)
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """
+        把当前指标写入文件，供 node_exporter 的 textfile collector 读取
+
+        用于数据导入等不提供HTTP接口的短时进程；先写临时文件再替换，避免读到一半的内容。
+        """
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+
+REGISTRY = MetricsRegistry()
+
+# HTTP 接口
+HTTP_REQUEST_DURATION = REGISTRY.histogram("http_request_duration_seconds", "HTTP请求处理耗时", ("method", "route"))
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTP请求数", ("method", "route", "status"))
+
+# InfluxDB 查询和写入
+INFLUX_QUERY_DURATION = REGISTRY.histogram("influxdb_query_duration_seconds", "Flux查询耗时，stream 为等待响应开始的时间", ("kind",))
+INFLUX_QUERY_ERRORS = REGISTRY.counter("influxdb_query_errors_total", "失败的Flux查询数", ("kind",))
+INFLUX_WRITE_DURATION = REGISTRY.histogram("influxdb_write_duration_seconds", "单次写入请求的耗时")
+INFLUX_WRITTEN_POINTS = REGISTRY.counter("influxdb_written_points_total", "写入的数据点数")
+INFLUX_UP = REGISTRY.gauge("influxdb_up", "最近一次检查时InfluxDB是否可用")
+
+# WebSocket 推流
+STREAM_PUBLISH_DURATION = REGISTRY.histogram("stream_publish_duration_seconds", "一个节拍分发给订阅者的耗时（编码和入队）")
+WS_SEND_DURATION = REGISTRY.histogram("websocket_send_duration_seconds", "单个帧写入WebSocket的耗时", ("encoding",))
+WS_FRAMES_SENT = REGISTRY.counter("websocket_frames_sent_total", "发送的WebSocket帧数", ("encoding",))
+WS_BYTES_SENT = REGISTRY.counter("websocket_bytes_sent_total", "发送的WebSocket帧字节数", ("encoding",))
+
+# 数据导入
+IMPORT_ROWS = REGISTRY.counter("import_rows_total", "导入写入的记录数，rate() 即为导入进行中的行/秒", ("measurement",))
+IMPORT_ROWS_PER_SECOND = REGISTRY.gauge("import_rows_per_second", "最近一次完成的文件或目录导入的平均行/秒", ("measurement",))
+
+
+class MetricsMiddleware:
+    """
+    记录每个HTTP请求耗时的ASGI中间件
+
+    以路由模板（如 /api/sessions/{session_id}）而不是实际路径作为标签，标签数量
+    不随请求参数增长；未匹配任何路由的请求归为 unmatched。WebSocket 连接不经过这里计时。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.labels(scope["method"], route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(scope["method"], route, status).inc()
@@ -0,0 +1,199 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backend.app.aqi import fill_aqi
+from backend.app.config import FIELDS
+
+
+def _to_epoch_seconds(timestamp: Any) -> int:
+    """将 ISO 字符串或 datetime 转换为 Unix 秒"""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp())
+
+
+def _as_float(value: Any) -> float:
+    """缺失或无法转换的值统一记为 NaN"""
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _fill_aqi_column(columns: Dict[str, np.ndarray]):
+    """缓存包含 aqi 列时，按污染物浓度补算其中缺失的值"""
+    if "aqi" in columns and len(columns["aqi"]):
+        columns["aqi"] = fill_aqi(columns, columns["aqi"])
+
+
+class ColumnarCache:
+    """
+    列式播放缓存
+
+    timestamps 为 int64 的 Unix 秒，FIELDS 中每个字段一个 float64 数组，
+    缺失值为 NaN。站点标签按行存为整数编码，对应的 (station_id, city)
+    只保存一份。切片返回共享底层内存的视图，不复制数据。构建时 aqi 列中
+    缺失的值由污染物浓度批量补算。
+    """
+
+    def __init__(
+        self,
+        timestamps: np.ndarray,
+        columns: Dict[str, np.ndarray],
+        tag_codes: np.ndarray,
+        tags: List[Tuple[str, str]],
+    ):
+        self.timestamps = timestamps
+        self.columns = columns
+        self.tag_codes = tag_codes
+        self.tags = tags
+
+    @classmethod
+    def empty(cls, fields: Sequence[str] = FIELDS) -> "ColumnarCache":
+        """创建空缓存"""
+        return cls(
+            np.empty(0, dtype=np.int64),
+            {field: np.empty(0, dtype=np.float64) for field in fields},
+            np.empty(0, dtype=np.int32),
+            [],
+        )
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]], fields: Sequence[str] = FIELDS) -> "ColumnarCache":
+        """
+        由按时间排序的记录列表构建列式缓存
+
+        Args:
+            records: 记录列表，每条包含 timestamp、station_id、city 及字段值
+            fields: 需要缓存的字段
+
+        Returns:
+            列式缓存
+        """
+        count = len(records)
+        timestamps = np.fromiter((_to_epoch_seconds(r["timestamp"]) for r in records), dtype=np.int64, count=count)
+        columns = {
+            field: np.fromiter((_as_float(r.get(field)) for r in records), dtype=np.float64, count=count)
+            for field in fields
+        }
+        _fill_aqi_column(columns)
+
+        tag_index: Dict[Tuple[str, str], int] = {}
+        tag_codes = np.empty(count, dtype=np.int32)
+        for i, record in enumerate(records):
+            key = (str(record.get("station_id") or "unknown"), str(record.get("city") or "unknown"))
+            tag_codes[i] = tag_index.setdefault(key, len(tag_index))
+
+        return cls(timestamps, columns, tag_codes, list(tag_index))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, fields: Sequence[str] = FIELDS) -> "ColumnarCache":
+        """
+        由透视后的查询结果 DataFrame 批量构建列式缓存
+
+        Args:
+            df: 包含 _time、station_id、city 及字段列的 DataFrame，已按时间排序
+            fields: 需要缓存的字段
+
+        Returns:
+            列式缓存
+        """
+        if df.empty or "_time" not in df.columns:
+            return cls.empty(fields)
+
+        times = pd.to_datetime(df["_time"], utc=True, format="ISO8601")
+        timestamps = ((times - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+
+        columns = {}
+        for field in fields:
+            if field in df.columns:
+                columns[field] = pd.to_numeric(df[field], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                columns[field] = np.full(len(df), np.nan)
+        _fill_aqi_column(columns)
+
+        station_ids = df["station_id"].fillna("unknown") if "station_id" in df.columns else pd.Series("unknown", index=df.index)
+        cities = df["city"].fillna("unknown") if "city" in df.columns else pd.Series("unknown", index=df.index)
+        tag_codes, tags = pd.MultiIndex.from_arrays([station_ids.astype(str), cities.astype(str)]).factorize()
+
+        return cls(timestamps, columns, tag_codes.astype(np.int32), list(tags))
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self.columns)
+
+    @property
+    def nbytes(self) -> int:
+        """缓存占用的数组字节数"""
+        return (
+            self.timestamps.nbytes
+            + self.tag_codes.nbytes
+            + sum(column.nbytes for column in self.columns.values())
+        )
+
+    def slice(self, start: int, stop: int) -> "ColumnarCache":
+        """返回 [start, stop) 行的视图"""
+        return ColumnarCache(
+            self.timestamps[start:stop],
+            {field: column[start:stop] for field, column in self.columns.items()},
+            self.tag_codes[start:stop],
+            self.tags,
+        )
+
+    def index_at(self, timestamp: int) -> int:
+        """
+        返回第一条时间戳不早于 timestamp 的行号，按二分查找定位
+
+        Args:
+            timestamp: 时间（Unix 秒）
+
+        Returns:
+            行号，所有行都早于 timestamp 时返回 len(self)
+        """
+        return int(np.searchsorted(self.timestamps, timestamp, side="left"))
+
+    def time_slice(self, start: int, stop: int) -> "ColumnarCache":
+        """
+        返回时间戳落在 [start, stop) 内的行的视图，按二分查找定位
+
+        Args:
+            start: 起始时间（Unix 秒）
+            stop: 结束时间（Unix 秒，不含）
+        """
+        left, right = np.searchsorted(self.timestamps, [start, stop], side="left")
+        return self.slice(int(left), int(right))
+
+    def to_records(self, fields: Sequence[str] = None) -> List[Dict[str, Any]]:
+        """
+        转换为推送给客户端的记录列表，NaN 字段不输出
+
+        只应在批次级别的小切片上调用。
+
+        Args:
+            fields: 只输出这些字段，None 表示全部字段
+        """
+        times = [datetime.fromtimestamp(ts, tz=timezone.utc).isoformat() for ts in self.timestamps.tolist()]
+        codes = self.tag_codes.tolist()
+        selected = self.columns if fields is None else {field: self.columns[field] for field in fields if field in self.columns}
+        values = {field: column.tolist() for field, column in selected.items()}
+
+        records = []
+        for i, timestamp in enumerate(times):
+            station_id, city = self.tags[codes[i]]
+            record = {"timestamp": timestamp, "station_id": station_id, "city": city}
+            for field, column in values.items():
+                value = column[i]
+                if value == value:  # 跳过 NaN
+                    record[field] = value
+            records.append(record)
+        return records
@@ -0,0 +1,392 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from backend.app.config import (
+    ACCELERATION_FACTOR,
+    BATCH_SIZE,
+    DATA_INTERVAL_SECONDS,
+    DEFAULT_STATION_ID,
+    MAX_FPS,
+    MAX_SESSIONS,
+    PLAYBACK_MAX_LAG,
+)
+from backend.app.playback_cache import ColumnarCache
+from backend.app.station_cache import StationCacheRegistry
+from backend.app.stream_hub import StreamHub
+
+logger = logging.getLogger(__name__)
+
+# 全局播放控制接口（/api/control/*）操作的默认会话
+DEFAULT_SESSION_ID = "default"
+
+
+class PlaybackSession:
+    """
+    独立的播放会话
+
+    每个会话有自己的播放游标、播放状态和速度，由一个后台任务按节拍推进，
+    只把数据发给跟随该会话的订阅者。会话本身不持有数据：它在共享的
+    StationCacheRegistry 中固定（pin）当前窗口及预取窗口的数据段，越过
+    窗口时解除固定，因此每个会话的开销只是一个游标和少量引用计数。
+
+    节拍按单调时钟上的绝对截止时间调度：第 k 个步长（BATCH_SIZE 个采样间隔）
+    应在 anchor + k * speed 时发出，发送耗时和事件循环延迟不会累积成漂移。
+    每秒最多发出 max_fps 帧，speed 小于 1 / max_fps 时，到期的多个步长合并
+    为一帧发出，播放的数据速率保持不变。一帧不跨越数据段窗口，因此数据速率
+    有上限，speed 不会被设置得低于 min_speed。
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        hub: StreamHub,
+        registry: StationCacheRegistry,
+        speed: float = ACCELERATION_FACTOR,
+        persistent: bool = False,
+        max_fps: float = MAX_FPS,
+        max_lag: float = PLAYBACK_MAX_LAG,
+    ):
+        """
+        Args:
+            session_id: 会话ID
+            hub: 数据流分发中心
+            registry: 共享的分段播放缓存
+            speed: 每个节拍之间的秒数，数值越小越快
+            persistent: 为 True 时最后一个客户端断开后会话仍保留
+            max_fps: 每秒最多发出的帧数
+            max_lag: 落后计划超过该秒数时重新对齐时钟，而不是集中补发
+        """
+        self.session_id = session_id
+        self.hub = hub
+        self.registry = registry
+        self.persistent = persistent
+        self.max_fps = max_fps
+        self.max_lag = max_lag
+        self.speed = max(speed, self.min_speed)
+        self.current_time = registry.start
+        self.is_playing = False
+        self.task: Optional[asyncio.Task] = None
+        # 持有本会话的连接数，包括已加入但尚未完成订阅的连接
+        self.connections = 0
+        self._changed = asyncio.Event()
+        self._pinned: Set[Tuple[str, int]] = set()
+        # 为 True 时播放任务在下一次循环重新对齐调度时钟（开始播放、调速、跳转后）
+        self._reanchor = True
+
+    def start(self):
+        """启动会话的播放任务"""
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """停止播放任务并释放固定的数据段"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        self.registry.unpin(self._pinned)
+        self._pinned = set()
+
+    def play(self):
+        """开始播放"""
+        self.is_playing = True
+        self._reanchor = True
+        self.notify()
+
+    def pause(self):
+        """暂停播放"""
+        self.is_playing = False
+        self.notify()
+
+    def reset(self):
+        """回到播放范围的开始并暂停"""
+        self.current_time = self.registry.start
+        self.is_playing = False
+        self._reanchor = True
+        self.notify()
+
+    async def seek(self, at: int) -> Optional[int]:
+        """
+        跳转到指定时间，保持当前的播放/暂停状态
+
+        窗口按时间直接计算，窗口内用二分查找定位，不扫描数据；目标窗口尚未
+        加载时从 InfluxDB 加载该窗口（并预取下一个窗口）。会话没有订阅者时
+        （如通过 REST 接口跳转）加载会话已固定的站点，没有时加载 DEFAULT_STATION_ID。
+
+        Args:
+            at: 目标时间（Unix 秒）
+
+        Returns:
+            订阅站点中第一条不早于目标时间的数据的时间，窗口内没有数据时返回 None
+
+        Raises:
+            ValueError: 目标时间不在播放范围内
+        """
+        if not self.registry.start <= at < self.registry.end:
+            raise ValueError("跳转时间不在播放范围内")
+        self.current_time = at
+        self._reanchor = True
+
+        stations = (
+            self.hub.subscribed_stations(self.session_id)
+            or {station_id for station_id, _ in self._pinned}
+            or {DEFAULT_STATION_ID}
+        )
+        self._repin(stations, at)
+        segments = await self._fetch(stations, at)
+        self.notify()
+
+        first = None
+        for segment in segments.values():
+            index = segment.index_at(at)
+            if index < len(segment):
+                timestamp = int(segment.timestamps[index])
+                first = timestamp if first is None else min(first, timestamp)
+        return first
+
+    @property
+    def min_speed(self) -> float:
+        """
+        可以达到的最小 speed（最快的播放速度）
+
+        一帧最多覆盖一个数据段窗口，每秒最多 max_fps 帧。按一半的帧数计算上限，
+        为窗口边界处不足一个窗口的帧和调度抖动留出余量；更快的速度无法达到，
+        只会让播放一直落后计划、反复重新对齐时钟。
+        """
+        max_data_rate = self.registry.window_seconds * self.max_fps / 2
+        return BATCH_SIZE * DATA_INTERVAL_SECONDS / max_data_rate
+
+    def set_speed(self, factor: float):
+        """
+        设置播放速度，低于 min_speed 时按 min_speed 设置
+
+        Args:
+            factor: 每个节拍之间的秒数，必须大于 0
+
+        Raises:
+            ValueError: factor 不大于 0
+        """
+        if not factor > 0:
+            raise ValueError(f"播放速度必须大于 0: {factor}")
+        if factor < self.min_speed:
+            logger.info(f"会话 {self.session_id} 的播放速度 {factor} 超出上限，按 {self.min_speed:.6f} 设置")
+        self.speed = max(factor, self.min_speed)
+        self._reanchor = True
+        self.notify()
+
+    def notify(self):
+        """通知播放任务状态已变化（播放状态、速度、游标或订阅）"""
+        self._changed.set()
+
+    async def _wait_changed(self, timeout: float = None):
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def load(self, station_ids: Iterable[str]) -> List[str]:
+        """
+        为即将订阅的站点固定并加载当前窗口的数据段
+
+        Args:
+            station_ids: 站点ID
+
+        Returns:
+            加载失败的站点ID
+        """
+        station_ids = list(station_ids)
+        self._repin(self.hub.subscribed_stations(self.session_id) | set(station_ids), self.current_time)
+        segments = await self._fetch(station_ids, self.current_time)
+        return [station_id for station_id in station_ids if station_id not in segments]
+
+    def _repin(self, station_ids: Iterable[str], at: int):
+        """把固定的数据段调整为播放到 at 时所需的集合"""
+        wanted = self.registry.keys_for(station_ids, at)
+        # 先固定新数据段再释放旧数据段，两者重叠的部分不会被误释放
+        self.registry.pin(wanted - self._pinned)
+        self.registry.unpin(self._pinned - wanted)
+        self._pinned = wanted
+
+    async def _fetch(self, station_ids: Iterable[str], at: int) -> Dict[str, ColumnarCache]:
+        """取出各站点在 at 所在窗口的数据段，加载失败的站点被记录并跳过"""
+        station_ids = list(station_ids)
+        results = await asyncio.gather(*(self.registry.ensure(station_id, at) for station_id in station_ids), return_exceptions=True)
+        segments = {}
+        for station_id, result in zip(station_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"会话 {self.session_id} 加载站点 {station_id} 的数据失败: {result}")
+            else:
+                segments[station_id] = result
+        return segments
+
+    def _advance(self, span: int) -> Tuple[int, int]:
+        """
+        推进播放游标，返回本帧覆盖的时间段 [start, stop)（Unix 秒）
+
+        一帧不跨越数据段窗口，超出的部分留给下一帧；到达播放结束时间后从头循环播放。
+
+        Args:
+            span: 本帧计划覆盖的秒数
+        """
+        start = self.current_time
+        stop = min(start + span, self.registry.window_end(start))
+        self.current_time = stop
+        if self.current_time >= self.registry.end:
+            self.current_time = self.registry.start
+            logger.info(f"会话 {self.session_id} 数据播放完成，重新开始")
+        return start, stop
+
+    async def run(self):
+        """
+        会话的播放任务
+
+        每一帧取出本会话订阅站点在本帧时间段内的数据，只调用一次
+        hub.publish 分发给跟随本会话的订阅者。暂停或无订阅者时阻塞在状态
+        变化事件上，不产生任何周期性唤醒；控制操作置位该事件后立即生效。
+        """
+        loop = asyncio.get_running_loop()
+        step = BATCH_SIZE * DATA_INTERVAL_SECONDS
+        min_frame_interval = 1.0 / self.max_fps
+        # anchor 为本轮调度的起点，played 为自 anchor 起已发出的数据秒数
+        anchor = None
+        played = 0
+        last_frame = None
+
+        while True:
+            if not (self.is_playing and self.hub.session_subscribers(self.session_id)):
+                self._reanchor = True
+                await self._wait_changed()
+                continue
+
+            now = loop.time()
+            if self._reanchor:
+                anchor, played, last_frame, self._reanchor = now, 0, None, False
+
+            # 下一个未发出步长的截止时间，同时受帧率上限约束
+            deadline = anchor + (played // step) * self.speed
+            if last_frame is not None:
+                deadline = max(deadline, last_frame + min_frame_interval)
+            if now < deadline:
+                # 期间的调速/暂停/跳转会打断等待并重新计算
+                await self._wait_changed(deadline - now)
+                continue
+            if now - deadline > self.max_lag:
+                logger.warning(f"会话 {self.session_id} 落后计划 {now - deadline:.3f}s，重新对齐播放时钟")
+                anchor, played = now, 0
+
+            # 截至现在应发出的数据秒数，多出已发出部分的全部合并到这一帧
+            due = (int((now - anchor) // self.speed) + 1) * step
+            start, stop = self._advance(due - played)
+            played += stop - start
+
+            stations = self.hub.subscribed_stations(self.session_id)
+            self._repin(stations, start)
+            # 预取命中时不会挂起；只有预取尚未完成（如刚重置或新订阅站点）时才等待加载
+            segments = await self._fetch(stations, start)
+            self.hub.publish(self.registry.windows(segments, start, stop), self.session_id)
+            last_frame = now
+
+    def state(self) -> dict:
+        """返回会话状态"""
+        return {
+            "session_id": self.session_id,
+            "is_playing": self.is_playing,
+            "speed": self.speed,
+            "min_speed": self.min_speed,
+            # 每秒播放的数据秒数（speed 已限制在可达到的范围内）
+            "data_rate": BATCH_SIZE * DATA_INTERVAL_SECONDS / self.speed,
+            "current_time": datetime.fromtimestamp(self.current_time, tz=timezone.utc).isoformat(),
+            "clients": len(self.hub.session_subscribers(self.session_id)),
+        }
+
+
+class SessionManager:
+    """
+    播放会话管理
+
+    默认会话一直存在，由全局播放控制接口操作；客户端也可以创建私有会话，
+    私有会话在最后一个客户端断开后关闭。WebSocket 连接通过 create/join 取得会话
+    时即计入会话的连接数，断开时调用 release，因此加入过程中（握手、加载数据）
+    其他客户端离开不会关闭该会话。
+    """
+
+    def __init__(self, hub: StreamHub, registry: StationCacheRegistry, max_sessions: int = MAX_SESSIONS):
+        self.hub = hub
+        self.registry = registry
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, PlaybackSession] = {}
+        self.default = self._add(DEFAULT_SESSION_ID, persistent=True)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _add(self, session_id: str, persistent: bool = False) -> PlaybackSession:
+        session = PlaybackSession(session_id, self.hub, self.registry, persistent=persistent)
+        self._sessions[session_id] = session
+        return session
+
+    def start(self):
+        """启动已有会话的播放任务（应用启动时调用）"""
+        for session in self._sessions.values():
+            session.start()
+
+    def create(self) -> Optional[PlaybackSession]:
+        """
+        创建并启动新的私有会话，调用方作为第一个连接加入，离开时需调用 release
+
+        Returns:
+            新会话，会话数已达上限时返回 None
+        """
+        if len(self._sessions) >= self.max_sessions:
+            return None
+        session = self._add(uuid.uuid4().hex)
+        session.connections += 1
+        session.start()
+        logger.info(f"创建播放会话 {session.session_id}，当前会话数: {len(self._sessions)}")
+        return session
+
+    def get(self, session_id: str) -> Optional[PlaybackSession]:
+        """按ID查找会话，不存在时返回 None"""
+        return self._sessions.get(session_id)
+
+    def join(self, session_id: str) -> Optional[PlaybackSession]:
+        """
+        加入已有会话，离开时需调用 release
+
+        Returns:
+            会话，不存在时返回 None
+        """
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.connections += 1
+        return session
+
+    async def release(self, session: PlaybackSession):
+        """连接离开会话后调用：私有会话没有连接时关闭，否则通知会话订阅已变化"""
+        session.connections -= 1
+        if session.persistent or session.connections > 0:
+            session.notify()
+            return
+        if self._sessions.pop(session.session_id, None) is not None:
+            await session.stop()
+            logger.info(f"关闭播放会话 {session.session_id}，当前会话数: {len(self._sessions)}")
+
+    async def close_all(self):
+        """停止所有会话（应用关闭时调用）"""
+        for session in list(self._sessions.values()):
+            await session.stop()
+
+    def stats(self) -> dict:
+        """返回会话统计信息"""
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "playing": sum(1 for session in self._sessions.values() if session.is_playing),
+        }
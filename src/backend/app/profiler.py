@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+from backend.app.config import LOOP_BLOCK_THRESHOLD, LOOP_MONITOR_INTERVAL, PROFILE_MAX_DEPTH
+from backend.app.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = REGISTRY.histogram(
+    "event_loop_lag_seconds",
+    "事件循环调度延迟：定时唤醒比计划晚的秒数",
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5],
+)
+LOOP_BLOCKED = REGISTRY.counter("event_loop_blocked_total", "事件循环被阻塞超过阈值的次数")
+
+Stack = Tuple[str, ...]
+
+
+def _frame_label(filename: str, name: str, lineno: int) -> str:
+    """函数名加上文件路径的最后两级，如 send (app/stream_hub.py:215)"""
+    parts = filename.replace("\\", "/").rsplit("/", 2)
+    return f"{name} ({'/'.join(parts[-2:])}:{lineno})"
+
+
+def _walk(frame, max_depth: int = PROFILE_MAX_DEPTH) -> Stack:
+    """从栈顶向下收集调用栈，返回从最外层到当前执行位置的顺序"""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        code = frame.f_code
+        labels.append(_frame_label(code.co_filename, code.co_name, frame.f_lineno))
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+
+class SamplingProfiler:
+    """
+    采样式性能分析器
+
+    在独立线程中每隔 interval 秒读取一次目标线程的调用栈（sys._current_frames），
+    按调用栈计数。不需要对被测代码插桩，也不需要重启进程；开销只与采样频率有关，
+    与被测代码的调用次数无关。结果中某个调用栈出现的比例近似于该处占用的时间比例。
+    """
+
+    def __init__(self, thread_ids: Optional[Iterable[int]] = None, interval: float = 0.005, max_depth: int = PROFILE_MAX_DEPTH):
+        """
+        Args:
+            thread_ids: 采样的线程ID，None 表示除采样线程外的所有线程
+            interval: 采样间隔（秒）
+            max_depth: 每个调用栈最多保留的层数
+        """
+        self.thread_ids = None if thread_ids is None else set(thread_ids)
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def run(self, duration: float) -> "SamplingProfiler":
+        """在当前线程中采样 duration 秒（阻塞）"""
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                thread_name = names.get(thread_id)
+                if thread_name is None:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    thread_name = names.get(thread_id, str(thread_id))
+                self.stacks[(f"thread {thread_name}",) + _walk(frame, self.max_depth)] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+        return self
+
+    def folded(self) -> str:
+        """输出 flamegraph.pl / speedscope 可直接读取的折叠栈格式，每行“栈;栈 次数”"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def report(self, limit: int = 50) -> dict:
+        """
+        汇总采样结果
+
+        Args:
+            limit: 返回的调用栈和函数数量上限
+
+        Returns:
+            stacks 为出现次数最多的完整调用栈，functions 为各函数作为栈顶（自身耗时）
+            和出现在栈中（含子调用耗时）的采样数
+        """
+        total = sum(self.stacks.values()) or 1
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, count in self.stacks.items():
+            if len(stack) > 1:
+                own[stack[-1]] += count
+            for label in set(stack[1:]):
+                inclusive[label] += count
+        return {
+            "samples": self.samples,
+            "interval": self.interval,
+            "stacks": [
+                {"stack": list(stack), "count": count, "ratio": round(count / total, 4)}
+                for stack, count in self.stacks.most_common(limit)
+            ],
+            "functions": [
+                {"function": label, "self": count, "total": inclusive[label], "self_ratio": round(count / total, 4)}
+                for label, count in own.most_common(limit)
+            ],
+        }
+
+
+class LoopMonitor:
+    """
+    事件循环延迟监控
+
+    事件循环中的心跳任务每隔 interval 秒唤醒一次，实际唤醒比计划晚的时间即为
+    调度延迟，记录到 event_loop_lag_seconds。另有一个看门狗线程检查心跳：心跳停止
+    超过 threshold 秒说明有协程或回调正在同步执行、阻塞了事件循环，此时看门狗
+    直接读取事件循环线程当前的调用栈并记录日志，日志中就是阻塞事件循环的代码位置。
+    每次阻塞只记录一次。
+    """
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, threshold: float = LOOP_BLOCK_THRESHOLD):
+        """
+        Args:
+            interval: 心跳间隔（秒）
+            threshold: 事件循环被阻塞超过该秒数时记录调用栈
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.loop_thread_id: Optional[int] = None
+        self.max_lag = 0.0
+        self.blocked = 0
+        self.last_blocked: Optional[dict] = None
+        self._beat = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """在当前事件循环中启动心跳任务和看门狗线程"""
+        if self._task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        """停止监控"""
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            self._beat = expected
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - expected)
+            LOOP_LAG.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            blocked_for = time.monotonic() - beat
+            if blocked_for <= self.threshold or beat == reported:
+                continue
+            reported = beat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            self.blocked += 1
+            LOOP_BLOCKED.inc()
+            self.last_blocked = {
+                "at": time.time(),
+                "blocked_for": round(blocked_for, 3),
+                "stack": _walk(frame),
+            }
+            logger.warning(f"事件循环已被阻塞 {blocked_for:.3f}s，当前调用栈:\n{stack}")
+
+    def stats(self) -> dict:
+        """返回监控统计信息"""
+        return {
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "max_lag": round(self.max_lag, 4),
+            "blocked": self.blocked,
+            "last_blocked": self.last_blocked,
+        }
+
+
+def thread_ids_with_prefix(prefix: str) -> List[int]:
+    """按线程名前缀查找线程ID，如 influx-query 对应查询线程池的所有线程"""
+    return [thread.ident for thread in threading.enumerate() if thread.name.startswith(prefix)]
@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Hashable, Optional
+
+from backend.app.config import QUERY_CACHE_MAX_AGE, QUERY_CACHE_MAX_BYTES, QUERY_CACHE_TTL
+
+# 估算结果大小时每条记录及每个值的字节数
+_RECORD_OVERHEAD_BYTES = 200
+_VALUE_BYTES = 64
+
+
+def estimate_result_size(result) -> int:
+    """
+    粗略估算 Flux 查询结果（FluxTable 列表）占用的内存字节数
+
+    只看每张表的记录数和第一条记录的列数，开销与表的数量成正比。已序列化的
+    结果（bytes 或 str）按实际长度计算。
+    """
+    if isinstance(result, (bytes, str)):
+        return len(result)
+    size = 0
+    for table in result or []:
+        records = getattr(table, "records", None) or []
+        if records:
+            size += len(records) * (_RECORD_OVERHEAD_BYTES + _VALUE_BYTES * len(records[0].values))
+    return size
+
+
+class _Entry:
+    __slots__ = ("value", "size", "measurement", "start", "stop", "expires_at")
+
+    def __init__(self, value, size, measurement, start, stop, expires_at):
+        self.value = value
+        self.size = size
+        self.measurement = measurement
+        self.start = start
+        self.stop = stop
+        self.expires_at = expires_at
+
+
+class QueryCache:
+    """
+    进程内查询结果缓存
+
+    按规范化后的查询参数作为键，在字节预算内按 LRU 淘汰。查询范围以 now()
+    或相对时间结尾的结果会持续变化，只保留 ttl 秒；完全落在过去的历史范围
+    在写入重叠的数据时失效，并最多保留 max_age 秒。
+
+    写入时的失效只覆盖本进程（服务端）的写入；init_data.py 等其他进程导入的数据
+    不会使这里的缓存失效，只能等待 max_age 过期或调用 clear。
+    """
+
+    def __init__(self, max_bytes: int = QUERY_CACHE_MAX_BYTES, ttl: float = QUERY_CACHE_TTL, max_age: Optional[float] = QUERY_CACHE_MAX_AGE):
+        """
+        Args:
+            max_bytes: 内存预算（字节）
+            ttl: 范围随当前时间变化的结果的缓存秒数
+            max_age: 其他结果的最长缓存秒数，None 表示不过期
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_age = max_age
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        读取缓存
+
+        Returns:
+            缓存的结果，未命中或已过期时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        size: int,
+        measurement: str,
+        start: Optional[datetime],
+        stop: Optional[datetime],
+        open_ended: bool,
+    ):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 查询结果
+            size: 估算的结果字节数
+            measurement: 查询的测量名称，用于写入时失效
+            start: 查询范围起点，None 表示无法确定
+            stop: 查询范围终点，None 表示无法确定
+            open_ended: 范围是否随当前时间变化，为 True 时按 ttl 过期，否则按 max_age 过期
+        """
+        if size > self.max_bytes:
+            return
+        lifetime = self.ttl if open_ended else self.max_age
+        expires_at = None if lifetime is None else time.monotonic() + lifetime
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, size, measurement, start, stop, expires_at)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, measurement: str, start: Optional[datetime] = None, stop: Optional[datetime] = None):
+        """
+        使与写入数据重叠的缓存失效
+
+        Args:
+            measurement: 写入的测量名称
+            start: 写入数据的最早时间，None 表示不限
+            stop: 写入数据的最晚时间，None 表示不限
+        """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.measurement != measurement:
+                    continue
+                if start is not None and entry.stop is not None and entry.stop < start:
+                    continue
+                if stop is not None and entry.start is not None and entry.start > stop:
+                    continue
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+
+    def stats(self) -> dict:
+        """返回缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+from typing import Any, Dict, Iterable, Iterator
+
+from backend.app.config import FIELDS, STREAM_CHUNK_BYTES
+
+# 流式导出支持的格式及对应的 Content-Type
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+CSV_COLUMNS = ["timestamp", "station_id", "city"] + FIELDS
+
+
+def record_to_row(record) -> Dict[str, Any]:
+    """将透视后的 FluxRecord 转换为与数据流相同结构的行，缺失字段不输出"""
+    values = record.values
+    row = {
+        "timestamp": record.get_time().isoformat(),
+        "station_id": values.get("station_id") or "unknown",
+        "city": values.get("city") or "unknown",
+    }
+    for field in FIELDS:
+        value = values.get(field)
+        if value is not None:
+            row[field] = value
+    return row
+
+
+def _buffered(pieces: Iterable[str], chunk_bytes: int) -> Iterator[bytes]:
+    """把小片段攒成约 chunk_bytes 大小的块再输出，减少每次写出的开销"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_bytes:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def iter_ndjson(records: Iterable, chunk_bytes: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+    """逐条把记录编码为 NDJSON"""
+    return _buffered((json.dumps(record_to_row(record), ensure_ascii=False) + "\n" for record in records), chunk_bytes)
+
+
+def iter_csv(records: Iterable, chunk_bytes: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+    """逐条把记录编码为 CSV，首行为表头"""
+    def lines():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, lineterminator="\n")
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record_to_row(record))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        tail = buffer.getvalue()
+        if tail:
+            yield tail
+
+    return _buffered(lines(), chunk_bytes)
+
+
+def iter_format(records: Iterable, fmt: str) -> Iterator[bytes]:
+    """按格式名选择编码器"""
+    if fmt == "ndjson":
+        return iter_ndjson(records)
+    if fmt == "csv":
+        return iter_csv(records)
+    raise ValueError(f"未知的导出格式: {fmt}，可选值: {tuple(STREAM_FORMATS)}")
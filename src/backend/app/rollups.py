@@ -0,0 +1,172 @@
+import re
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from backend.app.config import ROLLUP_STATS, ROLLUP_TAGS, ROLLUP_WINDOWS
+from backend.app.time_range import parse_duration, parse_flux_time
+
+# 能由月汇总表聚合得到的窗口：整月或整年
+_CALENDAR_WINDOW = re.compile(r"^\d+(mo|y)$")
+_DAY_SECONDS = 86400
+
+
+def rollup_measurement(measurement: str, every: str) -> str:
+    """汇总表的测量名称，如 air_quality_1d"""
+    return f"{measurement}_{every}"
+
+
+def _format_time(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def align_to_months(start: datetime, stop: datetime) -> Tuple[datetime, datetime]:
+    """
+    把时间范围扩展到整月边界（UTC），保证范围两端的日、月汇总都由完整数据重新计算
+
+    Returns:
+        (所在月的第一天, stop 之后的下一个月第一天)
+    """
+    start = start.astimezone(timezone.utc)
+    stop = stop.astimezone(timezone.utc)
+    aligned_start = datetime(start.year, start.month, 1, tzinfo=timezone.utc)
+    month = stop.month + 1
+    aligned_stop = datetime(stop.year + (month > 12), (month - 1) % 12 + 1, 1, tzinfo=timezone.utc)
+    return aligned_start, aligned_stop
+
+
+def build_rollup_query(bucket: str, org: str, measurement: str, every: str, start: datetime, stop: datetime) -> str:
+    """
+    构建把原始数据按窗口汇总并写入汇总表的Flux语句
+
+    每个窗口、站点、字段写入 ROLLUP_STATS 中每种统计量各一个点，统计量存为 stat 标签，
+    时间戳为窗口开始时间。重复执行会覆盖同一窗口的点。
+
+    Args:
+        bucket: 存储桶
+        org: 组织
+        measurement: 原始数据的测量名称
+        every: 汇总窗口，如 1d、1mo
+        start: 开始时间，应对齐到窗口边界
+        stop: 结束时间，应对齐到窗口边界
+
+    Returns:
+        Flux语句
+    """
+    branches = []
+    for stat in ROLLUP_STATS:
+        branch = f'data |> aggregateWindow(every: {every}, fn: {stat}, timeSrc: "_start", createEmpty: false)'
+        if stat == "count":
+            # 计数为整数，转为浮点数以与其他统计量共用字段类型
+            branch += ' |> toFloat()'
+        branches.append(f'{branch} |> set(key: "stat", value: "{stat}")')
+    tag_columns = ", ".join(f'"{tag}"' for tag in ROLLUP_TAGS)
+
+    return "\n".join([
+        f'data = from(bucket: "{bucket}")',
+        f'    |> range(start: {_format_time(start)}, stop: {_format_time(stop)})',
+        f'    |> filter(fn: (r) => r._measurement == "{measurement}")',
+        'union(tables: [',
+        ",\n".join(f'    {branch}' for branch in branches),
+        '])',
+        f'    |> set(key: "_measurement", value: "{rollup_measurement(measurement, every)}")',
+        f'    |> to(bucket: "{bucket}", org: "{org}", tagColumns: [{tag_columns}, "stat"])',
+    ])
+
+
+def _window_fits(every: str, rollup: str) -> bool:
+    """判断聚合窗口 every 的每个窗口是否恰好由整数个汇总窗口组成"""
+    if rollup == "1mo":
+        return bool(_CALENDAR_WINDOW.match(every))
+    if rollup == "1d":
+        if _CALENDAR_WINDOW.match(every):
+            return True
+        window = parse_duration(every)
+        return window is not None and window.total_seconds() > 0 and window.total_seconds() % _DAY_SECONDS == 0
+    return False
+
+
+def _aligned_time(value, rollup: str) -> Optional[datetime]:
+    """
+    返回落在汇总窗口边界（UTC 零点，1mo 时还需是每月第一天）上的绝对时间
+
+    now() 和相对时长（如 -400d）随查询时刻变化，不视为对齐。
+
+    Returns:
+        对齐时返回解析后的时间，否则返回 None
+    """
+    text = str(value).strip()
+    if text == "now()" or parse_duration(text) is not None:
+        return None
+    parsed = parse_flux_time(text)
+    if parsed is None or (parsed.hour, parsed.minute, parsed.second, parsed.microsecond) != (0, 0, 0, 0):
+        return None
+    if rollup == "1mo" and parsed.day != 1:
+        return None
+    return parsed
+
+
+def select_rollup(every: Optional[str], agg_fn: str, start_time, end_time, windows: List[str] = ROLLUP_WINDOWS) -> Optional[str]:
+    """
+    为聚合查询选择可以代替原始数据的最粗汇总窗口
+
+    只有聚合函数有对应的统计量、聚合窗口由整数个汇总窗口组成、查询范围
+    不短于汇总窗口、且开始和结束时间都是对齐到汇总窗口边界的绝对时间时才使用
+    汇总表。汇总点的时间戳为窗口开始时间，未对齐时第一个窗口会丢失范围开始前的
+    部分、最后一个窗口会包含结束时间之后的数据，结果与按原始数据聚合不同。
+    汇总表上的聚合方式见 build_rollup_aggregation。
+
+    Args:
+        every: 查询的聚合窗口，None 表示查询原始数据
+        agg_fn: 聚合函数
+        start_time: 查询开始时间
+        end_time: 查询结束时间
+        windows: 可用的汇总窗口，从粗到细排列
+
+    Returns:
+        汇总窗口（如 "1mo"、"1d"），不能使用汇总表时返回 None
+    """
+    if not every or agg_fn not in ROLLUP_STATS:
+        return None
+
+    for rollup in windows:
+        window = parse_duration(rollup)
+        start, end = _aligned_time(start_time, rollup), _aligned_time(end_time, rollup)
+        if window is None or start is None or end is None:
+            continue
+        if (end - start).total_seconds() >= window.total_seconds() and _window_fits(every, rollup):
+            return rollup
+    return None
+
+
+def build_rollup_aggregation(every: str, agg_fn: str) -> List[str]:
+    """
+    构建在汇总表上按窗口聚合的Flux语句片段，代替原始数据上的 aggregateWindow
+
+    最小值、最大值取各汇总点的最小值、最大值；计数为各汇总点计数之和；平均值按
+    各汇总点的记录数加权，sum(mean * count) / sum(count)，与直接按原始数据求
+    平均值的结果相同，不会让数据较少的日、月与完整的日、月权重相同。结果时间戳
+    与 aggregateWindow 一致，为窗口结束时间。
+
+    Args:
+        every: 聚合窗口，应由整数个汇总窗口组成（见 select_rollup）
+        agg_fn: 聚合函数，ROLLUP_STATS 之一
+
+    Returns:
+        Flux语句片段，接在汇总表的 range/filter 之后
+    """
+    if agg_fn != "mean":
+        return [
+            f'|> filter(fn: (r) => r.stat == "{agg_fn}")',
+            '|> drop(columns: ["stat"])',
+            f'|> aggregateWindow(every: {every}, fn: {"sum" if agg_fn == "count" else agg_fn}, createEmpty: false)',
+        ]
+    return [
+        '|> filter(fn: (r) => r.stat == "mean" or r.stat == "count")',
+        '|> pivot(rowKey: ["_time"], columnKey: ["stat"], valueColumn: "_value")',
+        f'|> window(every: {every}, createEmpty: false)',
+        '|> reduce(identity: {total: 0.0, count: 0.0}, fn: (r, accumulator) => ({total: accumulator.total + r.mean * r.count, count: accumulator.count + r.count}))',
+        '|> map(fn: (r) => ({r with _value: r.total / r.count}))',
+        '|> drop(columns: ["total", "count"])',
+        '|> duplicate(column: "_stop", as: "_time")',
+        '|> window(every: inf)',
+    ]
@@ -0,0 +1,195 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from typing import Dict, NamedTuple, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from backend.app.config import STATIC_BROTLI_QUALITY, STATIC_GZIP_LEVEL, STATIC_IMMUTABLE_MAX_AGE, STATIC_MIN_COMPRESS_BYTES
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只提供 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 值得压缩的文本类型；图片、字体等本身已压缩的文件原样提供
+_COMPRESSIBLE = re.compile(r"^(text/|application/(javascript|json|xml)|image/svg\+xml)")
+# 按偏好排列的内容编码
+_ENCODINGS = ("br", "gzip")
+
+# HTML 页面每次都向服务端确认（内容未变时只返回 304）
+CACHE_REVALIDATE = "no-cache"
+
+
+class StaticAsset(NamedTuple):
+    """加载到内存中的静态文件，每种内容编码一份预先压缩好的数据"""
+    media_type: str
+    digest: str
+    variants: Dict[str, bytes]
+
+    def etag(self, encoding: str) -> str:
+        # 不同编码是不同的表示，ETag 需要不同；重新验证时按 digest 比较
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    """解析 Accept-Encoding，返回客户端接受（q > 0）的编码"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _matches(if_none_match: str, digest: str) -> bool:
+    """If-None-Match 中任一 ETag（忽略弱标记和编码后缀）与 digest 相同时返回 True"""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag == digest or tag.split("-", 1)[0] == digest:
+            return True
+    return False
+
+
+class StaticAssetStore:
+    """
+    内存中的前端静态文件
+
+    启动时一次性读取目录下的所有文件，对文本类文件预先做 gzip（安装了 brotli
+    时还有 br）压缩，之后的请求不再读磁盘也不再压缩，按 Accept-Encoding 直接返回
+    对应的字节。每个文件以内容摘要作为 ETag，客户端携带 If-None-Match 重新验证时
+    返回 304。
+
+    HTML 中引用的 /static/ 路径会被改写为带内容摘要的地址（如 /static/app.js?v=1a2b），
+    带正确摘要的请求可以被浏览器长期缓存（immutable），文件内容变化后摘要随之变化，
+    页面会引用新的地址；HTML 本身每次都重新验证。
+    """
+
+    def __init__(self, directory: str, prefix: str = "/static/"):
+        """
+        Args:
+            directory: 前端文件目录
+            prefix: 静态文件的URL前缀，用于改写HTML中的引用
+        """
+        self.directory = str(directory)
+        self.prefix = prefix
+        self._assets: Dict[str, StaticAsset] = {}
+
+    def __len__(self) -> int:
+        return len(self._assets)
+
+    def load(self):
+        """读取并压缩目录中的所有文件，HTML 在其引用的文件之后处理"""
+        assets = {}
+        paths = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                full_path = os.path.join(root, name)
+                paths.append(os.path.relpath(full_path, self.directory).replace(os.sep, "/"))
+        paths.sort(key=lambda path: (path.endswith(".html"), path))
+
+        for path in paths:
+            with open(os.path.join(self.directory, path), "rb") as f:
+                content = f.read()
+            if path.endswith(".html"):
+                content = self._version_references(content, assets)
+            assets[path] = self._build(path, content)
+
+        self._assets = assets
+        raw = sum(len(asset.variants["identity"]) for asset in assets.values())
+        compressed = sum(min(len(data) for data in asset.variants.values()) for asset in assets.values())
+        logger.info(f"已加载 {len(assets)} 个静态文件: 原始 {raw} 字节，压缩后 {compressed} 字节，可用编码: {self.encodings()}")
+
+    @staticmethod
+    def encodings() -> tuple:
+        """返回当前环境可用的压缩编码"""
+        return _ENCODINGS if brotli is not None else ("gzip",)
+
+    def _build(self, path: str, content: bytes) -> StaticAsset:
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type == "application/javascript":
+            media_type += "; charset=utf-8"
+        variants = {"identity": content}
+        if len(content) >= STATIC_MIN_COMPRESS_BYTES and _COMPRESSIBLE.match(media_type):
+            candidates = {"gzip": gzip.compress(content, compresslevel=STATIC_GZIP_LEVEL, mtime=0)}
+            if brotli is not None:
+                candidates["br"] = brotli.compress(content, quality=STATIC_BROTLI_QUALITY)
+            variants.update({encoding: data for encoding, data in candidates.items() if len(data) < len(content)})
+        return StaticAsset(media_type, hashlib.blake2b(content, digest_size=8).hexdigest(), variants)
+
+    def _version_references(self, content: bytes, assets: Dict[str, StaticAsset]) -> bytes:
+        """把HTML中对已加载文件的引用改写为带内容摘要的地址"""
+        text = content.decode("utf-8")
+
+        def replace(match):
+            path = match.group(2)
+            asset = assets.get(path)
+            if asset is None:
+                return match.group(0)
+            return f"{match.group(1)}{self.prefix}{path}?v={asset.digest}{match.group(3)}"
+
+        text = re.sub(rf'(["\']){re.escape(self.prefix)}([^"\'?#]+)(["\'])', replace, text)
+        return text.encode("utf-8")
+
+    def respond(self, path: str, headers: Headers, version: Optional[str] = None) -> Optional[Response]:
+        """
+        构建静态文件的响应
+
+        Args:
+            path: 相对于前端目录的路径
+            headers: 请求头
+            version: 请求中的 v 参数，与文件摘要一致时允许长期缓存
+
+        Returns:
+            200 或 304 响应，文件不存在时返回 None
+        """
+        asset = self._assets.get(path)
+        if asset is None:
+            return None
+
+        if version is not None and version == asset.digest:
+            cache_control = f"public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            cache_control = CACHE_REVALIDATE
+
+        accepted = _accepted_encodings(headers.get("accept-encoding", ""))
+        encoding = next((name for name in _ENCODINGS if name in accepted and name in asset.variants), "identity")
+        response_headers = {
+            "ETag": asset.etag(encoding),
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and _matches(if_none_match, asset.digest):
+            return Response(status_code=304, headers=response_headers)
+
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        return Response(asset.variants[encoding], headers=response_headers, media_type=asset.media_type)
+
+    def stats(self) -> dict:
+        """返回静态文件统计信息"""
+        return {
+            "files": len(self._assets),
+            "bytes": sum(len(data) for asset in self._assets.values() for data in asset.variants.values()),
+            "encodings": list(self.encodings()),
+        }
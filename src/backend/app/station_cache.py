@@ -0,0 +1,187 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from backend.app.influx_client import InfluxDBManager
+from backend.app.playback_cache import ColumnarCache
+
+logger = logging.getLogger(__name__)
+
+
+def _format_time(epoch: int) -> str:
+    """Unix 秒转换为 Flux 使用的 RFC3339 时间"""
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class StationCacheRegistry:
+    """
+    按 (站点, 时间窗口) 分段加载、所有播放会话共享的列式播放缓存
+
+    播放范围 [start, end) 按 window_seconds 切分为固定窗口，每个站点的每个
+    窗口是一个独立的不可变数据段。播放会话通过 pin/unpin 对数据段做引用计数：
+    会话固定当前窗口及之后 prefetch 个窗口，固定时在后台加载，引用计数归零时
+    立即释放。多个会话播放到同一窗口时共用同一份数据，内存只与被固定的数据段
+    数量有关，与会话数和播放范围的长短无关。同一数据段的并发加载只会发出一次查询。
+    """
+
+    def __init__(
+        self,
+        influx_manager: InfluxDBManager,
+        start: int,
+        end: int,
+        window_seconds: int,
+        prefetch: int = 1,
+        limit: int = None,
+    ):
+        """
+        Args:
+            influx_manager: InfluxDB管理器
+            start: 播放范围的开始时间（Unix 秒）
+            end: 播放范围的结束时间（Unix 秒，不含）
+            window_seconds: 每个数据段覆盖的秒数
+            prefetch: 当前窗口之后预取的窗口数
+            limit: 每个数据段最多加载的行数
+        """
+        self.influx_manager = influx_manager
+        self.start = start
+        self.end = end
+        self.window_seconds = window_seconds
+        self.prefetch = prefetch
+        self.limit = limit
+        self._segments: Dict[Tuple[str, int], ColumnarCache] = {}
+        self._refs: Dict[Tuple[str, int], int] = {}
+        self._loading: Dict[Tuple[str, int], asyncio.Task] = {}
+        # ensure 时数据段已加载（命中）或需要等待加载（未命中）的次数
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._segments)
+
+    def window_start(self, at: int) -> int:
+        """返回时间 at 所在窗口的开始时间"""
+        return self.start + (at - self.start) // self.window_seconds * self.window_seconds
+
+    def window_end(self, at: int) -> int:
+        """返回时间 at 所在窗口的结束时间，不超过播放范围"""
+        return min(self.window_start(at) + self.window_seconds, self.end)
+
+    def _next_window(self, window: int) -> int:
+        """返回下一个窗口的开始时间，到达播放范围末尾时回到开头"""
+        window += self.window_seconds
+        return self.start if window >= self.end else window
+
+    def get(self, station_id: str, at: int) -> Optional[ColumnarCache]:
+        """返回时间 at 所在窗口已加载的数据段，未加载时返回 None"""
+        return self._segments.get((station_id, self.window_start(at)))
+
+    def _schedule(self, key: Tuple[str, int]) -> Optional[asyncio.Task]:
+        """为未加载的数据段创建加载任务，已加载时返回 None"""
+        if key in self._segments:
+            return None
+        task = self._loading.get(key)
+        if task is None:
+            task = self._loading[key] = asyncio.create_task(self._load(*key))
+            task.add_done_callback(self._log_failure)
+        return task
+
+    async def ensure(self, station_id: str, at: int) -> ColumnarCache:
+        """
+        确保站点在时间 at 所在窗口的数据段已加载
+
+        Args:
+            station_id: 站点ID
+            at: 播放时间（Unix 秒）
+
+        Returns:
+            该窗口的列式缓存
+        """
+        key = (station_id, self.window_start(at))
+        task = self._schedule(key)
+        if task is None:
+            self.hits += 1
+            return self._segments[key]
+        self.misses += 1
+        # 某个等待者被取消时不影响其他等待同一数据段的客户端
+        return await asyncio.shield(task)
+
+    def keys_for(self, station_ids: Iterable[str], at: int) -> Set[Tuple[str, int]]:
+        """
+        返回播放到时间 at 时需要固定的数据段：当前窗口及之后 prefetch 个窗口
+
+        Args:
+            station_ids: 站点ID
+            at: 播放时间（Unix 秒）
+        """
+        windows = [self.window_start(at)]
+        for _ in range(self.prefetch):
+            windows.append(self._next_window(windows[-1]))
+        return {(station_id, window) for station_id in station_ids for window in windows}
+
+    def pin(self, keys: Iterable[Tuple[str, int]]):
+        """增加数据段的引用计数，尚未加载的数据段在后台开始加载"""
+        for key in keys:
+            self._refs[key] = self._refs.get(key, 0) + 1
+            self._schedule(key)
+
+    def unpin(self, keys: Iterable[Tuple[str, int]]):
+        """减少数据段的引用计数，归零时释放数据段"""
+        for key in keys:
+            refs = self._refs.get(key, 0) - 1
+            if refs > 0:
+                self._refs[key] = refs
+            else:
+                self._refs.pop(key, None)
+                self._segments.pop(key, None)
+
+    async def _load(self, station_id: str, window: int) -> ColumnarCache:
+        try:
+            stop = min(window + self.window_seconds, self.end)
+            query = self.influx_manager.build_pivot_query(
+                start_time=_format_time(window),
+                end_time=_format_time(stop),
+                station_id=station_id,
+                limit=self.limit
+            )
+            frame = await self.influx_manager.query_frame_async(query)
+            cache = ColumnarCache.from_frame(frame)
+            # 加载期间所有引用都已释放时不再保留
+            if (station_id, window) in self._refs:
+                self._segments[(station_id, window)] = cache
+            logger.debug(f"站点 {station_id} 加载窗口 {_format_time(window)}: {len(cache)} 条数据，{cache.nbytes} 字节")
+            return cache
+        finally:
+            self._loading.pop((station_id, window), None)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        # 预取任务可能没有等待者，在这里取出异常，避免 "exception was never retrieved"
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"数据段加载失败: {task.exception()}")
+
+    def windows(self, segments: Dict[str, ColumnarCache], start: int, stop: int) -> Dict[str, ColumnarCache]:
+        """
+        取出各数据段在 [start, stop) 时间范围内的视图
+
+        Args:
+            segments: 站点ID到数据段的映射
+            start: 起始时间（Unix 秒）
+            stop: 结束时间（Unix 秒，不含），不应超过 start 所在窗口的结束时间
+        """
+        return {station_id: segment.time_slice(start, stop) for station_id, segment in segments.items()}
+
+    def stats(self) -> dict:
+        """返回缓存统计信息"""
+        return {
+            "window_seconds": self.window_seconds,
+            "prefetch": self.prefetch,
+            "segments": len(self._segments),
+            "pins": sum(self._refs.values()),
+            "stations": sorted({station_id for station_id, _ in self._segments}),
+            "rows": sum(len(cache) for cache in self._segments.values()),
+            "bytes": sum(cache.nbytes for cache in self._segments.values()),
+            "loading": len(self._loading),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
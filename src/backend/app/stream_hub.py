@@ -0,0 +1,305 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+from backend.app.config import CLIENT_QUEUE_SIZE, SLOW_CLIENT_POLICY
+from backend.app.columnar_frames import ColumnarEncoder, gather_rows
+from backend.app.frames import ENCODING_JSON, FORMAT_COLUMNAR, FORMAT_RECORDS, Frame, encode_frame
+from backend.app.metrics import STREAM_PUBLISH_DURATION, WS_BYTES_SENT, WS_FRAMES_SENT, WS_SEND_DURATION
+from backend.app.playback_cache import ColumnarCache
+
+logger = logging.getLogger(__name__)
+
+# 慢客户端处理策略
+POLICY_DROP_OLDEST = "drop_oldest"  # 队列满时丢弃积压的数据帧，保留控制消息
+POLICY_DISCONNECT = "disconnect"  # 队列满时断开该客户端
+SLOW_CLIENT_POLICIES = (POLICY_DROP_OLDEST, POLICY_DISCONNECT)
+
+# 通知发送任务结束的哨兵
+_CLOSE = object()
+
+# 因处理过慢被断开时使用的关闭码（Policy Violation）
+SLOW_CLIENT_CLOSE_CODE = 1008
+
+
+class Subscriber:
+    """
+    单个WebSocket客户端的订阅，持有一个有界的发送队列
+
+    stations 为订阅的站点，fields 为需要的字段（None 表示全部字段），
+    frame_format 为数据帧格式（records 或 columnar），needs_key_frame 为 True 时
+    下一个 columnar 帧发送关键帧而不是差分帧，session_id 为该客户端跟随的播放会话，client_id 为进程内唯一的客户端编号。
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        queue_size: int,
+        encoding: str = ENCODING_JSON,
+        stations: Tuple[str, ...] = (),
+        fields: Optional[Tuple[str, ...]] = None,
+        session_id: Optional[str] = None,
+        client_id: int = 0,
+        frame_format: str = FORMAT_RECORDS,
+    ):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.encoding = encoding
+        self.frame_format = frame_format
+        self.session_id = session_id
+        self.stations = stations
+        self.fields = fields
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.needs_key_frame = True
+        self.dropped = 0
+        self.closed = False
+
+
+class StreamHub:
+    """
+    数据流分发中心
+
+    每个播放会话每个节拍只调用一次 publish，传入各站点在本节拍内的数据。订阅内容
+    （站点、字段）、编码和帧格式都相同的客户端共用同一个不可变帧，每种组合只序列化一次。
+    帧被放入每个订阅者自己的有界队列，由各自的发送任务写入WebSocket。某个
+    客户端发送缓慢时只会填满它自己的队列，不会阻塞播放任务或其他客户端。
+    """
+
+    def __init__(self, queue_size: int = CLIENT_QUEUE_SIZE, slow_client_policy: str = SLOW_CLIENT_POLICY):
+        if slow_client_policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"未知的慢客户端策略: {slow_client_policy}，可选值: {SLOW_CLIENT_POLICIES}")
+        self.queue_size = queue_size
+        self.slow_client_policy = slow_client_policy
+        self.subscribers: Set[Subscriber] = set()
+        self._sessions: Dict[Optional[str], Set[Subscriber]] = {}
+        self.dropped_total = 0
+        self.disconnected_total = 0
+        self._client_ids = itertools.count(1)
+        # (会话, 站点, 字段) -> columnar 格式的跨帧差分状态
+        self._encoders: Dict[Tuple[Any, ...], ColumnarEncoder] = {}
+
+    def subscribe(
+        self,
+        websocket: WebSocket,
+        encoding: str = ENCODING_JSON,
+        stations: Iterable[str] = (),
+        fields: Optional[Iterable[str]] = None,
+        session_id: Optional[str] = None,
+        frame_format: str = FORMAT_RECORDS,
+    ) -> Subscriber:
+        """
+        注册新的订阅者
+
+        Args:
+            websocket: 客户端连接
+            encoding: 该客户端使用的帧编码
+            stations: 订阅的站点
+            fields: 需要的字段，None 表示全部字段
+            session_id: 跟随的播放会话
+            frame_format: 数据帧格式，records 或 columnar
+        """
+        subscriber = Subscriber(
+            websocket, self.queue_size, encoding,
+            session_id=session_id, client_id=next(self._client_ids), frame_format=frame_format,
+        )
+        self.update_subscription(subscriber, stations, fields)
+        self.subscribers.add(subscriber)
+        self._sessions.setdefault(session_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """移除订阅者"""
+        subscriber.closed = True
+        self.subscribers.discard(subscriber)
+        members = self._sessions.get(subscriber.session_id)
+        if members is not None:
+            members.discard(subscriber)
+            if not members:
+                del self._sessions[subscriber.session_id]
+
+    def session_subscribers(self, session_id: Optional[str]) -> Set[Subscriber]:
+        """跟随指定播放会话的订阅者"""
+        return self._sessions.get(session_id, set())
+
+    def update_subscription(self, subscriber: Subscriber, stations: Iterable[str], fields: Optional[Iterable[str]] = None):
+        """
+        修改订阅内容，下一个节拍起生效
+
+        站点和字段被规范化为有序元组，内容相同的订阅可以共用编码结果。
+        """
+        subscriber.stations = tuple(sorted(set(stations)))
+        subscriber.fields = None if fields is None else tuple(sorted(set(fields)))
+        # 换到另一个差分分组，需要从关键帧开始
+        subscriber.needs_key_frame = True
+
+    def subscribed_stations(self, session_id: Optional[str] = None) -> Set[str]:
+        """
+        订阅者订阅的站点并集
+
+        Args:
+            session_id: 只统计跟随该会话的订阅者，None 表示所有订阅者
+        """
+        subscribers = self.subscribers if session_id is None else self.session_subscribers(session_id)
+        stations = set()
+        for subscriber in subscribers:
+            stations.update(subscriber.stations)
+        return stations
+
+    def publish(self, windows: Dict[str, ColumnarCache], session_id: Optional[str] = None):
+        """
+        将本节拍的数据分发给所有订阅者，不会等待任何客户端
+
+        每个客户端只收到其订阅的站点和字段，多个站点的记录按时间合并。
+        每种（站点、字段、编码、帧格式）组合只序列化一次，序列化开销不随客户端数量增长；
+        订阅的站点在本节拍没有数据时不发送。columnar 格式按（会话、站点、字段）分组
+        保存跨帧差分状态，每组每节拍生成一次关键帧和差分帧，需要关键帧的客户端收到
+        关键帧，其余客户端收到差分帧。
+
+        Args:
+            windows: 站点ID到本节拍数据视图的映射
+            session_id: 只发给跟随该会话的订阅者，None 表示所有订阅者
+        """
+        started = time.perf_counter()
+        subscribers = self.subscribers if session_id is None else self.session_subscribers(session_id)
+        records: Dict[Tuple[str, Any], list] = {}
+        columnar = {}
+        frames: Dict[Tuple[Any, ...], Optional[Frame]] = {}
+        for subscriber in list(subscribers):
+            # 先腾出队列空间：丢帧后 columnar 客户端本节拍就要收到关键帧
+            if subscriber.queue.full() and not self._make_room(subscriber):
+                continue
+            if subscriber.frame_format == FORMAT_COLUMNAR:
+                group = (session_id, subscriber.stations, subscriber.fields)
+                if group not in columnar:
+                    rows = gather_rows(windows, subscriber.stations, subscriber.fields)
+                    encoder = self._encoders.setdefault(group, ColumnarEncoder())
+                    columnar[group] = None if rows is None else encoder.encode(rows)
+                if columnar[group] is None:
+                    continue
+                key_frame = subscriber.needs_key_frame
+                key = group + (subscriber.encoding, key_frame)
+                if key not in frames:
+                    batch = columnar[group].key if key_frame else columnar[group].delta
+                    frames[key] = encode_frame(batch, subscriber.encoding, compact=True)
+                subscriber.needs_key_frame = False
+            else:
+                key = (subscriber.stations, subscriber.fields, subscriber.encoding)
+                if key not in frames:
+                    batch = []
+                    for station_id in subscriber.stations:
+                        window = windows.get(station_id)
+                        if window is None or not len(window):
+                            continue
+                        station_key = (station_id, subscriber.fields)
+                        if station_key not in records:
+                            records[station_key] = window.to_records(subscriber.fields)
+                        batch.extend(records[station_key])
+                    if len(subscriber.stations) > 1:
+                        batch.sort(key=lambda record: record["timestamp"])
+                    frames[key] = encode_frame(batch, subscriber.encoding) if batch else None
+
+            frame = frames[key]
+            if frame is not None:
+                subscriber.queue.put_nowait(frame)
+
+        # 本会话已没有订阅者的分组不再需要差分状态
+        for group in [group for group in self._encoders if group[0] == session_id and group not in columnar]:
+            del self._encoders[group]
+        STREAM_PUBLISH_DURATION.observe(time.perf_counter() - started)
+
+    def send_control(self, subscriber: Subscriber, message: Dict[str, Any]):
+        """
+        向单个订阅者发送控制消息（如订阅确认、错误提示）
+
+        控制消息与数据帧走同一个队列，保证同一连接只有一个写入方。控制消息
+        不会因客户端积压被丢弃。
+        """
+        if subscriber.closed:
+            return
+        if subscriber.queue.full() and not self._make_room(subscriber):
+            return
+        subscriber.queue.put_nowait(encode_frame(message, subscriber.encoding)._replace(control=True))
+
+    def _make_room(self, subscriber: Subscriber) -> bool:
+        """
+        按配置的策略处理队列已满的订阅者
+
+        drop_oldest 策略丢弃队列中积压的全部数据帧，保留控制消息的顺序。积压的
+        columnar 差分帧都基于客户端没有收到的帧，保留任何一个都会让客户端显示
+        过时的值，因此全部丢弃，并让下一个 columnar 帧为关键帧。队列中只剩控制
+        消息、无法腾出空间时按 disconnect 处理。
+
+        Returns:
+            队列有了空间时返回 True，订阅者被断开时返回 False
+        """
+        if self.slow_client_policy == POLICY_DROP_OLDEST:
+            pending = []
+            while not subscriber.queue.empty():
+                pending.append(subscriber.queue.get_nowait())
+            controls = [frame for frame in pending if frame.control]
+            for frame in controls:
+                subscriber.queue.put_nowait(frame)
+            dropped = len(pending) - len(controls)
+            if dropped:
+                first = subscriber.dropped == 0
+                crossed = subscriber.dropped // 100 != (subscriber.dropped + dropped) // 100
+                subscriber.dropped += dropped
+                subscriber.needs_key_frame = True
+                self.dropped_total += dropped
+                if first or crossed:
+                    logger.warning(f"客户端处理过慢，已丢弃 {subscriber.dropped} 个批次")
+                return True
+
+        logger.warning("客户端处理过慢，按策略断开连接")
+        self.disconnected_total += 1
+        self.unsubscribe(subscriber)
+        # 清空积压的帧，让发送任务尽快看到结束标记
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(_CLOSE)
+        return False
+
+    async def pump(self, subscriber: Subscriber):
+        """
+        订阅者的发送循环：从队列中取出已编码的帧并写入WebSocket
+
+        Args:
+            subscriber: 订阅者
+        """
+        websocket = subscriber.websocket
+        send_duration = WS_SEND_DURATION.labels(subscriber.encoding)
+        frames_sent = WS_FRAMES_SENT.labels(subscriber.encoding)
+        bytes_sent = WS_BYTES_SENT.labels(subscriber.encoding)
+        try:
+            while True:
+                frame = await subscriber.queue.get()
+                if frame is _CLOSE:
+                    await websocket.close(code=SLOW_CLIENT_CLOSE_CODE)
+                    return
+                started = time.perf_counter()
+                if frame.binary:
+                    await websocket.send_bytes(frame.payload)
+                else:
+                    await websocket.send_text(frame.payload)
+                send_duration.observe(time.perf_counter() - started)
+                frames_sent.inc()
+                # JSON 帧为 ASCII 文本，字符数即字节数
+                bytes_sent.inc(len(frame.payload))
+        except Exception as e:
+            # 连接已断开或发送失败，由调用方负责清理
+            logger.debug(f"发送循环结束: {e}")
+
+    def stats(self) -> dict:
+        """返回分发统计信息"""
+        return {
+            "subscribers": len(self.subscribers),
+            "sessions": len(self._sessions),
+            "queue_size": self.queue_size,
+            "slow_client_policy": self.slow_client_policy,
+            "dropped_batches": self.dropped_total,
+            "disconnected_slow_clients": self.disconnected_total,
+        }
@@ -0,0 +1,90 @@
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+# Flux 时长单位对应的秒数，mo 和 y 按 30 天和 365 天近似
+_DURATION_UNITS = {
+    "ns": 1e-9,
+    "us": 1e-6,
+    "ms": 1e-3,
+    "s": 1,
+    "m": 60,
+    "h": 3600,
+    "d": 86400,
+    "w": 7 * 86400,
+    "mo": 30 * 86400,
+    "y": 365 * 86400,
+}
+_DURATION_PART = re.compile(r"(\d+)(ns|us|ms|mo|s|m|h|d|w|y)")
+
+
+def parse_duration(value: str) -> Optional[timedelta]:
+    """
+    解析 Flux 时长字面量，如 "1h"、"30d"、"1h30m"，可带负号
+
+    Returns:
+        对应的 timedelta，无法解析时返回 None
+    """
+    text = value.strip()
+    sign = -1 if text.startswith("-") else 1
+    text = text.lstrip("+-")
+    parts = _DURATION_PART.findall(text)
+    if not parts or "".join(number + unit for number, unit in parts) != text:
+        return None
+    seconds = sum(int(number) * _DURATION_UNITS[unit] for number, unit in parts)
+    return timedelta(seconds=sign * seconds)
+
+
+def is_relative_time(value) -> bool:
+    """判断时间参数是否相对于当前时间（now() 或时长）"""
+    if value is None:
+        return False
+    text = str(value).strip()
+    return text == "now()" or parse_duration(text) is not None
+
+
+def parse_flux_time(value, now: datetime = None) -> Optional[datetime]:
+    """
+    将查询接口接受的时间参数解析为带时区的 datetime
+
+    支持 "now()"、相对时长（如 "-1h"）和 RFC3339 时间。
+
+    Returns:
+        UTC datetime，无法解析时返回 None
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+    text = str(value).strip()
+    now = now or datetime.now(timezone.utc)
+    if text == "now()":
+        return now
+
+    duration = parse_duration(text)
+    if duration is not None:
+        return now + duration
+
+    try:
+        parsed = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def normalize_flux_time(value) -> str:
+    """
+    规范化时间参数：绝对时间统一为 UTC 的 RFC3339 字符串，相对时间保持原样
+
+    用于构造缓存键，使同一时刻的不同写法命中同一条缓存。
+    """
+    text = str(value).strip()
+    if is_relative_time(text):
+        return text
+    parsed = parse_flux_time(text)
+    if parsed is None:
+        return text
+    return parsed.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
@@ -3,18 +3,42 @@
 Air Quality Platform - 数据导入脚本
 使用方法:
     python init_data.py
+    python init_data.py --workers 4
+    python init_data.py --rollups-only
+    python init_data.py --metrics-file /var/lib/node_exporter/textfile/air_quality_import.prom
 """
+import argparse
 import os
 from backend.app.data_importer import DataImporter
-from backend.app.config import PROJECT_DIR
+from backend.app.metrics import REGISTRY
+from backend.app.config import PROJECT_DIR, IMPORT_CHUNK_SIZE, IMPORT_WORKERS
 
 import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="导入CSV数据到InfluxDB")
+    parser.add_argument("--workers", type=int, default=IMPORT_WORKERS, help="并行解析文件的工作进程数")
+    parser.add_argument("--chunksize", type=int, default=IMPORT_CHUNK_SIZE, help="流式读取CSV时每块的行数")
+    parser.add_argument("--rollups-only", action="store_true", help="不导入数据，按已有数据的实际时间范围重新计算日、月汇总表")
+    parser.add_argument("--metrics-file", help="导入结束后把导入速率等指标以 Prometheus 文本格式写入该文件")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     importer = DataImporter()
 
+    if args.rollups_only:
+        time_range = importer.influx_manager.data_time_range("air_quality")
+        if time_range is None:
+            logger.warning("没有已导入的数据，无需计算汇总表")
+        else:
+            logger.info(f"重新计算汇总表: {time_range[0].isoformat()} ~ {time_range[1].isoformat()}")
+            importer.influx_manager.build_rollups(*time_range, "air_quality")
+        importer.close()
+        return
+
     data_paths = [
         {
             'path': PROJECT_DIR / "data" / "stations_data_gz",
@@ -25,14 +49,17 @@ def main():
         if os.path.exists(data_info['path']):
             logger.info(f"开始导入数据集: {data_info['path']}")
             if os.path.isdir(data_info['path']):
-                importer.import_directory(data_info['path'], data_info['measurement'])
+                importer.import_directory(data_info['path'], data_info['measurement'], workers=args.workers, chunksize=args.chunksize)
             else:
-                importer.import_csv(data_info['path'], data_info['measurement'])
+                importer.import_csv(data_info['path'], data_info['measurement'], chunksize=args.chunksize)
         else:
             logger.warning(f"数据路径不存在: {data_info['path']}")
 
     importer.close()
+    if args.metrics_file:
+        REGISTRY.write_textfile(args.metrics_file)
+        logger.info(f"导入指标已写入: {args.metrics_file}")
     logger.info("所有数据导入完成！")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
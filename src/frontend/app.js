@@ -8,18 +8,64 @@ let pm25Chart = null;
 let pm10Chart = null;
 let coChart = null;
 
-// 数据缓存
-let timeData = [];
-let pm25Data = [];
-let pm10Data = [];
-let coData = [];
-let aqiData = [];
-let tempData = [];
-let humidityData = [];
-
 // 最大显示点数
 const MAX_POINTS = 100;
 
+// 固定容量的环形缓冲区，写满后覆盖最旧的数据，写入为 O(1)
+// 数值序列使用 Float64Array，时间标签等非数值序列传入 Array
+class RingBuffer {
+    constructor(capacity, ArrayType = Float64Array) {
+        this.capacity = capacity;
+        this.values = new ArrayType(capacity);
+        this.start = 0;
+        this.length = 0;
+    }
+
+    push(value) {
+        const index = (this.start + this.length) % this.capacity;
+        this.values[index] = value;
+        if (this.length < this.capacity) {
+            this.length++;
+        } else {
+            this.start = (this.start + 1) % this.capacity;
+        }
+    }
+
+    clear() {
+        this.start = 0;
+        this.length = 0;
+    }
+
+    // 按写入顺序（从旧到新）返回普通数组，供图表使用
+    toArray() {
+        const result = new Array(this.length);
+        for (let i = 0; i < this.length; i++) {
+            result[i] = this.values[(this.start + i) % this.capacity];
+        }
+        return result;
+    }
+}
+
+// 数据缓存
+const timeData = new RingBuffer(MAX_POINTS, Array);
+const pm25Data = new RingBuffer(MAX_POINTS);
+const pm10Data = new RingBuffer(MAX_POINTS);
+const coData = new RingBuffer(MAX_POINTS);
+const aqiData = new RingBuffer(MAX_POINTS);
+const tempData = new RingBuffer(MAX_POINTS);
+const humidityData = new RingBuffer(MAX_POINTS);
+const seriesBuffers = [timeData, pm25Data, pm10Data, coData, aqiData, tempData, humidityData];
+
+// 最新一条记录和待执行的渲染；无论收到多少条记录，每个动画帧最多渲染一次
+let latestRecord = {};
+let renderPending = false;
+
+// 列式数据帧中的站点以下标表示，对应最近一次订阅确认消息中的站点和城市
+let subscribedStations = [];
+let stationCities = {};
+// 每个站点在上一帧结束时的字段值，差分帧中未出现的字段沿用这里的值
+let stationValues = {};
+
 // 初始化
 document.addEventListener('DOMContentLoaded', function() {
     // 初始化图表
@@ -65,7 +111,7 @@ function initCharts() {
         xAxis: {
             type: 'category',
             boundaryGap: false,
-            data: timeData,
+            data: timeData.toArray(),
             axisLine: {
                 lineStyle: {
                     color: '#667eea'
@@ -97,7 +143,7 @@ function initCharts() {
             areaStyle: {
                 color: 'rgba(255, 107, 107, 0.1)'
             },
-            data: pm25Data
+            data: pm25Data.toArray()
         }]
     });
 
@@ -123,7 +169,7 @@ function initCharts() {
         xAxis: {
             type: 'category',
             boundaryGap: false,
-            data: timeData,
+            data: timeData.toArray(),
             axisLine: {
                 lineStyle: {
                     color: '#667eea'
@@ -155,7 +201,7 @@ function initCharts() {
             areaStyle: {
                 color: 'rgba(78, 205, 196, 0.1)'
             },
-            data: pm10Data
+            data: pm10Data.toArray()
         }]
     });
 
@@ -181,7 +227,7 @@ function initCharts() {
         xAxis: {
             type: 'category',
             boundaryGap: false,
-            data: timeData,
+            data: timeData.toArray(),
             axisLine: {
                 lineStyle: {
                     color: '#667eea'
@@ -213,7 +259,7 @@ function initCharts() {
             areaStyle: {
                 color: 'rgba(69, 183, 209, 0.1)'
             },
-            data: coData
+            data: coData.toArray()
         }]
     });
 }
@@ -225,7 +271,7 @@ function connectWebSocket() {
 
     if (!isConnected) {
         try {
-            socket = new WebSocket('ws://localhost:8000/ws/stream');
+            socket = new WebSocket('ws://localhost:8000/ws/stream?format=columnar');
 
             socket.onopen = function() {
                 isConnected = true;
@@ -242,8 +288,15 @@ function connectWebSocket() {
 
             socket.onmessage = function(event) {
                 const data = JSON.parse(event.data);
-                // 数据是数组格式，需要处理每个记录
-                if (data && Array.isArray(data)) {
+                if (data && data.type === 'subscribed') {
+                    subscribedStations = data.stations;
+                    stationCities = data.cities || {};
+                } else if (data && data.type === 'columns') {
+                    decodeColumnarFrame(data).forEach(record => {
+                        processData(record);
+                    });
+                } else if (data && Array.isArray(data)) {
+                    // 记录数组格式，需要处理每个记录
                     data.forEach(record => {
                         processData(record);
                     });
@@ -283,55 +336,90 @@ function connectWebSocket() {
     }
 }
 
-// 处理接收到的数据
+// 把列式数据帧还原为记录数组
+// 帧格式: n 条记录（省略时为 1），t0 为第一条的 Unix 秒，dt 为相邻记录的秒数差，
+// s 为站点下标（省略时为 0），f 为各字段的数组（缺失为 null）；dt、s 和字段全部相同时只有一个值。
+// k 为 1 的关键帧包含全部字段；差分帧只包含有变化的字段，其余字段沿用该站点上一条记录的值
+function decodeColumnarFrame(frame) {
+    const records = [];
+    const count = frame.n || 1;
+    const dt = frame.dt;
+    const s = frame.s || 0;
+    const fields = Object.keys(frame.f);
+    let seconds = frame.t0;
+    for (let i = 0; i < count; i++) {
+        if (i > 0) {
+            seconds += Array.isArray(dt) ? dt[i - 1] : dt;
+        }
+        const stationId = subscribedStations[Array.isArray(s) ? s[i] : s];
+        const values = Object.assign({}, frame.k ? {} : stationValues[stationId]);
+        for (const field of fields) {
+            const column = frame.f[field];
+            const value = Array.isArray(column) ? column[i] : column;
+            if (value === null) {
+                delete values[field];
+            } else {
+                values[field] = value;
+            }
+        }
+        stationValues[stationId] = values;
+        records.push(Object.assign({
+            timestamp: new Date(seconds * 1000).toISOString(),
+            station_id: stationId,
+            city: stationCities[stationId] || 'unknown'
+        }, values));
+    }
+    return records;
+}
+
+// 处理接收到的数据，只写入缓冲区，图表和数值在下一个动画帧统一更新
 function processData(data) {
     if (!data || !data.timestamp) return;
 
-    // 添加数据到数组
     timeData.push(formatTime(data.timestamp));
     pm25Data.push(data.pm25 || 0);
     pm10Data.push(data.pm10 || 0);
     coData.push(data.co || 0);  // 使用 co 字段（一氧化碳）
-    aqiData.push(calculateAQI(data) || 0);  // 计算AQI
+    aqiData.push(data.aqi != null ? data.aqi : (calculateAQI(data) || 0));  // 优先使用服务端计算的AQI
     tempData.push(data.temperature || 0);
     humidityData.push(data.humidity || 0);
 
-    // 限制数据点数量
-    if (timeData.length > MAX_POINTS) {
-        timeData.shift();
-        pm25Data.shift();
-        pm10Data.shift();
-        coData.shift();
-        aqiData.shift();
-        tempData.shift();
-        humidityData.shift();
-    }
-
-    // 更新图表
-    updateCharts();
+    latestRecord = data;
+    scheduleRender();
+}
 
-    // 更新实时数据显示
-    updateRealTimeData(data);
+// 请求在下一个动画帧渲染，已有待执行的渲染时直接返回
+function scheduleRender() {
+    if (renderPending) return;
+    renderPending = true;
+    requestAnimationFrame(render);
+}
 
-    // 更新状态
+// 渲染自上一帧以来收到的所有数据
+function render() {
+    renderPending = false;
+    updateCharts();
+    updateRealTimeData(latestRecord);
     updateStatus();
 }
 
 // 更新图表
 function updateCharts() {
+    const times = timeData.toArray();
+
     pm25Chart.setOption({
-        xAxis: { data: timeData },
-        series: [{ data: pm25Data }]
+        xAxis: { data: times },
+        series: [{ data: pm25Data.toArray() }]
     });
 
     pm10Chart.setOption({
-        xAxis: { data: timeData },
-        series: [{ data: pm10Data }]
+        xAxis: { data: times },
+        series: [{ data: pm10Data.toArray() }]
     });
 
     coChart.setOption({
-        xAxis: { data: timeData },
-        series: [{ data: coData }]
+        xAxis: { data: times },
+        series: [{ data: coData.toArray() }]
     });
 }
 
@@ -388,17 +476,9 @@ function pauseStreaming() {
 function resetData() {
     if (!isConnected) return;
 
-    timeData = [];
-    pm25Data = [];
-    pm10Data = [];
-    coData = [];
-    aqiData = [];
-    tempData = [];
-    humidityData = [];
-
-    updateCharts();
-    updateRealTimeData({});
-    updateStatus();
+    seriesBuffers.forEach(buffer => buffer.clear());
+    latestRecord = {};
+    scheduleRender();
 
     fetch('/api/control/reset', { method: 'POST' })
         .then(response => response.json())
@@ -430,7 +510,7 @@ function formatTime(timestamp) {
     return date.toLocaleTimeString();
 }
 
-// 计算AQI（简化版本，主要基于PM2.5）
+// 计算AQI（简化版本，仅在服务端未提供 aqi 字段时使用）
 function calculateAQI(data) {
     const pm25 = data.pm25 || 0;
     const pm10 = data.pm10 || 0;
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+class FakeInfluxManager:
+    """
+    代替 InfluxDBManager 的播放数据源：每个站点每小时一条记录，pm25 为该小时的 Unix 秒除以 3600
+
+    queries 记录收到的查询 (站点, 开始时间, 结束时间)。
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def build_pivot_query(self, start_time, end_time, station_id=None, limit=None, **kwargs):
+        return station_id, start_time, end_time
+
+    async def query_frame_async(self, query):
+        self.queries.append(query)
+        station_id, start_time, end_time = query
+        times = pd.date_range(
+            datetime.fromisoformat(start_time.replace("Z", "+00:00")),
+            datetime.fromisoformat(end_time.replace("Z", "+00:00")),
+            freq="h", inclusive="left",
+        )
+        hours = (times - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(hours=1)
+        return pd.DataFrame({
+            "_time": times.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "station_id": station_id,
+            "city": "guangzhou",
+            "pm25": np.asarray(hours, dtype=np.float64),
+        })
+
+
+@pytest.fixture
+def fake_influx():
+    return FakeInfluxManager()
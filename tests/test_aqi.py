@@ -0,0 +1,36 @@
+import numpy as np
+
+from backend.app.aqi import BREAKPOINTS, IAQI_LEVELS, compute_aqi, fill_aqi, iaqi
+
+
+def test_iaqi_at_breakpoints_matches_levels():
+    for pollutant, breakpoints in BREAKPOINTS.items():
+        np.testing.assert_array_equal(iaqi(pollutant, breakpoints), IAQI_LEVELS)
+
+
+def test_iaqi_interpolates_and_rounds_up():
+    # PM2.5 35~75 对应 50~100：55 -> 75，56 -> 76.25 向上取整为 77
+    np.testing.assert_array_equal(iaqi("pm25", [55, 56]), [75, 77])
+    # 浮点误差不能让整数结果多进一位
+    np.testing.assert_array_equal(iaqi("so2", [650 + 150 * 0.2]), [160])
+
+
+def test_iaqi_caps_high_and_rejects_missing_or_negative():
+    result = iaqi("pm10", [10_000, np.nan, -1])
+    assert result[0] == 500
+    assert np.isnan(result[1:]).all()
+
+
+def test_compute_aqi_is_max_of_available_pollutants():
+    columns = {
+        "pm25": np.array([80.0, np.nan, np.nan]),
+        "o3": np.array([500.0, 100.0, np.nan]),
+    }
+    np.testing.assert_array_equal(compute_aqi(columns)[:2], [225, 32])
+    assert np.isnan(compute_aqi(columns)[2])
+    assert np.isnan(compute_aqi({"temperature": np.array([1.0])})).all()
+
+
+def test_fill_aqi_keeps_existing_values():
+    columns = {"pm25": np.array([80.0, 80.0])}
+    np.testing.assert_array_equal(fill_aqi(columns, np.array([42.0, np.nan])), [42, 107])
@@ -0,0 +1,83 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+from backend.app.columnar_frames import ColumnarEncoder, ColumnarRows, build_columnar_batch, gather_rows
+from backend.app.playback_cache import ColumnarCache
+
+T0 = 1398902400
+
+
+def rows(timestamps, stations, **columns):
+    return ColumnarRows(
+        np.array(timestamps, dtype=np.int64),
+        np.array(stations, dtype=np.int32),
+        {field: np.array(values, dtype=np.float64) for field, values in columns.items()},
+    )
+
+
+def test_batch_omits_defaults_and_collapses_constant_columns():
+    batch = build_columnar_batch(rows([T0], [0], pm25=[63.0], co=[np.nan]))
+    assert batch == {"type": "columns", "k": 1, "t0": T0, "f": {"pm25": 63}}
+
+    batch = build_columnar_batch(rows([T0, T0, T0 + 3600], [0, 1, 0], pm25=[63.5, np.nan, 70.5], co=[1.4, 1.4, 1.4]))
+    assert batch == {
+        "type": "columns", "k": 1, "n": 3, "t0": T0, "dt": [0, 3600], "s": [0, 1, 0],
+        "f": {"pm25": [63.5, None, 70.5], "co": 1.4},
+    }
+
+
+def test_gather_rows_merges_stations_in_time_order():
+    def window(station_id, hours, pm25):
+        return ColumnarCache.from_records(
+            [{"timestamp": datetime.fromtimestamp(T0 + hour * 3600, tz=timezone.utc), "station_id": station_id, "city": "guangzhou", "pm25": value}
+             for hour, value in zip(hours, pm25)],
+            fields=["pm25", "pm10"],
+        )
+
+    windows = {"1013": window("1013", [0, 2], [10, 30]), "1014": window("1014", [1], [20])}
+    merged = gather_rows(windows, ("1013", "1014", "1015"), ["pm25"])
+    assert merged.timestamps.tolist() == [T0, T0 + 3600, T0 + 7200]
+    assert merged.station_index.tolist() == [0, 1, 0]
+    assert list(merged.columns) == ["pm25"]
+    assert merged.columns["pm25"].tolist() == [10, 20, 30]
+    assert gather_rows(windows, ("1015",)) is None
+
+
+def test_encoder_sends_only_changed_fields_between_key_frames():
+    encoder = ColumnarEncoder(key_frame_interval=3)
+    frames = [
+        encoder.encode(rows([T0], [0], pm25=[10.0], pm10=[20.0])),
+        encoder.encode(rows([T0 + 3600], [0], pm25=[11.0], pm10=[20.0])),
+        encoder.encode(rows([T0 + 7200], [0], pm25=[11.0], pm10=[np.nan])),
+        encoder.encode(rows([T0 + 10800], [0], pm25=[11.0], pm10=[np.nan])),
+    ]
+
+    assert frames[0].delta is frames[0].key
+    assert frames[1].delta["f"] == {"pm25": 11}
+    assert "k" not in frames[1].delta
+    # 变为缺失的字段以 null 发送
+    assert frames[2].delta["f"] == {"pm10": None}
+    # 每 3 帧一个关键帧，关键帧不输出缺失的字段
+    assert frames[3].delta is frames[3].key
+    assert frames[3].key["f"] == {"pm25": 11}
+    # 关键帧总是完整的
+    assert frames[1].key["f"] == {"pm25": 11, "pm10": 20}
+
+
+def test_encoder_tracks_each_station_separately():
+    encoder = ColumnarEncoder()
+    encoder.encode(rows([T0, T0], [0, 1], pm25=[10.0, 50.0]))
+    # 两个站点的值对调：逐站点比较时都发生了变化
+    delta = encoder.encode(rows([T0 + 3600, T0 + 3600], [0, 1], pm25=[50.0, 10.0])).delta
+    assert delta["f"] == {"pm25": [50, 10]}
+
+    delta = encoder.encode(rows([T0 + 7200, T0 + 7200], [0, 1], pm25=[50.0, 10.0])).delta
+    assert delta["f"] == {}
+
+
+def test_encoder_detects_changes_within_a_frame():
+    encoder = ColumnarEncoder()
+    encoder.encode(rows([T0], [0], pm25=[10.0]))
+    delta = encoder.encode(rows([T0 + 3600, T0 + 7200], [0, 0], pm25=[10.0, 12.0])).delta
+    assert delta["f"] == {"pm25": [10, 12]}
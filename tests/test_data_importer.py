@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+from backend.app.data_importer import DataImporter
+
+
+def test_line_protocol_defaults_tags_skips_missing_values_and_adds_aqi():
+    importer = DataImporter(connect=False)
+    frame = pd.DataFrame({
+        "time": ["2015-01-01 00:00:00", "2015-01-01 01:00:00", "not a time"],
+        "station_id": ["1013", "1014", "1015"],
+        "PM25": [80.0, np.nan, 10.0],
+        "pm10": [np.nan, np.nan, 20.0],
+    })
+
+    lines = importer.convert_to_line_protocol(frame, importer.detect_columns(frame))
+
+    # 第二行没有任何字段，第三行时间无效
+    assert lines == ["air_quality,city=default_city,station_id=1013 aqi=107,pm25=80 1420070400000000000"]
@@ -0,0 +1,34 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.app.metrics import REGISTRY, MetricsMiddleware
+
+
+def make_client():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics-test/items/{item_id}")
+    def item(item_id: str):
+        return {"item": item_id}
+
+    return TestClient(app, root_path="/proxy")
+
+
+def test_requests_are_labelled_with_route_template():
+    client = make_client()
+    client.get("/metrics-test/items/1")
+    client.get("/metrics-test/items/2")
+
+    rendered = REGISTRY.render()
+    assert 'route="/metrics-test/items/{item_id}",status="200"} 2' in rendered
+    assert "/metrics-test/items/1" not in rendered
+
+
+def test_unmatched_requests_share_one_label():
+    client = make_client()
+    client.get("/metrics-test/missing")
+
+    rendered = REGISTRY.render()
+    assert 'route="unmatched",status="404"}' in rendered
+    assert 'route="/proxy"' not in rendered
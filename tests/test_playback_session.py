@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import pytest
+
+from backend.app.config import DEFAULT_STATION_ID
+from backend.app.playback_session import DEFAULT_SESSION_ID, SessionManager
+from backend.app.station_cache import StationCacheRegistry
+from backend.app.stream_hub import StreamHub
+
+START = 1398902400  # 2014-05-01T00:00:00Z
+DAY = 24 * 3600
+
+
+def make_manager(fake_influx, max_sessions=10):
+    hub = StreamHub()
+    registry = StationCacheRegistry(fake_influx, START, START + 30 * DAY, window_seconds=7 * DAY)
+    return hub, SessionManager(hub, registry, max_sessions=max_sessions)
+
+
+def test_joiner_keeps_private_session_alive_when_last_client_leaves(fake_influx):
+    async def scenario():
+        hub, sessions = make_manager(fake_influx)
+        session = sessions.create()
+        first = hub.subscribe(object(), stations=["1013"], session_id=session.session_id)
+
+        # 第二个客户端已取得会话，但还没有完成订阅时第一个客户端离开
+        joined = sessions.join(session.session_id)
+        hub.unsubscribe(first)
+        await sessions.release(session)
+        assert sessions.get(session.session_id) is joined
+        assert session.task is not None and not session.task.done()
+
+        second = hub.subscribe(object(), stations=["1013"], session_id=session.session_id)
+        hub.unsubscribe(second)
+        await sessions.release(joined)
+        assert sessions.get(session.session_id) is None
+        assert session.task is None
+        assert len(sessions) == 1
+        await sessions.close_all()
+
+    asyncio.run(scenario())
+
+
+def test_seek_without_subscribers_loads_default_station(fake_influx):
+    async def scenario():
+        hub, sessions = make_manager(fake_influx)
+        target = START + 10 * DAY + 1800
+        first = await sessions.default.seek(target)
+
+        assert first == target + 1800
+        assert sessions.default.registry.get(DEFAULT_STATION_ID, target) is not None
+        await sessions.close_all()
+
+    asyncio.run(scenario())
+
+
+def test_seek_without_subscribers_keeps_pinned_stations(fake_influx):
+    async def scenario():
+        hub, sessions = make_manager(fake_influx)
+        session = sessions.default
+        subscriber = hub.subscribe(object(), stations=["1014"], session_id=session.session_id)
+        await session.load(["1014"])
+        hub.unsubscribe(subscriber)
+
+        target = START + 20 * DAY
+        assert await session.seek(target) == target
+        assert {station_id for station_id, _ in session._pinned} == {"1014"}
+        await sessions.close_all()
+
+    asyncio.run(scenario())
+
+
+def test_session_limit_and_default_session_lifetime(fake_influx):
+    async def scenario():
+        hub, sessions = make_manager(fake_influx, max_sessions=2)
+        private = sessions.create()
+        assert sessions.create() is None
+        assert sessions.join("missing") is None
+
+        default = sessions.join(DEFAULT_SESSION_ID)
+        await sessions.release(default)
+        assert sessions.get(DEFAULT_SESSION_ID) is default
+
+        await sessions.release(private)
+        assert sessions.get(private.session_id) is None
+        assert sessions.create() is not None
+        await sessions.close_all()
+
+    asyncio.run(scenario())
+
+
+def test_speed_is_clamped_to_reachable_rate(fake_influx):
+    async def scenario():
+        hub, sessions = make_manager(fake_influx)
+        session = sessions.default
+        session.set_speed(session.min_speed / 10)
+        assert session.speed == session.min_speed
+        assert session.state()["data_rate"] == pytest.approx(session.registry.window_seconds * session.max_fps / 2)
+        with pytest.raises(ValueError):
+            session.set_speed(0)
+        await sessions.close_all()
+
+    asyncio.run(scenario())
+
+
+def test_playing_session_publishes_only_to_its_subscribers(fake_influx):
+    async def scenario():
+        hub, sessions = make_manager(fake_influx)
+        private = sessions.create()
+        default_subscriber = hub.subscribe(object(), stations=["1013"], session_id=DEFAULT_SESSION_ID)
+        private_subscriber = hub.subscribe(object(), stations=["1013"], session_id=private.session_id)
+        await private.load(["1013"])
+
+        private.set_speed(private.min_speed)
+        private.play()
+        frame = await asyncio.wait_for(private_subscriber.queue.get(), 1)
+        assert json.loads(frame.payload)[0]["pm25"] == START // 3600
+        assert default_subscriber.queue.empty()
+
+        hub.unsubscribe(private_subscriber)
+        await sessions.release(private)
+        await sessions.close_all()
+
+    asyncio.run(scenario())
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from backend.app import query_cache as query_cache_module
+from backend.app.influx_client import InfluxDBManager
+from backend.app.query_cache import QueryCache
+
+JAN = datetime(2015, 1, 1, tzinfo=timezone.utc)
+FEB = datetime(2015, 2, 1, tzinfo=timezone.utc)
+MAR = datetime(2015, 3, 1, tzinfo=timezone.utc)
+
+
+def put(cache, key, size=10, start=JAN, stop=FEB, open_ended=False, measurement="air_quality"):
+    cache.put(key, f"value-{key}", size, measurement, start, stop, open_ended)
+
+
+def test_lru_eviction_respects_byte_budget():
+    cache = QueryCache(max_bytes=25, ttl=None, max_age=None)
+    put(cache, "a")
+    put(cache, "b")
+    assert cache.get("a") == "value-a"
+    put(cache, "c")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "value-a"
+    assert cache.get("c") == "value-c"
+    assert cache.bytes == 20
+    assert cache.stats()["evictions"] == 1
+
+    put(cache, "huge", size=26)
+    assert cache.get("huge") is None
+
+
+def test_open_ended_results_use_ttl_and_history_uses_max_age(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache_module.time, "monotonic", lambda: now[0])
+    cache = QueryCache(ttl=30, max_age=600)
+    put(cache, "recent", open_ended=True)
+    put(cache, "history")
+
+    now[0] += 31
+    assert cache.get("recent") is None
+    assert cache.get("history") == "value-history"
+    now[0] += 600
+    assert cache.get("history") is None
+    assert cache.bytes == 0
+
+
+def test_invalidate_removes_only_overlapping_entries():
+    cache = QueryCache(ttl=None, max_age=None)
+    put(cache, "jan", start=JAN, stop=FEB)
+    put(cache, "feb", start=FEB, stop=MAR)
+    put(cache, "unbounded", start=None, stop=None)
+    put(cache, "other", measurement="air_quality_1d")
+
+    cache.invalidate("air_quality", datetime(2015, 2, 10, tzinfo=timezone.utc), datetime(2015, 2, 11, tzinfo=timezone.utc))
+
+    assert cache.get("jan") == "value-jan"
+    assert cache.get("feb") is None
+    assert cache.get("unbounded") is None
+    assert cache.get("other") == "value-other"
+    assert cache.stats()["invalidations"] == 2
+
+
+@pytest.fixture
+def manager():
+    manager = InfluxDBManager("http://localhost:1", "token", "org", "bucket")
+    yield manager
+    manager.close()
+
+
+def counting_query(manager, result=("table",), delay=0.05, error=None):
+    """替换 query_data，记录调用次数并模拟耗时的查询"""
+    calls = []
+    lock = threading.Lock()
+
+    def query_data(query):
+        with lock:
+            calls.append(query)
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return list(result)
+
+    manager.query_data = query_data
+    return calls
+
+
+HISTORY = {"start_time": "2015-01-01T00:00:00Z", "end_time": "2015-02-01T00:00:00Z", "station_id": "1013"}
+
+
+def test_concurrent_misses_share_one_query(manager):
+    calls = counting_query(manager)
+
+    async def scenario():
+        results = await asyncio.gather(*(manager.get_data_async(**HISTORY) for _ in range(10)))
+        cached = await manager.get_data_async(**HISTORY)
+        return results, cached
+
+    results, cached = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert cached is results[0]
+    assert manager._inflight == {}
+
+
+def test_failed_query_is_shared_but_not_cached(manager):
+    calls = counting_query(manager, error=RuntimeError("boom"))
+
+    async def scenario():
+        results = await asyncio.gather(*(manager.get_data_async(**HISTORY) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert manager._inflight == {}
+        with pytest.raises(RuntimeError):
+            await manager.get_data_async(**HISTORY)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert len(manager.query_cache) == 0
+
+
+def test_cancelled_caller_does_not_cancel_shared_query(manager):
+    calls = counting_query(manager, delay=0.2)
+
+    async def scenario():
+        first = asyncio.ensure_future(manager.get_data_async(**HISTORY))
+        second = asyncio.ensure_future(manager.get_data_async(**HISTORY))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == ["table"]
+    assert len(calls) == 1
+
+
+def test_encoded_results_are_cached_per_encode_key(manager):
+    calls = counting_query(manager)
+    encoded = []
+
+    def encode(result):
+        encoded.append(result)
+        return b"[" + b",".join(item.encode() for item in result) + b"]"
+
+    async def scenario():
+        bodies = await asyncio.gather(*(manager.get_data_async(**HISTORY, encode=encode, encode_key="json") for _ in range(3)))
+        again = await manager.get_data_async(**HISTORY, encode=encode, encode_key="json")
+        raw = await manager.get_data_async(**HISTORY)
+        return bodies, again, raw
+
+    bodies, again, raw = asyncio.run(scenario())
+    assert bodies == [b"[table]"] * 3
+    assert again == b"[table]"
+    assert raw == ["table"]
+    assert len(encoded) == 1
+    # 编码结果和原始结果是两个缓存项
+    assert len(calls) == 2
@@ -0,0 +1,35 @@
+from backend.app import config
+from backend.app.influx_client import InfluxDBManager
+from backend.app.rollups import build_rollup_aggregation, select_rollup
+
+
+def test_select_rollup_requires_aligned_absolute_bounds():
+    assert select_rollup("1mo", "mean", "2015-01-01T00:00:00Z", "2016-01-01T00:00:00Z") == "1mo"
+    assert select_rollup("1w", "max", "2015-01-05T00:00:00Z", "2015-03-02T00:00:00Z") == "1d"
+    assert select_rollup("1mo", "mean", "2015-01-15T00:00:00Z", "2016-01-01T00:00:00Z") == "1d"
+    assert select_rollup("1d", "mean", "2015-01-01T06:00:00Z", "2015-02-01T00:00:00Z") is None
+    assert select_rollup("1d", "mean", "-30d", "now()") is None
+    assert select_rollup("6h", "mean", "2015-01-01T00:00:00Z", "2015-02-01T00:00:00Z") is None
+    assert select_rollup("1d", "median", "2015-01-01T00:00:00Z", "2015-02-01T00:00:00Z") is None
+
+
+def test_rollup_mean_is_weighted_by_count():
+    query = "\n".join(build_rollup_aggregation("1y", "mean"))
+    assert 'r.stat == "count"' in query
+    assert "r.mean * r.count" in query
+    assert "aggregateWindow" not in query
+
+
+def test_rollup_count_sums_counts():
+    assert "fn: sum" in build_rollup_aggregation("1mo", "count")[-1]
+
+
+def test_rollups_are_off_by_default():
+    assert config.USE_ROLLUPS is False
+    manager = InfluxDBManager("http://localhost:1", "token", "org", "bucket")
+    try:
+        query = manager.build_query(start_time="2015-01-01T00:00:00Z", end_time="2016-01-01T00:00:00Z", every="1mo")
+    finally:
+        manager.close()
+    assert 'r._measurement == "air_quality"' in query
+    assert "aggregateWindow(every: 1mo, fn: mean" in query
@@ -0,0 +1,224 @@
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from backend.app.frames import FORMAT_COLUMNAR, FORMAT_RECORDS
+from backend.app.playback_cache import ColumnarCache
+from backend.app.stream_hub import _CLOSE, POLICY_DISCONNECT, POLICY_DROP_OLDEST, StreamHub
+
+STATIONS = ("1013", "1014")
+FIELDS = ("pm25", "pm10", "temperature")
+
+
+def make_ticks(count, seed=0):
+    """生成 count 个节拍的数据，每个节拍每个站点一条记录，部分字段保持不变或缺失"""
+    rng = np.random.default_rng(seed)
+    values = {station_id: {"pm25": 50.0, "pm10": 80.0, "temperature": 12.0} for station_id in STATIONS}
+    ticks = []
+    for tick in range(count):
+        timestamp = datetime.fromtimestamp(1398902400 + tick * 3600, tz=timezone.utc).isoformat()
+        windows = {}
+        for station_id in STATIONS:
+            record = {"timestamp": timestamp, "station_id": station_id, "city": "guangzhou"}
+            for field in FIELDS:
+                roll = rng.random()
+                if roll < 0.3:
+                    values[station_id][field] = float(rng.integers(0, 200))
+                elif roll < 0.4:
+                    values[station_id][field] = None
+                elif values[station_id][field] is None:
+                    values[station_id][field] = 1.5
+                record[field] = values[station_id][field]
+            windows[station_id] = ColumnarCache.from_records([record], fields=FIELDS)
+        ticks.append(windows)
+    return ticks
+
+
+def expected_records(windows):
+    """records 格式下本节拍的记录，作为客户端应当还原出的结果"""
+    records = []
+    for station_id in STATIONS:
+        records.extend(windows[station_id].to_records())
+    return sorted(records, key=lambda record: record["timestamp"])
+
+
+class ColumnarClient:
+    """与前端 decodeColumnarFrame 相同的列式帧解码"""
+
+    def __init__(self):
+        self.stations = []
+        self.values = {}
+        self.records = []
+
+    def receive(self, payload):
+        message = json.loads(payload)
+        if message.get("type") == "subscribed":
+            self.stations = message["stations"]
+            return
+        assert message["type"] == "columns"
+        count = message.get("n", 1)
+        seconds = message["t0"]
+        for i in range(count):
+            if i > 0:
+                seconds += message["dt"][i - 1] if isinstance(message["dt"], list) else message["dt"]
+            s = message.get("s", 0)
+            station_id = self.stations[s[i] if isinstance(s, list) else s]
+            values = {} if message.get("k") else dict(self.values[station_id])
+            for field, column in message["f"].items():
+                value = column[i] if isinstance(column, list) else column
+                if value is None:
+                    values.pop(field, None)
+                else:
+                    values[field] = value
+            self.values[station_id] = values
+            timestamp = datetime.fromtimestamp(seconds, tz=timezone.utc).isoformat()
+            self.records.append({"timestamp": timestamp, "station_id": station_id, "city": "guangzhou", **values})
+
+
+def drain(subscriber):
+    frames = []
+    while not subscriber.queue.empty():
+        frames.append(subscriber.queue.get_nowait())
+    return frames
+
+
+def subscribe_columnar(hub):
+    subscriber = hub.subscribe(object(), stations=STATIONS, frame_format=FORMAT_COLUMNAR)
+    hub.send_control(subscriber, {"type": "subscribed", "stations": list(subscriber.stations)})
+    return subscriber
+
+
+def test_slow_columnar_client_resynchronizes_after_drop():
+    hub = StreamHub(queue_size=4, slow_client_policy=POLICY_DROP_OLDEST)
+    fast = subscribe_columnar(hub)
+    slow = subscribe_columnar(hub)
+    fast_client, slow_client = ColumnarClient(), ColumnarClient()
+    expected = {}
+
+    ticks = make_ticks(40)
+    for number, windows in enumerate(ticks):
+        hub.publish(windows)
+        for record in expected_records(windows):
+            expected[(record["timestamp"], record["station_id"])] = record
+        for frame in drain(fast):
+            fast_client.receive(frame.payload)
+        # 慢客户端只偶尔读取，期间队列多次溢出
+        if number % 11 == 10:
+            for frame in drain(slow):
+                slow_client.receive(frame.payload)
+    for frame in drain(slow):
+        slow_client.receive(frame.payload)
+
+    assert slow.dropped > 0
+    assert len(fast_client.records) == len(ticks) * len(STATIONS)
+    for client in (fast_client, slow_client):
+        # 订阅确认没有被丢弃，每条还原出的记录都与服务端的记录一致
+        assert client.stations == list(STATIONS)
+        for record in client.records:
+            assert record == expected[(record["timestamp"], record["station_id"])]
+        final = expected_records(ticks[-1])
+        assert [client.values[record["station_id"]] for record in final] == [
+            {field: value for field, value in record.items() if field in FIELDS} for record in final
+        ]
+
+
+def test_drop_keeps_control_frames_and_next_frame_is_key():
+    hub = StreamHub(queue_size=3, slow_client_policy=POLICY_DROP_OLDEST)
+    subscriber = subscribe_columnar(hub)
+    ticks = make_ticks(6)
+    for windows in ticks:
+        hub.publish(windows)
+
+    frames = drain(subscriber)
+    assert frames[0].control
+    assert json.loads(frames[0].payload)["type"] == "subscribed"
+    data = [json.loads(frame.payload) for frame in frames[1:]]
+    assert data[0].get("k") == 1
+    assert subscriber.dropped == len(ticks) - len(data)
+
+
+def test_records_client_keeps_newest_frames():
+    hub = StreamHub(queue_size=2, slow_client_policy=POLICY_DROP_OLDEST)
+    subscriber = hub.subscribe(object(), stations=STATIONS, frame_format=FORMAT_RECORDS)
+    ticks = make_ticks(5)
+    for windows in ticks:
+        hub.publish(windows)
+
+    frames = [json.loads(frame.payload) for frame in drain(subscriber)]
+    assert frames[-1] == expected_records(ticks[-1])
+    assert hub.stats()["dropped_batches"] == len(ticks) - len(frames)
+
+
+def test_queue_full_of_control_frames_disconnects():
+    hub = StreamHub(queue_size=2, slow_client_policy=POLICY_DROP_OLDEST)
+    subscriber = hub.subscribe(object(), stations=STATIONS)
+    for _ in range(3):
+        hub.send_control(subscriber, {"type": "error", "message": "x"})
+
+    assert subscriber.closed
+    assert drain(subscriber) == [_CLOSE]
+    assert hub.stats()["disconnected_slow_clients"] == 1
+
+
+def test_disconnect_policy_closes_slow_client():
+    hub = StreamHub(queue_size=2, slow_client_policy=POLICY_DISCONNECT)
+    subscriber = hub.subscribe(object(), stations=STATIONS)
+    for windows in make_ticks(3):
+        hub.publish(windows)
+
+    assert subscriber.closed
+    assert subscriber not in hub.subscribers
+    assert drain(subscriber) == [_CLOSE]
+
+
+def test_unknown_policy_rejected():
+    with pytest.raises(ValueError):
+        StreamHub(slow_client_policy="block")
+
+
+def test_identical_subscriptions_share_one_encoded_frame():
+    hub = StreamHub()
+    first = hub.subscribe(object(), stations=["1014", "1013"])
+    second = hub.subscribe(object(), stations=["1013", "1014", "1013"])
+    pm25_only = hub.subscribe(object(), stations=["1013"], fields=["pm25"])
+    windows = make_ticks(1)[0]
+    hub.publish(windows)
+
+    shared = first.queue.get_nowait()
+    assert second.queue.get_nowait() is shared
+    assert json.loads(shared.payload) == expected_records(windows)
+    records = json.loads(pm25_only.queue.get_nowait().payload)
+    assert [record["station_id"] for record in records] == ["1013"]
+    assert set(records[0]) <= {"timestamp", "station_id", "city", "pm25"}
+
+
+def test_publish_reaches_only_the_given_session():
+    hub = StreamHub()
+    default = hub.subscribe(object(), stations=["1013"], session_id="default")
+    private = hub.subscribe(object(), stations=["1014"], session_id="private")
+    assert hub.subscribed_stations("private") == {"1014"}
+    assert hub.subscribed_stations() == {"1013", "1014"}
+
+    hub.publish(make_ticks(1)[0], session_id="private")
+    assert default.queue.empty()
+    assert json.loads(private.queue.get_nowait().payload)[0]["station_id"] == "1014"
+
+    hub.unsubscribe(private)
+    assert hub.session_subscribers("private") == set()
+    assert hub.stats()["sessions"] == 1
+
+
+def test_resubscribed_columnar_client_gets_key_frame():
+    hub = StreamHub()
+    subscriber = subscribe_columnar(hub)
+    ticks = make_ticks(3)
+    hub.publish(ticks[0])
+    hub.publish(ticks[1])
+    hub.update_subscription(subscriber, STATIONS, ["pm25"])
+    hub.publish(ticks[2])
+
+    frames = [json.loads(frame.payload) for frame in drain(subscriber)[1:]]
+    assert [frame.get("k") for frame in frames] == [1, None, 1]
+    assert set(frames[2]["f"]) <= {"pm25"}